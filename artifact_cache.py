@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import shutil
+import fcntl
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+from logging_service import logger
+
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "./artifact_cache")
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", 20 * 1024**3))
+INDEX_FILE_NAME = "index.json"
+LOCK_FILE_NAME = "index.lock"
+TMP_FILE_SUFFIX = ".tmp"
+# a temporary file this old was left by a process that died while writing it
+TMP_FILE_MAX_AGE_SEC = 24 * 3600
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_files(paths: list) -> str:
+    """sha256 over the contents of the files, read in blocks."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            while block := f.read(HASH_BLOCK_SIZE):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def get_artifact_key(stage: str, input_hash: str, params: dict) -> str:
+    """Key of a stage output: the hash of its input plus every parameter that changes it."""
+    payload = json.dumps(
+        {"stage": stage, "input": input_hash, "params": params}, sort_keys=True
+    )
+    return f"{stage}_{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class ArtifactCache:
+    """Content-addressed cache of pipeline stage outputs, shared by every process using the same directory.
+
+    An artifact is a file or a directory stored under its key, written to a
+    temporary path in the cache directory and renamed into place. Writers hold
+    an exclusive lock on the directory and merge the index on disk before
+    saving it. A hit only bumps the artifact mtime, eviction is LRU by mtime
+    once the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        self.__cache_dir = cache_dir
+        self.__max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        # (mtime_ns, size) of the index file last loaded
+        self.__index_version = None
+        # (path, size, mtime) -> sha256, so a video is hashed once per process
+        self.__file_hashes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def hash_file(self, path: str) -> str:
+        stat = os.stat(path)
+        file_id = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if file_id not in self.__file_hashes:
+            start_time = time.time()
+            self.__file_hashes[file_id] = hash_files([path])
+            logger.debug(f"hashed {path} in {time.time() - start_time:.1f} sec")
+        return self.__file_hashes[file_id]
+
+    def get_path(self, key: str) -> str:
+        """Path of the cached artifact or None."""
+        with self.__lock:
+            with self.__file_lock(fcntl.LOCK_SH):
+                self.__load_index()
+            path = self.__get_artifact_path(key)
+            if key not in self.__entries or not os.path.exists(path):
+                self.misses += 1
+                logger.debug(f"artifact cache miss: {key}")
+                return None
+            self.hits += 1
+            # the mtime is the last use, the index is not rewritten on reads
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            logger.debug(f"artifact cache hit: {key}")
+            return path
+
+    def put_path(self, key: str, source_path: str) -> str:
+        """Copies a file or a directory into the cache, returns the cached path."""
+        if os.path.isdir(source_path):
+            return self.__put_with(key, lambda path: shutil.copytree(source_path, path))
+        return self.__put_with(key, lambda path: shutil.copyfile(source_path, path))
+
+    def get_json(self, key: str):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def put_json(self, key: str, value) -> None:
+        def write(path: str) -> None:
+            with open(path, "w") as f:
+                # numpy scalars are written as plain numbers
+                json.dump(value, f, default=lambda o: o.item())
+
+        self.__put_with(key, write)
+
+    def get_array(self, key: str):
+        """The cached array memory-mapped read-only, pages are read from disk as they are used."""
+        path = self.get_path(key)
+        return None if path is None else np.load(path, mmap_mode="r")
+
+    def put_array(self, key: str, value: np.ndarray) -> None:
+        def write(path: str) -> None:
+            # a file object, np.save would append .npy to the temporary path
+            with open(path, "wb") as f:
+                np.save(f, value)
+
+        self.__put_with(key, write)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __put_with(self, key: str, write) -> str:
+        """`write(path)` creates the artifact at a temporary path in the cache directory, it is renamed into place."""
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        path = self.__get_artifact_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}{TMP_FILE_SUFFIX}"
+        try:
+            # written outside the locks, a large artifact does not hold back other processes
+            write(tmp_path)
+            with self.__lock:
+                with self.__file_lock(fcntl.LOCK_EX):
+                    # entries written by other processes since the last load are kept
+                    self.__load_index()
+                    self.__remove(path)
+                    os.replace(tmp_path, path)
+                    self.__entries[key] = {"bytes": get_size(path)}
+                    self.__evict()
+                    self.__save_index()
+        finally:
+            self.__remove(tmp_path)
+        return path
+
+    def __evict(self) -> None:
+        # artifacts on disk, including orphans no index entry points to,
+        # e.g. left by a process that died before saving the index
+        now = time.time()
+        artifacts = {}
+        for entry in os.scandir(self.__cache_dir):
+            if entry.name in (INDEX_FILE_NAME, LOCK_FILE_NAME):
+                continue
+            mtime = entry.stat().st_mtime
+            if entry.name.endswith(TMP_FILE_SUFFIX):
+                # another process may still be writing it
+                if now - mtime > TMP_FILE_MAX_AGE_SEC:
+                    self.__remove(entry.path)
+                continue
+            artifacts[entry.name] = mtime
+
+        orphans = [key for key in artifacts if key not in self.__entries]
+        for key in orphans:
+            self.__remove(self.__get_artifact_path(key))
+        evicted = [key for key in self.__entries if key not in artifacts]
+        total_bytes = sum(entry["bytes"] for key, entry in self.__entries.items() if key in artifacts)
+
+        for key in sorted(artifacts, key=artifacts.get):
+            if total_bytes <= self.__max_bytes:
+                break
+            if key not in self.__entries:
+                continue
+            total_bytes -= self.__entries[key]["bytes"]
+            evicted.append(key)
+            self.__remove(self.__get_artifact_path(key))
+
+        if len(evicted) == 0 and len(orphans) == 0:
+            return
+        for key in evicted:
+            del self.__entries[key]
+        logger.debug(f"artifact cache: evicted {len(evicted)} artifacts, {len(orphans)} orphans")
+
+    @contextmanager
+    def __file_lock(self, operation: int):
+        """Cross-process lock on the cache directory, shared for reads, exclusive for writes."""
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        with open(os.path.join(self.__cache_dir, LOCK_FILE_NAME), "a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __load_index(self) -> None:
+        """(Re)reads the index if another process saved it since the last load, needs the file lock."""
+        index_path = os.path.join(self.__cache_dir, INDEX_FILE_NAME)
+        try:
+            stat = os.stat(index_path)
+        except FileNotFoundError:
+            self.__entries = {}
+            self.__index_version = None
+            return
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version == self.__index_version:
+            return
+        try:
+            with open(index_path) as f:
+                self.__entries = json.load(f)["entries"]
+        except Exception as e:
+            logger.warning(f"artifact cache index is corrupted, starting empty: {e}")
+            self.__entries = {}
+        self.__index_version = version
+
+    def __save_index(self) -> None:
+        index_path = os.path.join(self.__cache_dir, INDEX_FILE_NAME)
+        tmp_path = index_path + TMP_FILE_SUFFIX
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": self.__entries}, f)
+        os.replace(tmp_path, index_path)
+        stat = os.stat(index_path)
+        self.__index_version = (stat.st_mtime_ns, stat.st_size)
+
+    def __get_artifact_path(self, key: str) -> str:
+        return os.path.join(self.__cache_dir, key)
+
+    def __remove(self, path: str) -> None:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def get_size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+artifact_cache = ArtifactCache(ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_BYTES)
@@ -0,0 +1,22 @@
+import subprocess
+import numpy as np
+from logging_service import logger
+
+# whisper works on 16 kHz mono float32 PCM
+SAMPLE_RATE = 16000
+
+
+def extract_pcm_audio(video_path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decodes the audio track straight into a float32 mono array, no intermediate file."""
+    cmd = [
+        'ffmpeg', '-nostdin', '-v', 'error',
+        '-i', video_path,
+        '-vn', '-ac', '1', '-ar', str(sample_rate),
+        '-f', 'f32le', '-acodec', 'pcm_f32le', '-',
+    ]
+    try:
+        result = subprocess.run(cmd, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        logger.error(f'FFMPEG ERROR:\nCommand: {e.cmd}\nError: {e.stderr.decode(errors="replace")}')
+        raise
+    return np.frombuffer(result.stdout, dtype=np.float32)
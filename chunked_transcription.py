@@ -0,0 +1,128 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from audio_processing import SAMPLE_RATE
+from model_registry import model_registry, WHISPER_MODEL
+from logging_service import logger
+
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", 1))
+TARGET_CHUNK_SEC = 600
+# a split point is looked for this far around every target boundary
+SPLIT_SEARCH_WINDOW_SEC = 30
+ENERGY_FRAME_SEC = 0.03
+# whisper mel frames per second, segment "seek" is counted in them
+MEL_FRAMES_PER_SEC = 100
+
+
+def find_split_points(
+    audio: np.ndarray,
+    target_chunk_sec: float = TARGET_CHUNK_SEC,
+    search_window_sec: float = SPLIT_SEARCH_WINDOW_SEC,
+    sample_rate: int = SAMPLE_RATE,
+) -> list:
+    """Sample indexes to split the audio at, the quietest frame near every target boundary."""
+    frame_size = int(ENERGY_FRAME_SEC * sample_rate)
+    frames_count = len(audio) // frame_size
+    if frames_count == 0:
+        return []
+
+    frames = np.asarray(audio[: frames_count * frame_size], dtype=np.float32)
+    energy = np.sqrt(np.mean(frames.reshape(frames_count, frame_size) ** 2, axis=1))
+
+    target_frames = int(target_chunk_sec * sample_rate / frame_size)
+    window_frames = int(search_window_sec * sample_rate / frame_size)
+    res = []
+    boundary = target_frames
+    while boundary + window_frames < frames_count:
+        first = max(boundary - window_frames, 1)
+        last = boundary + window_frames
+        split_frame = first + int(np.argmin(energy[first:last]))
+        # split in the middle of the quiet frame
+        res.append(split_frame * frame_size + frame_size // 2)
+        boundary = split_frame + target_frames
+    return res
+
+
+def stitch_transcriptions(transcriptions: list, offsets_sec: list, durations_sec: list) -> dict:
+    """Joins chunk transcriptions into one in the whisper JSON shape.
+
+    Timestamps are shifted by the chunk offsets, clamped into the chunk and
+    kept monotonic, so nothing overlaps at the chunk edges.
+    """
+    res = {"text": "", "segments": [], "language": None}
+    prev_end = 0.0
+    for transcription, offset, duration in zip(transcriptions, offsets_sec, durations_sec):
+        res["text"] += transcription.get("text", "")
+        if res["language"] is None:
+            res["language"] = transcription.get("language")
+        chunk_end = offset + duration
+
+        def shift(value: float) -> float:
+            return min(max(value + offset, offset, prev_end), chunk_end)
+
+        for segment in transcription.get("segments", []):
+            segment = dict(segment)
+            segment["id"] = len(res["segments"])
+            if "seek" in segment:
+                segment["seek"] += int(offset * MEL_FRAMES_PER_SEC)
+
+            words = []
+            for word in segment.get("words", []):
+                word = dict(word)
+                word["start"] = shift(word["start"])
+                word["end"] = max(shift(word["end"]), word["start"])
+                prev_end = word["end"]
+                words.append(word)
+            segment["words"] = words
+
+            segment["start"] = words[0]["start"] if words else shift(segment["start"])
+            segment["end"] = words[-1]["end"] if words else max(shift(segment["end"]), segment["start"])
+            prev_end = max(prev_end, segment["end"])
+            res["segments"].append(segment)
+    return res
+
+
+def transcribe_chunked(
+    audio: np.ndarray,
+    workers: int = TRANSCRIPTION_WORKERS,
+    target_chunk_sec: float = TARGET_CHUNK_SEC,
+    **transcribe_kwargs,
+) -> dict:
+    """Transcribes the audio in chunks split at quiet points, one whisper per worker process."""
+    split_points = find_split_points(audio, target_chunk_sec)
+    bounds = [0] + split_points + [len(audio)]
+    chunks = [audio[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    offsets_sec = [start / SAMPLE_RATE for start in bounds[:-1]]
+    durations_sec = [len(chunk) / SAMPLE_RATE for chunk in chunks]
+    logger.info(f"transcribing {len(chunks)} chunks with {workers} workers")
+
+    if workers <= 1 or len(chunks) == 1:
+        transcriptions = [transcribe_chunk(chunk, transcribe_kwargs) for chunk in chunks]
+    else:
+        # spawn: forking a process with torch loaded can deadlock
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(chunks)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(threads,),
+        ) as executor:
+            transcriptions = list(
+                executor.map(transcribe_chunk, chunks, [transcribe_kwargs] * len(chunks))
+            )
+
+    return stitch_transcriptions(transcriptions, offsets_sec, durations_sec)
+
+
+def init_worker(threads: int) -> None:
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def transcribe_chunk(chunk: np.ndarray, transcribe_kwargs: dict) -> dict:
+    return model_registry.get(WHISPER_MODEL).transcribe(chunk, **transcribe_kwargs)
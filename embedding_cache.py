@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import fcntl
+import threading
+from contextlib import contextmanager
+import numpy as np
+from logging_service import logger
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./embedding_cache")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 2 * 1024**3))
+SHARD_MAX_ROWS = 4096
+# smaller puts are kept in memory and written as one shard once this many rows
+# are pending, or when the oldest pending row is PENDING_MAX_SEC old
+SHARD_MIN_ROWS = 256
+PENDING_MAX_SEC = 30
+# the directory is scanned for eviction once this share of max_bytes was written,
+# so the cache can grow that much above the limit in between
+EVICT_FRACTION = 0.05
+INDEX_FILE_NAME = "index.json"
+LOCK_FILE_NAME = "index.lock"
+SHARD_FILE_PREFIX = "shard_"
+SHARD_FILE_SUFFIX = ".npy"
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def get_cache_key(model_name: str, text: str) -> str:
+    text_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model_name}:{text_hash}"
+
+
+class EmbeddingCache:
+    """Disk-backed embedding cache, shared by every process using the same directory.
+
+    Vectors are stored as float16 .npy shards which are memory-mapped on read.
+    Small puts are buffered and flushed together as a new shard, so no shard
+    is rewritten after creation. Pending vectors are visible to this process
+    only, they are flushed at exit too. Writers hold an exclusive lock on the
+    directory and merge the index on disk before saving it. A read hit only
+    bumps the shard mtime, eviction is LRU by shard mtime once the total size
+    exceeds `max_bytes`. It scans the directory, so it runs on the first flush
+    and then every EVICT_FRACTION of `max_bytes` written.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        self.__cache_dir = cache_dir
+        self.__max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__index = {}
+        self.__shards = {}
+        # (mtime_ns, size) of the index file last loaded
+        self.__index_version = None
+        self.__mmaps = {}
+        # cache key -> float16 vector, not written yet
+        self.__pending = {}
+        self.__pending_since = None
+        # the first flush evicts, the directory may be left over from earlier processes
+        self.__bytes_since_evict = max_bytes * EVICT_FRACTION
+        self.hits = 0
+        self.misses = 0
+        atexit.register(self.flush)
+
+    def get(self, model_name: str, texts: list) -> list:
+        """Returns a list aligned with `texts`, None for every cache miss."""
+        with self.__lock:
+            with self.__file_lock(fcntl.LOCK_SH):
+                self.__load_index()
+            res = []
+            used_shards = set()
+            for text in texts:
+                key = get_cache_key(model_name, text)
+                if key in self.__pending:
+                    self.hits += 1
+                    res.append(self.__pending[key].astype(np.float32))
+                    continue
+                location = self.__index.get(key)
+                vector = self.__read_vector(location) if location else None
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    used_shards.add(location[0])
+                res.append(vector)
+            for shard_id in used_shards:
+                self.__touch_shard(shard_id)
+            return res
+
+    def put(self, model_name: str, texts: list, vectors: np.ndarray) -> None:
+        if len(texts) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float16)
+        with self.__lock:
+            for text, vector in zip(texts, vectors):
+                self.__pending[get_cache_key(model_name, text)] = vector
+            if self.__pending_since is None:
+                self.__pending_since = time.monotonic()
+            if (
+                len(self.__pending) < SHARD_MIN_ROWS
+                and time.monotonic() - self.__pending_since < PENDING_MAX_SEC
+            ):
+                return
+            self.__flush()
+
+    def flush(self) -> None:
+        """Writes the pending vectors, so other processes can read them."""
+        with self.__lock:
+            self.__flush()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __flush(self) -> None:
+        if len(self.__pending) == 0:
+            return
+        keys = list(self.__pending)
+        vectors = np.stack(list(self.__pending.values()))
+        with self.__file_lock(fcntl.LOCK_EX):
+            # entries written by other processes since the last load are kept
+            self.__load_index()
+            for start in range(0, len(keys), SHARD_MAX_ROWS):
+                self.__bytes_since_evict += self.__write_shard(
+                    keys[start : start + SHARD_MAX_ROWS],
+                    vectors[start : start + SHARD_MAX_ROWS],
+                )
+            if self.__bytes_since_evict >= self.__max_bytes * EVICT_FRACTION:
+                self.__bytes_since_evict = 0
+                self.__evict()
+            self.__save_index()
+        self.__pending = {}
+        self.__pending_since = None
+
+    def __write_shard(self, keys: list, vectors: np.ndarray) -> int:
+        shard_id = f"{time.time_ns()}_{os.getpid()}"
+        shard_path = self.__get_shard_path(shard_id)
+        tmp_path = shard_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, vectors)
+        os.replace(tmp_path, shard_path)
+
+        shard_bytes = os.path.getsize(shard_path)
+        self.__shards[shard_id] = {"bytes": shard_bytes}
+        for row, key in enumerate(keys):
+            self.__index[key] = [shard_id, row]
+        return shard_bytes
+
+    def __read_vector(self, location: list):
+        shard_id, row = location
+        if shard_id not in self.__mmaps:
+            try:
+                self.__mmaps[shard_id] = np.load(
+                    self.__get_shard_path(shard_id), mmap_mode="r"
+                )
+            except Exception as e:
+                logger.warning(f"embedding cache shard {shard_id} is unreadable: {e}")
+                return None
+        return np.asarray(self.__mmaps[shard_id][row], dtype=np.float32)
+
+    def __touch_shard(self, shard_id: str) -> None:
+        # the shard mtime is its last use, the index is not rewritten on reads
+        try:
+            os.utime(self.__get_shard_path(shard_id))
+        except FileNotFoundError:
+            pass
+
+    def __evict(self) -> None:
+        # shard files on disk, including orphans no index entry points to,
+        # e.g. left by a process that died before saving the index
+        shard_files = {}
+        for entry in os.scandir(self.__cache_dir):
+            if entry.name.startswith(SHARD_FILE_PREFIX) and entry.name.endswith(SHARD_FILE_SUFFIX):
+                shard_id = entry.name[len(SHARD_FILE_PREFIX) : -len(SHARD_FILE_SUFFIX)]
+                stat = entry.stat()
+                shard_files[shard_id] = (stat.st_mtime, stat.st_size)
+
+        evicted = {shard_id for shard_id in self.__shards if shard_id not in shard_files}
+        orphans = [shard_id for shard_id in shard_files if shard_id not in self.__shards]
+        total_bytes = sum(size for _, size in shard_files.values())
+        for shard_id in orphans:
+            total_bytes -= shard_files[shard_id][1]
+            self.__remove_shard(shard_id)
+
+        for shard_id in sorted(self.__shards, key=lambda shard_id: shard_files.get(shard_id, (0, 0))):
+            if total_bytes <= self.__max_bytes:
+                break
+            if shard_id in evicted:
+                continue
+            total_bytes -= shard_files[shard_id][1]
+            evicted.add(shard_id)
+            self.__remove_shard(shard_id)
+
+        if len(evicted) == 0 and len(orphans) == 0:
+            return
+        for shard_id in evicted:
+            del self.__shards[shard_id]
+        self.__index = {
+            key: location
+            for key, location in self.__index.items()
+            if location[0] not in evicted
+        }
+        logger.debug(f"embedding cache: evicted {len(evicted)} shards, {len(orphans)} orphans")
+
+    def __remove_shard(self, shard_id: str) -> None:
+        self.__mmaps.pop(shard_id, None)
+        try:
+            os.remove(self.__get_shard_path(shard_id))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def __file_lock(self, operation: int):
+        """Cross-process lock on the cache directory, shared for reads, exclusive for writes."""
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        with open(os.path.join(self.__cache_dir, LOCK_FILE_NAME), "a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __load_index(self) -> None:
+        """(Re)reads the index if another process saved it since the last load, needs the file lock."""
+        index_path = os.path.join(self.__cache_dir, INDEX_FILE_NAME)
+        try:
+            stat = os.stat(index_path)
+        except FileNotFoundError:
+            self.__index = {}
+            self.__shards = {}
+            self.__index_version = None
+            return
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version == self.__index_version:
+            return
+        try:
+            with open(index_path) as f:
+                data = json.load(f)
+            self.__index = data["entries"]
+            self.__shards = data["shards"]
+        except Exception as e:
+            logger.warning(f"embedding cache index is corrupted, starting empty: {e}")
+            self.__index = {}
+            self.__shards = {}
+        self.__index_version = version
+
+    def __save_index(self) -> None:
+        index_path = os.path.join(self.__cache_dir, INDEX_FILE_NAME)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            # dumps() runs the C encoder, dump() encodes the index chunk by chunk in Python
+            f.write(json.dumps({"entries": self.__index, "shards": self.__shards}))
+        os.replace(tmp_path, index_path)
+        stat = os.stat(index_path)
+        self.__index_version = (stat.st_mtime_ns, stat.st_size)
+
+    def __get_shard_path(self, shard_id: str) -> str:
+        return os.path.join(self.__cache_dir, f"{SHARD_FILE_PREFIX}{shard_id}{SHARD_FILE_SUFFIX}")
+
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_BYTES)
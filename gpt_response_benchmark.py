@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from speech_segment import SpeechSegment
+
+# python gpt_response_benchmark.py [segments_count] [off_topic_fraction]
+# full vs compact off-topic response schema against a local fake OpenAI server
+SEGMENTS_COUNT = 400
+OFF_TOPIC_FRACTION = 0.2
+# off-topic asides come in runs of consecutive sentences
+OFF_TOPIC_RUN_LENGTH = 4
+# fake generation speed, output tokens are what makes a completion slow
+SECONDS_PER_OUTPUT_TOKEN = 0.002
+CHARS_PER_TOKEN = 4
+SEED = 42
+
+
+def generate_speech_segments(segments_count: int) -> list:
+    rng = random.Random(SEED)
+    words = "the of a to in is that we this it for on with as are be at by an".split()
+    res = []
+    for i in range(segments_count):
+        segment = SpeechSegment()
+        segment.start_time_sec = i * 5.0
+        segment.end_time_sec = i * 5.0 + 4.5
+        segment.text = " ".join(rng.choice(words) for _ in range(rng.randint(8, 25)))
+        res.append(segment)
+    return res
+
+
+def record_off_topic(segments_count: int, off_topic_fraction: float) -> list:
+    # the recorded answer: sorted off-topic sentence numbers in runs
+    rng = random.Random(SEED)
+    runs_count = int(segments_count * off_topic_fraction / OFF_TOPIC_RUN_LENGTH)
+    starts = rng.sample(range(0, segments_count, OFF_TOPIC_RUN_LENGTH), runs_count)
+    return sorted(n for start in starts for n in range(start, min(start + OFF_TOPIC_RUN_LENGTH, segments_count)))
+
+
+def build_response_content(prompt: str, off_topic: set) -> str:
+    lines = [line for line in prompt.split("\n\n")[-1].splitlines() if ": " in line]
+    numbers = [n for n in range(len(lines)) if n in off_topic]
+    if '"off_topic"' in prompt:
+        ranges = []
+        for n in numbers:
+            if ranges and ranges[-1][1] == n - 1:
+                ranges[-1][1] = n
+            else:
+                ranges.append([n, n])
+        items = [first if first == last else [first, last] for first, last in ranges]
+        return json.dumps({"chapter": "Algebra", "off_topic": items})
+    return json.dumps({
+        "chapter": "Algebra",
+        "off_topic_sentences": [
+            {
+                "sentence_number": n,
+                "text": lines[n].split(": ", 1)[1],
+                "probability": 0.9,
+            }
+            for n in numbers
+        ],
+    })
+
+
+def start_fake_server(off_topic: set, stats: dict) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            content = build_response_content(body["messages"][0]["content"], off_topic)
+            output_tokens = len(content) // CHARS_PER_TOKEN + 1
+            time.sleep(output_tokens * SECONDS_PER_OUTPUT_TOKEN)
+            stats["response_bytes"] += len(content)
+            stats["output_tokens"] += output_tokens
+
+            data = json.dumps({
+                "id": "benchmark",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }],
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark(segments_count: int, off_topic_fraction: float) -> dict:
+    off_topic = record_off_topic(segments_count, off_topic_fraction)
+    stats = {"response_bytes": 0, "output_tokens": 0}
+    server = start_fake_server(set(off_topic), stats)
+    cache_dir = tempfile.mkdtemp()
+    os.environ["OPEN_AI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault("OPEN_AI_API_KEY", "benchmark")
+    os.environ.setdefault("OPEN_AI_MODEL", "benchmark")
+    os.environ["LLM_CACHE_DIR"] = cache_dir
+    # every window in one request, so only the response format differs
+    os.environ["GPT_WINDOW_TOKENS"] = str(10**9)
+    import gpt_speech_segments_classificator
+
+    res = {}
+    for compact in (False, True):
+        gpt_speech_segments_classificator.GPT_COMPACT_RESPONSES = compact
+        speech_segments = generate_speech_segments(segments_count)
+        stats["response_bytes"] = stats["output_tokens"] = 0
+        classificator = gpt_speech_segments_classificator.GPTSpeechSegmentsClassificator()
+        start_time = time.time()
+        classificator.classify(speech_segments, "10", "Math")
+        seconds = time.time() - start_time
+
+        found = [i for i, segment in enumerate(speech_segments) if segment.relevance_score_gpt == 0]
+        if found != off_topic:
+            raise Exception(f"{'compact' if compact else 'full'} response parsed wrong")
+        res["compact" if compact else "full"] = dict(stats, seconds=seconds)
+
+    server.shutdown()
+    return res
+
+
+if __name__ == "__main__":
+    segments_count = int(sys.argv[1]) if len(sys.argv) > 1 else SEGMENTS_COUNT
+    off_topic_fraction = float(sys.argv[2]) if len(sys.argv) > 2 else OFF_TOPIC_FRACTION
+
+    results = benchmark(segments_count, off_topic_fraction)
+    for name, result in results.items():
+        print(
+            f"{name}: {result['response_bytes']} bytes, ~{result['output_tokens']} output tokens, "
+            f"{result['seconds']:.2f} sec"
+        )
+    print(
+        f"compact response: {results['compact']['response_bytes'] / results['full']['response_bytes']:.1%} "
+        f"of the size, {results['full']['seconds'] / results['compact']['seconds']:.1f}x faster"
+    )
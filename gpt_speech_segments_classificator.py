@@ -1,29 +1,119 @@
 import json
 import os
-from openai import OpenAI
+import asyncio
+from collections import namedtuple
+from openai_client_pool import open_ai_client_pool
+from llm_response_cache import llm_response_cache, get_prompt_version, get_response_key
 from logging_service import logger
 from dotenv import load_dotenv
 from datetime import datetime
 
-load_dotenv()  
+load_dotenv()
 
-OPEN_AI_API_KEY = os.getenv("OPEN_AI_API_KEY")
 OPEN_AI_MODEL = os.getenv("OPEN_AI_MODEL")
 
 OFF_TOPIC_PROMPT_FILE_PATH = "./llm_prompts/gpt_prompt_template.txt"
 CBSE_PROMPT_FILE_PATH = "./llm_prompts/gpt_cbse_prompt_template.txt"
+COMBINED_PROMPT_FILE_PATH = "./llm_prompts/gpt_combined_prompt_template.txt"
+COMPACT_OFF_TOPIC_PROMPT_FILE_PATH = "./llm_prompts/gpt_compact_prompt_template.txt"
+COMPACT_COMBINED_PROMPT_FILE_PATH = "./llm_prompts/gpt_combined_compact_prompt_template.txt"
+PROMPT_FILE_PATHS = [
+    OFF_TOPIC_PROMPT_FILE_PATH,
+    CBSE_PROMPT_FILE_PATH,
+    COMBINED_PROMPT_FILE_PATH,
+    COMPACT_OFF_TOPIC_PROMPT_FILE_PATH,
+    COMPACT_COMBINED_PROMPT_FILE_PATH,
+]
 OUTPUT_DIR = "./classification_results"
+GPT_TEMPERATURE = 0
+# off-topic sentences come back as numbers and [start, end] ranges, without their text
+GPT_COMPACT_RESPONSES = True
+
+# transcript tokens per request, the transcript is split into windows above it
+GPT_WINDOW_TOKENS = int(os.getenv("GPT_WINDOW_TOKENS", 6000))
+# segments repeated on both sides of a window as context, their answers are ignored
+GPT_WINDOW_OVERLAP_SEGMENTS = 2
+GPT_MAX_CONCURRENCY = int(os.getenv("GPT_MAX_CONCURRENCY", 4))
+# rough token estimate for English text, no tokenizer dependency
+CHARS_PER_TOKEN = 4
+# tokens reserved in the rate limiter for a response
+GPT_RESPONSE_TOKENS_ESTIMATE = 1000
+
+# segments [start, end) are sent, only [core_start, core_end) are classified
+PromptWindow = namedtuple("PromptWindow", ["start", "core_start", "core_end", "end"])
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_into_windows(texts: list, token_budget: int, overlap: int) -> list:
+    """Greedy windows of consecutive texts under the token budget, with `overlap` context texts on each side."""
+    cores = []
+    core_start = 0
+    core_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if i > core_start and core_tokens + tokens > token_budget:
+            cores.append((core_start, i))
+            core_start = i
+            core_tokens = 0
+        core_tokens += tokens
+    if core_start < len(texts):
+        cores.append((core_start, len(texts)))
+
+    return [
+        PromptWindow(
+            start=max(core_start - overlap, 0),
+            core_start=core_start,
+            core_end=core_end,
+            end=min(core_end + overlap, len(texts)),
+        )
+        for core_start, core_end in cores
+    ]
+
+
+def expand_index_ranges(items: list, size: int) -> list:
+    """(index, probability) pairs from a compact list of `n`, `[start, end]` or `[start, end, probability]`."""
+    res = []
+    for item in items:
+        if isinstance(item, int) and not isinstance(item, bool):
+            start, end, probability = item, item, 1.0
+        elif isinstance(item, list) and len(item) in (2, 3):
+            start, end = item[0], item[1]
+            probability = item[2] if len(item) == 3 else 1.0
+        else:
+            raise Exception(f"Malformed off-topic item: {item}")
+        if not all(
+            isinstance(n, int) and not isinstance(n, bool) and 0 <= n < size for n in (start, end)
+        ) or start > end:
+            raise Exception(f"Off-topic range {start}-{end} not found in the transcript")
+        if not isinstance(probability, (int, float)):
+            raise Exception(f"Malformed off-topic probability: {item}")
+        res += [(n, float(probability)) for n in range(start, end + 1)]
+    return res
+
 
 class GPTSpeechSegmentsClassificator:
     def __init__(self) -> None:
-        self.__open_ai_client = OpenAI(api_key=OPEN_AI_API_KEY)
         self.__open_ai_model = OPEN_AI_MODEL
-        self.__gpt_prompt_template_path = OFF_TOPIC_PROMPT_FILE_PATH
+        self.__gpt_prompt_template_path = (
+            COMPACT_OFF_TOPIC_PROMPT_FILE_PATH if GPT_COMPACT_RESPONSES else OFF_TOPIC_PROMPT_FILE_PATH
+        )
         self.__gpt_cbse_prompt_template_path = CBSE_PROMPT_FILE_PATH
-        
+        self.__gpt_combined_prompt_template_path = (
+            COMPACT_COMBINED_PROMPT_FILE_PATH if GPT_COMPACT_RESPONSES else COMBINED_PROMPT_FILE_PATH
+        )
+        self.__failed_windows = 0
+
         # Create output directory if it doesn't exist
         os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+    @property
+    def degraded(self) -> bool:
+        # some window failed since this classificator was created, its segments kept the defaults
+        return self.__failed_windows > 0
+
     def _generate_output_filename(self, prefix: str, class_number: str, subject_name: str) -> str:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         sanitized_subject = subject_name.replace(" ", "_")
@@ -42,12 +132,6 @@ class GPTSpeechSegmentsClassificator:
         self, speech_segments: list, class_number: str, subject_name: str
     ):
         logger.info("Generating GPT prompt...")
-        prompt = self._load_prompt(self.__gpt_prompt_template_path)
-        prompt = prompt.replace("{@class_number}", class_number)
-        prompt = prompt.replace("{@subject_name}", subject_name)
-        sentences = ""
-        map = {}
-        
         # Prepare segments dictionary for file output
         segments_output = {
             "class_number": class_number,
@@ -55,34 +139,20 @@ class GPTSpeechSegmentsClassificator:
             "analysis_timestamp": datetime.now().isoformat(),
             "segments": []
         }
-        
-        for i, segment in enumerate(speech_segments):
+
+        for segment in speech_segments:
             segment.relevance_score_gpt = 1
-            map[i] = segment
-            sentences += f"{i}: {segment.text}\n"
-
-        prompt += f"\n\n{sentences}"
-        logger.info("Sending request to GPT...")
-        gpt_results = self.__gpt_run_prompt(prompt)
-        logger.info("GPT response received")
-
-        # Process results and update segments
-        for off_topic_sentence in gpt_results["off_topic_sentences"]:
-            s_num = off_topic_sentence["sentence_number"]
-            s_text = off_topic_sentence["text"]
-            probability = off_topic_sentence.get("probability", 1.0)  # Default to 1.0 if not provided
-
-            if s_num not in map:
-                logger.error(f"Off-topic sentence {s_num} not found in the transcript")
-                raise Exception(f"GPT provided irrelevant response")
-
-            if map[s_num].text.strip() != s_text.strip():
-                logger.warning(
-                    f"Off-topic sentence {s_num} is not the same as in the transcript"
-                )
 
-            map[s_num].relevance_score_gpt = 0
-            map[s_num].off_topic_probability = probability
+        # the segments of a failed window stay relevant
+        errors = self.__classify_windows(
+            self.__gpt_prompt_template_path,
+            speech_segments,
+            class_number,
+            subject_name,
+            self.__apply_off_topic_results,
+        )
+        if errors and all(errors):
+            raise Exception(f"GPT provided irrelevant response")
 
         # Prepare detailed output for file
         for i, segment in enumerate(speech_segments):
@@ -90,21 +160,53 @@ class GPTSpeechSegmentsClassificator:
                 "segment_number": i,
                 "text": segment.text,
                 "is_off_topic": segment.relevance_score_gpt == 0,
-                "off_topic_probability": getattr(segment, 'off_topic_probability', 0.0)
+                "off_topic_probability": segment.off_topic_probability or 0.0
             })
 
         # Write results to file
         output_filename = self._generate_output_filename("offtopic", class_number, subject_name)
         self._write_results_to_file(segments_output, output_filename)
 
+    def classify_combined(
+        self, speech_segments: list, class_number: str, subject_name: str
+    ):
+        """Off-topic sentences and CBSE chapter ranges in one response per window."""
+        logger.info("Generating combined GPT prompt...")
+        combined_output = {
+            "class_number": class_number,
+            "subject_name": subject_name,
+            "analysis_timestamp": datetime.now().isoformat(),
+            "segments": []
+        }
+
+        for segment in speech_segments:
+            segment.relevance_score_gpt = 1
+
+        errors = self.__classify_windows(
+            self.__gpt_combined_prompt_template_path,
+            speech_segments,
+            class_number,
+            subject_name,
+            self.__apply_combined_results,
+        )
+        if errors and all(errors):
+            raise Exception(f"GPT provided irrelevant response")
+
+        for i, segment in enumerate(speech_segments):
+            combined_output["segments"].append({
+                "segment_number": i,
+                "text": segment.text,
+                "is_off_topic": segment.relevance_score_gpt == 0,
+                "off_topic_probability": segment.off_topic_probability or 0.0,
+                "syllabus_classification": segment.syllabus_classification,
+                "relevance_probability": segment.relevance_probability
+            })
+
+        output_filename = self._generate_output_filename("combined", class_number, subject_name)
+        self._write_results_to_file(combined_output, output_filename)
+
     def classify_per_CBSE(self, speech_segments: list, class_number: str, subject_name: str):
         logger.info("Generating CBSE GPT prompt...")
-        prompt = self._load_prompt(self.__gpt_cbse_prompt_template_path)
-        prompt = prompt.replace("{@class_number}", class_number)
-        prompt = prompt.replace("{@subject_name}", subject_name)
-        groups = ""
-        map = {}
-        
         # Prepare CBSE output dictionary
         cbse_output = {
             "class_number": class_number,
@@ -113,33 +215,18 @@ class GPTSpeechSegmentsClassificator:
             "groups": []
         }
 
-        for i, segment in enumerate(speech_segments):
-            map[i] = segment
-            groups += f"{i}: {segment.text}\n"
-
-        prompt += f"\n\n{groups}"
-        logger.info("Sending request to GPT...")
-        gpt_results = self.__gpt_run_prompt(prompt)
-        logger.info("GPT response received")
-
         try:
-            for group in gpt_results["groups"]:
-                g_num = group["group_number"]
-                if g_num not in map:
-                    raise Exception(f"Group {g_num} not found in the transcript")
-
-                map[g_num].syllabus_classification = f"{group['book']} - {group['chapter']}"
-                probability = group.get("probability", 1.0)  # Default to 1.0 if not provided
-                map[g_num].relevance_probability = probability
-
-                # Add to CBSE output
-                cbse_output["groups"].append({
-                    "group_number": g_num,
-                    "text": map[g_num].text,
-                    "book": group["book"],
-                    "chapter": group["chapter"],
-                    "relevance_probability": probability
-                })
+            errors = self.__classify_windows(
+                self.__gpt_cbse_prompt_template_path,
+                speech_segments,
+                class_number,
+                subject_name,
+                lambda speech_segments, window, gpt_results: cbse_output["groups"].extend(
+                    self.__apply_cbse_results(speech_segments, window, gpt_results)
+                ),
+            )
+            if errors and all(errors):
+                raise Exception("; ".join(errors))
 
             # Write CBSE results to file
             output_filename = self._generate_output_filename("cbse", class_number, subject_name)
@@ -159,11 +246,183 @@ class GPTSpeechSegmentsClassificator:
             error_filename = self._generate_output_filename("cbse_error", class_number, subject_name)
             self._write_results_to_file(error_output, error_filename)
 
-    def __gpt_run_prompt(self, prompt: str) -> dict:
+    def __classify_windows(
+        self,
+        prompt_template_path: str,
+        speech_segments: list,
+        class_number: str,
+        subject_name: str,
+        apply_results,
+    ) -> list:
+        """Sends the transcript window by window, returns the error of every window (None if it succeeded)."""
+        prompt = self._load_prompt(prompt_template_path)
+        prompt_version = get_prompt_version(prompt)
+        prompt = prompt.replace("{@class_number}", class_number)
+        prompt = prompt.replace("{@subject_name}", subject_name)
+
+        windows = self.__split_into_windows(prompt, speech_segments)
+        window_prompts = [
+            self.__build_window_prompt(prompt, speech_segments, window) for window in windows
+        ]
+        logger.info(f"Sending {len(windows)} requests to GPT...")
+        window_results = self.__gpt_run_prompts(window_prompts, prompt_version)
+        logger.info("GPT responses received")
+
+        errors = []
+        for window, window_prompt, gpt_results in zip(windows, window_prompts, window_results):
+            try:
+                if isinstance(gpt_results, Exception):
+                    raise gpt_results
+                apply_results(speech_segments, window, gpt_results)
+                errors.append(None)
+            except Exception as e:
+                self.__forget_response(window_prompt, prompt_version)
+                logger.error(
+                    f"GPT window {window.core_start}-{window.core_end} failed: {e}"
+                )
+                errors.append(str(e) or e.__class__.__name__)
+                self.__failed_windows += 1
+        return errors
+
+    def __apply_off_topic_results(self, speech_segments: list, window: PromptWindow, gpt_results: dict) -> None:
+        # segment numbers in a window prompt start from 0, checked before anything is changed
+        if "off_topic" in gpt_results:
+            off_topic = expand_index_ranges(gpt_results["off_topic"], window.end - window.start)
+        else:
+            off_topic = []
+            for off_topic_sentence in gpt_results["off_topic_sentences"]:
+                s_num = off_topic_sentence["sentence_number"]
+                s_text = off_topic_sentence["text"]
+                probability = off_topic_sentence.get("probability", 1.0)  # Default to 1.0 if not provided
+
+                if not isinstance(s_num, int) or not 0 <= s_num < window.end - window.start:
+                    logger.error(f"Off-topic sentence {s_num} not found in the transcript")
+                    raise Exception(f"GPT provided irrelevant response")
+
+                if speech_segments[window.start + s_num].text.strip() != s_text.strip():
+                    logger.warning(
+                        f"Off-topic sentence {window.start + s_num} is not the same as in the transcript"
+                    )
+                off_topic.append((s_num, probability))
+
+        updates = []
+        for s_num, probability in off_topic:
+            i = window.start + s_num
+            # context segments are classified by their own window
+            if window.core_start <= i < window.core_end:
+                updates.append((i, probability))
+
+        for i, probability in updates:
+            speech_segments[i].relevance_score_gpt = 0
+            speech_segments[i].off_topic_probability = probability
+
+    def __apply_cbse_results(self, speech_segments: list, window: PromptWindow, gpt_results: dict) -> list:
+        updates = []
+        for group in gpt_results["groups"]:
+            g_num = group["group_number"]
+            if not isinstance(g_num, int) or not 0 <= g_num < window.end - window.start:
+                raise Exception(f"Group {g_num} not found in the transcript")
+            i = window.start + g_num
+            if window.core_start <= i < window.core_end:
+                updates.append((i, group))
+
+        res = []
+        for i, group in updates:
+            speech_segments[i].syllabus_classification = f"{group['book']} - {group['chapter']}"
+            probability = group.get("probability", 1.0)  # Default to 1.0 if not provided
+            speech_segments[i].relevance_probability = probability
+
+            # Add to CBSE output
+            res.append({
+                "group_number": i,
+                "text": speech_segments[i].text,
+                "book": group["book"],
+                "chapter": group["chapter"],
+                "relevance_probability": probability
+            })
+        return res
+
+    def __apply_combined_results(self, speech_segments: list, window: PromptWindow, gpt_results: dict) -> None:
+        # chapter ranges are checked and labelled before the off-topic results change anything
+        updates = []
+        for chapter in gpt_results["chapters"]:
+            if not all(key in chapter for key in ("start", "end", "book", "chapter")):
+                raise Exception(f"Malformed chapter range: {chapter}")
+            first = chapter["start"]
+            last = chapter["end"]
+            if not all(
+                isinstance(n, int) and not isinstance(n, bool) and 0 <= n < window.end - window.start
+                for n in (first, last)
+            ) or first > last:
+                raise Exception(f"Chapter range {first}-{last} not found in the transcript")
+            probability = chapter.get("probability", 1.0)
+            if isinstance(probability, bool) or not isinstance(probability, (int, float)):
+                raise Exception(f"Malformed chapter probability: {chapter}")
+            label = f"{chapter['book']} - {chapter['chapter']}"
+            first = max(window.start + first, window.core_start)
+            last = min(window.start + last, window.core_end - 1)
+            for i in range(first, last + 1):
+                updates.append((i, label, float(probability)))
+
+        self.__apply_off_topic_results(speech_segments, window, gpt_results)
+        for i, label, probability in updates:
+            speech_segments[i].syllabus_classification = label
+            speech_segments[i].relevance_probability = probability
+
+    def __split_into_windows(self, prompt: str, speech_segments: list) -> list:
+        token_budget = GPT_WINDOW_TOKENS - estimate_tokens(prompt)
+        return split_into_windows(
+            [f"{i}: {segment.text}\n" for i, segment in enumerate(speech_segments)],
+            token_budget,
+            GPT_WINDOW_OVERLAP_SEGMENTS,
+        )
+
+    def __build_window_prompt(self, prompt: str, speech_segments: list, window: PromptWindow) -> str:
+        lines = "".join(
+            f"{i}: {segment.text}\n"
+            for i, segment in enumerate(speech_segments[window.start : window.end])
+        )
+        return prompt + f"\n\n{lines}"
+
+    def __gpt_run_prompts(self, prompts: list, prompt_version: str) -> list:
+        """Runs the prompts concurrently, a failed prompt returns its exception."""
+        # on the shared client pool loop, so rate limits hold across concurrent jobs
+        return open_ai_client_pool.run(self.__gpt_run_prompts_async(prompts, prompt_version))
+
+    async def __gpt_run_prompts_async(self, prompts: list, prompt_version: str) -> list:
+        semaphore = asyncio.Semaphore(GPT_MAX_CONCURRENCY)
+
+        async def run(prompt: str) -> dict:
+            key = self.__get_response_key(prompt, prompt_version)
+            # the loop is shared by every job, file I/O must not block it
+            result = await asyncio.to_thread(llm_response_cache.get, key)
+            if result is not None:
+                logger.debug(f"GPT response found in the cache: {key}")
+                return result
+            async with semaphore:
+                result = await self.__gpt_run_prompt(prompt)
+            await asyncio.to_thread(llm_response_cache.put, key, result)
+            return result
+
+        results = await asyncio.gather(
+            *[run(prompt) for prompt in prompts], return_exceptions=True
+        )
+        logger.info(f"LLM cache: {llm_response_cache.stats()}")
+        return results
+
+    def __get_response_key(self, prompt: str, prompt_version: str) -> str:
+        return get_response_key(self.__open_ai_model, GPT_TEMPERATURE, prompt_version, prompt)
+
+    def __forget_response(self, prompt: str, prompt_version: str) -> None:
+        # a response that failed validation must not be served from the cache again
+        llm_response_cache.delete(self.__get_response_key(prompt, prompt_version))
+
+    async def __gpt_run_prompt(self, prompt: str) -> dict:
         try:
-            response = self.__open_ai_client.chat.completions.create(
+            response = await open_ai_client_pool.chat_completion(
+                estimate_tokens(prompt) + GPT_RESPONSE_TOKENS_ESTIMATE,
                 model=self.__open_ai_model,
-                temperature=0,
+                temperature=GPT_TEMPERATURE,
                 response_format={"type": "json_object"},
                 messages=[{"role": "user", "content": prompt}],
             )
@@ -180,4 +439,4 @@ class GPTSpeechSegmentsClassificator:
                 return file.read()
         except Exception as e:
             logger.error(f"Error while loading prompt file: {file_path}. Error:{e}")
-            raise
\ No newline at end of file
+            raise
@@ -0,0 +1,135 @@
+import json
+
+READ_CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+NUMBER_START = "-0123456789"
+NUMBER_END = ",]}" + WHITESPACE
+
+
+class JsonStreamReader:
+    """Reads one array of a big JSON object item by item.
+
+    Only the current item is kept in memory, values of the other keys are
+    skipped without being decoded.
+    """
+
+    def __init__(self, file) -> None:
+        self.__file = file
+        self.__decoder = json.JSONDecoder()
+        self.__buffer = ""
+        self.__pos = 0
+        self.__eof = False
+
+    def iter_array(self, key: str):
+        """Yields the items of the array stored under the top level `key`."""
+        self.__expect("{")
+        while True:
+            if self.__peek() == "}":
+                return
+            name = self.__read_value()
+            self.__expect(":")
+            if name != key:
+                self.__skip_value()
+            else:
+                self.__expect("[")
+                if self.__peek() == "]":
+                    self.__pos += 1
+                else:
+                    while True:
+                        yield self.__read_value()
+                        if self.__peek() == "]":
+                            self.__pos += 1
+                            break
+                        self.__expect(",")
+            if self.__peek() == ",":
+                self.__pos += 1
+
+    def __fill(self) -> bool:
+        if self.__eof:
+            return False
+        chunk = self.__file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            self.__eof = True
+            return False
+        # drop consumed data so the buffer holds one item at most
+        self.__buffer = self.__buffer[self.__pos :] + chunk
+        self.__pos = 0
+        return True
+
+    def __peek(self) -> str:
+        while True:
+            while self.__pos < len(self.__buffer):
+                if self.__buffer[self.__pos] not in WHITESPACE:
+                    return self.__buffer[self.__pos]
+                self.__pos += 1
+            if not self.__fill():
+                raise Exception("unexpected end of json stream")
+
+    def __expect(self, char: str) -> None:
+        if self.__peek() != char:
+            raise Exception(
+                f"unexpected character in json stream: expected '{char}', got '{self.__peek()}'"
+            )
+        self.__pos += 1
+
+    def __read_value(self):
+        if self.__peek() in NUMBER_START:
+            self.__read_number_end()
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(self.__buffer, self.__pos)
+                self.__pos = end
+                return value
+            except json.JSONDecodeError:
+                if self.__eof:
+                    raise
+            self.__fill()
+
+    def __read_number_end(self) -> None:
+        # raw_decode parses "1." or "1e" cut at the chunk end as the number 1,
+        # so the number is buffered until a delimiter follows it
+        end = self.__pos
+        while True:
+            while end < len(self.__buffer):
+                if self.__buffer[end] in NUMBER_END:
+                    return
+                end += 1
+            end -= self.__pos
+            if not self.__fill():
+                return
+            end += self.__pos
+
+    def __skip_value(self) -> None:
+        # walks over the value without decoding it
+        self.__peek()
+        depth = 0
+        in_string = False
+        escaped = False
+        while True:
+            if self.__pos >= len(self.__buffer):
+                if not self.__fill():
+                    raise Exception("unexpected end of json stream")
+                continue
+            char = self.__buffer[self.__pos]
+            self.__pos += 1
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+                    if depth == 0:
+                        return
+            elif depth == 0 and char in ",]}" + WHITESPACE:
+                # end of a number, literal or boolean
+                self.__pos -= 1
+                return
+            elif char == '"':
+                in_string = True
+            elif char in "[{":
+                depth += 1
+            elif char in "]}":
+                depth -= 1
+                if depth == 0:
+                    return
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from logging_service import logger
+
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "./llm_cache")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024**2))
+LLM_CACHE_TTL_SEC = int(os.getenv("LLM_CACHE_TTL_SEC", 30 * 24 * 3600))
+# LLM_CACHE_REFRESH=1 ignores cached responses, new responses are still stored
+LLM_CACHE_REFRESH = os.getenv("LLM_CACHE_REFRESH", "0") == "1"
+# the directory is scanned for eviction once this share of max_bytes was written,
+# so the cache can grow that much above the limit in between
+LLM_CACHE_EVICT_FRACTION = 0.05
+
+
+def get_prompt_version(prompt_template: str) -> str:
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()[:16]
+
+
+def get_response_key(model: str, temperature: float, prompt_version: str, prompt: str) -> str:
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    payload = json.dumps([model, temperature, prompt_version, prompt_hash])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Parsed LLM responses stored as one JSON file per prompt.
+
+    An entry expires `ttl_sec` after it was written. The file mtime is bumped
+    on every hit, so eviction above `max_bytes` drops the least recently used.
+    Eviction scans the directory, it runs on the first put and then every
+    LLM_CACHE_EVICT_FRACTION of `max_bytes` written. Both get and put do file
+    I/O, async callers run them in a thread.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, ttl_sec: int, refresh: bool = False) -> None:
+        self.__cache_dir = cache_dir
+        self.__max_bytes = max_bytes
+        self.__ttl_sec = ttl_sec
+        self.__refresh = refresh
+        self.__lock = threading.Lock()
+        # the first put evicts, the directory may be left over from earlier processes
+        self.__bytes_since_evict = max_bytes * LLM_CACHE_EVICT_FRACTION
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        """The cached response or None."""
+        if self.__refresh:
+            return None
+        path = self.__get_entry_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"LLM cache entry {key} is unreadable: {e}")
+            self.misses += 1
+            return None
+
+        if time.time() - entry["created"] > self.__ttl_sec:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return entry["response"]
+
+    def put(self, key: str, response) -> None:
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        path = self.__get_entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"created": time.time(), "response": response}, f)
+            size = f.tell()
+        os.replace(tmp_path, path)
+
+        with self.__lock:
+            self.__bytes_since_evict += size
+            if self.__bytes_since_evict < self.__max_bytes * LLM_CACHE_EVICT_FRACTION:
+                return
+            self.__bytes_since_evict = 0
+        self.__evict()
+
+    def delete(self, key: str) -> None:
+        self.__remove(self.__get_entry_path(key))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __evict(self) -> None:
+        with self.__lock:
+            now = time.time()
+            entries = []
+            total_bytes = 0
+            for entry in os.scandir(self.__cache_dir):
+                if not entry.name.endswith(".json"):
+                    continue
+                stat = entry.stat()
+                # mtime is bumped on use, so an old mtime also means an expired entry
+                if now - stat.st_mtime > self.__ttl_sec:
+                    self.__remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+
+            if total_bytes <= self.__max_bytes:
+                return
+            evicted = 0
+            for _, size, path in sorted(entries):
+                if total_bytes <= self.__max_bytes:
+                    break
+                total_bytes -= size
+                evicted += 1
+                self.__remove(path)
+            logger.debug(f"LLM cache: evicted {evicted} responses")
+
+    def __get_entry_path(self, key: str) -> str:
+        return os.path.join(self.__cache_dir, f"{key}.json")
+
+    def __remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+llm_response_cache = LLMResponseCache(
+    LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL_SEC, LLM_CACHE_REFRESH
+)
@@ -0,0 +1,46 @@
+import json
+import subprocess
+from logging_service import logger
+
+
+def run_ffprobe(args: list) -> str:
+    cmd = ['ffprobe', '-v', 'error'] + args
+    try:
+        return subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    except subprocess.CalledProcessError as e:
+        logger.error(f'FFPROBE ERROR:\nCommand: {e.cmd}\nError: {e.stderr}')
+        raise
+
+
+def probe_keyframes(video_path: str) -> list:
+    """Timestamps (sec) of the video keyframes, read from packet flags without decoding."""
+    output = run_ffprobe([
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        video_path,
+    ])
+    keyframes = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+
+def probe_streams(video_path: str) -> dict:
+    """Codec parameters of the first video and audio streams and the duration."""
+    output = run_ffprobe([
+        '-show_entries',
+        'stream=codec_type,codec_name,profile,width,height,pix_fmt,r_frame_rate,time_base,sample_rate,channels'
+        ':format=duration',
+        '-of', 'json',
+        video_path,
+    ])
+    data = json.loads(output)
+    res = {'duration': float(data.get('format', {}).get('duration', 0)), 'video': None, 'audio': None}
+    for stream in data.get('streams', []):
+        codec_type = stream.get('codec_type')
+        if codec_type in ('video', 'audio') and res[codec_type] is None:
+            res[codec_type] = stream
+    return res
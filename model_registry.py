@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+from logging_service import logger
+
+WHISPER_MODEL = "whisper"
+SIMILARITY_MODEL = "bge_m3"
+SENTENCE_SIMILARITY_MODEL = "sentence_transformers"
+SENTENCE_SPLITTER_MODEL = "spacy_sentence_splitter"
+SEMANTIC_SPLITTER_MODEL = "semantic_splitter"
+
+WHISPER_MODEL_NAME = "base"
+SIMILARITY_MODEL_NAME = "BAAI/bge-m3"
+
+# unix socket of a shared model server, models are loaded locally when not set
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET")
+# shared secret of the model server connections, when not set the server writes
+# a random one to a 0600 key file next to the socket and clients read it from there
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY")
+
+# comma separated list of models to load on worker start, e.g. "whisper,bge_m3"
+MODEL_WARMUP = [
+    name.strip() for name in os.getenv("MODEL_WARMUP", "").split(",") if name.strip()
+]
+
+
+class ModelRegistry:
+    """Loads models lazily on first use.
+
+    Loaders are plain callables, heavy libraries are imported inside them,
+    so importing a pipeline module does not pull in torch, spaCy, etc.
+    """
+
+    def __init__(self) -> None:
+        self.__loaders = {}
+        self.__models = {}
+        self.__locks = {}
+        self.__load_times = {}
+        self.__lock = threading.Lock()
+
+    def register(self, name: str, loader) -> None:
+        with self.__lock:
+            self.__loaders[name] = loader
+            self.__locks[name] = threading.Lock()
+
+    def get(self, name: str):
+        model = self.__models.get(name)
+        if model is not None:
+            return model
+
+        if name not in self.__loaders:
+            raise Exception(f"model is not registered: {name}")
+
+        with self.__locks[name]:
+            # another thread could load the model while we were waiting
+            if name in self.__models:
+                return self.__models[name]
+
+            logger.info(f"loading model: {name}")
+            start_time = time.time()
+            model = self.__loaders[name]()
+            self.__load_times[name] = time.time() - start_time
+            self.__models[name] = model
+            logger.info(f"model {name} loaded in {self.__load_times[name]:.2f} seconds")
+
+        return model
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self.__models
+
+    def warm_up(self, names: list = None) -> None:
+        for name in MODEL_WARMUP if names is None else names:
+            if name not in self.__loaders:
+                # e.g. the semantic splitter parts, a worker only has them on the model server
+                logger.warning(f"model warm up: {name} is not registered, skipped")
+                continue
+            self.get(name)
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "loaded": name in self.__models,
+                "load_time_sec": self.__load_times.get(name),
+            }
+            for name in self.__loaders
+        }
+
+
+def load_whisper_model():
+    import whisper_timestamped as whisper
+
+    return whisper.load_model(WHISPER_MODEL_NAME)
+
+
+def load_similarity_model():
+    from FlagEmbedding import BGEM3FlagModel
+
+    return BGEM3FlagModel(SIMILARITY_MODEL_NAME, use_fp16=True)
+
+
+def load_sentence_similarity_model():
+    from semantic_split import SentenceTransformersSimilarity
+
+    return SentenceTransformersSimilarity()
+
+
+def load_sentence_splitter_model():
+    from semantic_split import SpacySentenceSplitter
+
+    return SpacySentenceSplitter()
+
+
+def get_whisper_instance_name(index: int) -> str:
+    return WHISPER_MODEL if index == 0 else f"{WHISPER_MODEL}_{index}"
+
+
+def register_local_models(registry: ModelRegistry, whisper_instances: int = 1) -> None:
+    def load_semantic_splitter_model():
+        from semantic_split import SimilarSentenceSplitter
+
+        return SimilarSentenceSplitter(
+            registry.get(SENTENCE_SIMILARITY_MODEL),
+            registry.get(SENTENCE_SPLITTER_MODEL),
+        )
+
+    # extra whisper instances let the model server transcribe several jobs at once
+    for i in range(whisper_instances):
+        registry.register(get_whisper_instance_name(i), load_whisper_model)
+    registry.register(SIMILARITY_MODEL, load_similarity_model)
+    registry.register(SENTENCE_SIMILARITY_MODEL, load_sentence_similarity_model)
+    registry.register(SENTENCE_SPLITTER_MODEL, load_sentence_splitter_model)
+    registry.register(SEMANTIC_SPLITTER_MODEL, load_semantic_splitter_model)
+
+
+def register_remote_models(registry: ModelRegistry, socket_path: str) -> None:
+    from model_server_client import (
+        ModelServerClient,
+        RemoteWhisperModel,
+        RemoteSimilarityModel,
+        RemoteSemanticSplitter,
+    )
+
+    client = ModelServerClient(socket_path)
+    registry.register(WHISPER_MODEL, lambda: RemoteWhisperModel(client))
+    registry.register(SIMILARITY_MODEL, lambda: RemoteSimilarityModel(client))
+    registry.register(SEMANTIC_SPLITTER_MODEL, lambda: RemoteSemanticSplitter(client))
+
+
+model_registry = ModelRegistry()
+if MODEL_SERVER_SOCKET:
+    register_remote_models(model_registry, MODEL_SERVER_SOCKET)
+else:
+    register_local_models(model_registry)
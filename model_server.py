@@ -0,0 +1,180 @@
+import os
+import stat
+import queue
+import threading
+import traceback
+import numpy as np
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+from model_registry import (
+    ModelRegistry,
+    register_local_models,
+    get_whisper_instance_name,
+    MODEL_SERVER_SOCKET,
+    MODEL_WARMUP,
+    SIMILARITY_MODEL,
+    SEMANTIC_SPLITTER_MODEL,
+)
+from model_server_client import create_authkey
+from logging_service import logger
+
+BATCH_WAIT_SEC = 0.02
+BATCH_MAX_TEXTS = 256
+# whisper models transcribing at the same time, one job per instance,
+# the extra instances are loaded on the first concurrent transcription
+WHISPER_INSTANCES = int(os.getenv("MODEL_SERVER_WHISPER_INSTANCES", 2))
+
+
+class EmbeddingBatcher:
+    """Collects encode requests from all connections and runs them as one model call."""
+
+    def __init__(self, registry: ModelRegistry) -> None:
+        self.__registry = registry
+        self.__queue = queue.Queue()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def encode(self, texts: list, batch_size: int, max_length: int) -> np.ndarray:
+        future = Future()
+        self.__queue.put((texts, batch_size, max_length, future))
+        return future.result()
+
+    def __run(self) -> None:
+        while True:
+            requests = [self.__queue.get()]
+            texts_count = len(requests[0][0])
+            while texts_count < BATCH_MAX_TEXTS:
+                try:
+                    request = self.__queue.get(timeout=BATCH_WAIT_SEC)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                texts_count += len(request[0])
+
+            # requests with different max_length can't share a model call, and the
+            # batch size of a request is the token budget of its length bucket
+            groups = {}
+            for request in requests:
+                groups.setdefault((request[1], request[2]), []).append(request)
+            for (batch_size, max_length), group in groups.items():
+                self.__encode_group(group, batch_size, max_length)
+
+    def __encode_group(self, group: list, batch_size: int, max_length: int) -> None:
+        try:
+            texts = [text for request in group for text in request[0]]
+            logger.debug(
+                f"model server: encoding {len(texts)} texts from {len(group)} requests"
+            )
+            dense_vecs = self.__registry.get(SIMILARITY_MODEL).encode(
+                texts, batch_size=batch_size, max_length=max_length
+            )["dense_vecs"]
+            dense_vecs = np.asarray(dense_vecs, dtype=np.float32).reshape(len(texts), -1)
+
+            start = 0
+            for request in group:
+                end = start + len(request[0])
+                request[3].set_result(dense_vecs[start:end])
+                start = end
+        except Exception as e:
+            for request in group:
+                if not request[3].done():
+                    request[3].set_exception(e)
+
+
+class ModelServer:
+    """Owns the models of a box and serves them to worker processes over a unix socket."""
+
+    def __init__(self, socket_path: str, whisper_instances: int = WHISPER_INSTANCES) -> None:
+        self.__socket_path = socket_path
+        self.__registry = ModelRegistry()
+        register_local_models(self.__registry, whisper_instances)
+        self.__batcher = EmbeddingBatcher(self.__registry)
+        # whisper and spaCy models are not safe to call from several threads at once,
+        # a transcription takes an idle whisper instance, the most recently used first
+        self.__whisper_instances = queue.LifoQueue()
+        for i in reversed(range(whisper_instances)):
+            self.__whisper_instances.put(get_whisper_instance_name(i))
+        self.__split_lock = threading.Lock()
+
+    def serve_forever(self) -> None:
+        self.__registry.warm_up(MODEL_WARMUP)
+
+        # requests are unpickled, so only the owner may connect and every
+        # connection has to prove it knows the key before anything is read
+        authkey = create_authkey(self.__socket_path)
+        listener = self.__listen(authkey)
+
+        with listener:
+            logger.info(f"model server is listening on {self.__socket_path}")
+            while True:
+                try:
+                    connection = listener.accept()
+                except (AuthenticationError, EOFError, OSError) as e:
+                    logger.warning(f"model server: connection refused: {e}")
+                    continue
+                threading.Thread(
+                    target=self.__handle_connection, args=(connection,), daemon=True
+                ).start()
+
+    def __listen(self, authkey: bytes) -> Listener:
+        # the socket is bound in a directory only the owner can enter and linked
+        # to socket_path, so no umask change is needed to keep it private
+        socket_dir = f"{self.__socket_path}.d"
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        dir_stat = os.lstat(socket_dir)
+        if not stat.S_ISDIR(dir_stat.st_mode) or dir_stat.st_uid != os.getuid():
+            raise Exception(f"model server socket directory is not ours: {socket_dir}")
+        os.chmod(socket_dir, 0o700)
+
+        bound_path = os.path.join(socket_dir, "socket")
+        for path in (bound_path, self.__socket_path):
+            if os.path.lexists(path):
+                os.remove(path)
+        listener = Listener(bound_path, family="AF_UNIX", authkey=authkey)
+        os.chmod(bound_path, 0o600)
+        os.symlink(bound_path, self.__socket_path)
+        return listener
+
+    def __handle_connection(self, connection) -> None:
+        with connection:
+            while True:
+                try:
+                    op, payload = connection.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    result = ("ok", self.__handle_request(op, payload))
+                except Exception as e:
+                    logger.error(f"model server: {op} failed\n{traceback.format_exc()}")
+                    result = ("error", str(e))
+
+                try:
+                    connection.send(result)
+                except (EOFError, OSError):
+                    return
+
+    def __handle_request(self, op: str, payload: dict):
+        if op == "encode":
+            return self.__batcher.encode(
+                payload["texts"], payload["batch_size"], payload["max_length"]
+            )
+        if op == "transcribe":
+            name = self.__whisper_instances.get()
+            try:
+                return self.__registry.get(name).transcribe(payload["audio"], **payload["kwargs"])
+            finally:
+                self.__whisper_instances.put(name)
+        if op == "split":
+            with self.__split_lock:
+                return self.__registry.get(SEMANTIC_SPLITTER_MODEL).split(payload["text"])
+        if op == "stats":
+            return self.__registry.stats()
+        raise Exception(f"unknown model server operation: {op}")
+
+
+if __name__ == "__main__":
+    if not MODEL_SERVER_SOCKET:
+        raise Exception("MODEL_SERVER_SOCKET is not set")
+    ModelServer(MODEL_SERVER_SOCKET).serve_forever()
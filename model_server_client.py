@@ -0,0 +1,99 @@
+import os
+import secrets
+import threading
+from multiprocessing.connection import Client
+from model_registry import MODEL_SERVER_AUTHKEY
+from logging_service import logger
+
+AUTHKEY_BYTES = 32
+
+
+def get_authkey_path(socket_path: str) -> str:
+    return f"{socket_path}.key"
+
+
+def create_authkey(socket_path: str) -> bytes:
+    """MODEL_SERVER_AUTHKEY, or a new random key written to a file only the owner can read."""
+    if MODEL_SERVER_AUTHKEY:
+        return MODEL_SERVER_AUTHKEY.encode("utf-8")
+    authkey = secrets.token_bytes(AUTHKEY_BYTES)
+    key_path = get_authkey_path(socket_path)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        # the mode of open() does not apply to an existing file
+        os.fchmod(f.fileno(), 0o600)
+        f.write(authkey)
+    return authkey
+
+
+def read_authkey(socket_path: str) -> bytes:
+    if MODEL_SERVER_AUTHKEY:
+        return MODEL_SERVER_AUTHKEY.encode("utf-8")
+    with open(get_authkey_path(socket_path), "rb") as f:
+        return f.read()
+
+
+class ModelServerClient:
+    """Sends requests to a local model server over a unix socket.
+
+    Every thread keeps its own connection, the server handles them concurrently
+    and batches embedding requests across all connected workers.
+    """
+
+    def __init__(self, socket_path: str, authkey: bytes = None) -> None:
+        self.__socket_path = socket_path
+        # None: read on every new connection, a restarted server writes a new key
+        self.__authkey = authkey
+        self.__local = threading.local()
+
+    def request(self, op: str, **payload):
+        connection = self.__get_connection()
+        try:
+            connection.send((op, payload))
+            status, result = connection.recv()
+        except (EOFError, OSError) as e:
+            logger.error(f"model server connection lost: {self.__socket_path}\nerror: {e}")
+            self.__local.connection = None
+            raise
+
+        if status != "ok":
+            raise Exception(f"model server failed on {op}: {result}")
+        return result
+
+    def __get_connection(self):
+        connection = getattr(self.__local, "connection", None)
+        if connection is None:
+            connection = Client(
+                self.__socket_path,
+                family="AF_UNIX",
+                authkey=self.__authkey or read_authkey(self.__socket_path),
+            )
+            self.__local.connection = connection
+        return connection
+
+
+class RemoteWhisperModel:
+    def __init__(self, client: ModelServerClient) -> None:
+        self.__client = client
+
+    def transcribe(self, audio, **kwargs) -> dict:
+        return self.__client.request("transcribe", audio=audio, kwargs=kwargs)
+
+
+class RemoteSimilarityModel:
+    def __init__(self, client: ModelServerClient) -> None:
+        self.__client = client
+
+    def encode(self, texts: list, batch_size: int, max_length: int) -> dict:
+        dense_vecs = self.__client.request(
+            "encode", texts=texts, batch_size=batch_size, max_length=max_length
+        )
+        return {"dense_vecs": dense_vecs}
+
+
+class RemoteSemanticSplitter:
+    def __init__(self, client: ModelServerClient) -> None:
+        self.__client = client
+
+    def split(self, text: str) -> list:
+        return self.__client.request("split", text=text)
@@ -0,0 +1,179 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+import httpx
+import openai
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from logging_service import logger
+
+load_dotenv()
+
+OPEN_AI_API_KEY = os.getenv("OPEN_AI_API_KEY")
+# e.g. a local OpenAI-compatible stub server
+OPEN_AI_BASE_URL = os.getenv("OPEN_AI_BASE_URL")
+OPEN_AI_REQUESTS_PER_MINUTE = int(os.getenv("OPEN_AI_REQUESTS_PER_MINUTE", 500))
+OPEN_AI_TOKENS_PER_MINUTE = int(os.getenv("OPEN_AI_TOKENS_PER_MINUTE", 200000))
+OPEN_AI_MAX_CONNECTIONS = int(os.getenv("OPEN_AI_MAX_CONNECTIONS", 16))
+OPEN_AI_TIMEOUT_SEC = 300
+OPEN_AI_MAX_RETRIES = int(os.getenv("OPEN_AI_MAX_RETRIES", 6))
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 60.0
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Requests- and tokens-per-minute token buckets, shared by every caller on the loop."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int) -> None:
+        self.__requests_per_sec = requests_per_minute / 60
+        self.__tokens_per_sec = tokens_per_minute / 60
+        self.__max_requests = requests_per_minute
+        self.__max_tokens = tokens_per_minute
+        self.__requests = float(requests_per_minute)
+        self.__tokens = float(tokens_per_minute)
+        self.__updated = time.monotonic()
+        self.__paused_until = 0.0
+        self.__lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> None:
+        # a request above the whole minute budget would wait forever
+        tokens = min(tokens, self.__max_tokens)
+        async with self.__lock:
+            while True:
+                now = time.monotonic()
+                elapsed = now - self.__updated
+                self.__updated = now
+                self.__requests = min(
+                    self.__max_requests, self.__requests + elapsed * self.__requests_per_sec
+                )
+                self.__tokens = min(self.__max_tokens, self.__tokens + elapsed * self.__tokens_per_sec)
+
+                wait_sec = max(
+                    self.__paused_until - now,
+                    (1 - self.__requests) / self.__requests_per_sec,
+                    (tokens - self.__tokens) / self.__tokens_per_sec,
+                )
+                if wait_sec <= 0:
+                    self.__requests -= 1
+                    self.__tokens -= tokens
+                    return
+                await asyncio.sleep(wait_sec)
+
+    def pause(self, seconds: float) -> None:
+        """Holds every request back, e.g. after the server answered 429."""
+        self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+
+
+def get_retry_after_sec(error: Exception):
+    """Delay the server asked for in Retry-After (seconds or HTTP date) or retry-after-ms."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except Exception:
+        pass
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRY_STATUS_CODES
+
+
+class OpenAIClientPool:
+    """Process-wide OpenAI access.
+
+    One event loop thread owns a single AsyncOpenAI client with keep-alive
+    connections and the rate limiter, so concurrent jobs from any thread share
+    both. Throttled and transient errors are retried with jittered exponential
+    backoff that honors Retry-After.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__loop = None
+        self.__client = None
+        self.__rate_limiter = None
+        self.retries = 0
+
+    def run(self, coroutine):
+        """Runs a coroutine on the pool loop and waits for its result."""
+        try:
+            loop = self.__get_loop()
+        except Exception:
+            coroutine.close()
+            raise
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    async def chat_completion(self, tokens: int, **kwargs):
+        """chat.completions.create with rate limiting and retries, must run on the pool loop."""
+        for attempt in range(OPEN_AI_MAX_RETRIES + 1):
+            await self.__rate_limiter.acquire(tokens)
+            try:
+                return await self.__client.chat.completions.create(**kwargs)
+            except Exception as e:
+                if attempt == OPEN_AI_MAX_RETRIES or not is_retryable(e):
+                    raise
+                retry_after_sec = get_retry_after_sec(e)
+                if retry_after_sec is None:
+                    # full jitter
+                    retry_after_sec = random.uniform(
+                        0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2**attempt)
+                    )
+                if isinstance(e, openai.RateLimitError):
+                    self.__rate_limiter.pause(retry_after_sec)
+                self.retries += 1
+                logger.warning(
+                    f"OpenAI request failed ({e.__class__.__name__}), "
+                    f"retry {attempt + 1} in {retry_after_sec:.1f} sec"
+                )
+                await asyncio.sleep(retry_after_sec)
+
+    def __get_loop(self) -> asyncio.AbstractEventLoop:
+        with self.__lock:
+            if self.__loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="openai-client-pool", daemon=True
+                ).start()
+                try:
+                    asyncio.run_coroutine_threadsafe(self.__init_client(), loop).result()
+                except Exception:
+                    # the next call starts over, the loop thread is not left running
+                    loop.call_soon_threadsafe(loop.stop)
+                    raise
+                self.__loop = loop
+            return self.__loop
+
+    async def __init_client(self) -> None:
+        self.__client = AsyncOpenAI(
+            api_key=OPEN_AI_API_KEY,
+            base_url=OPEN_AI_BASE_URL,
+            # retries are done here, with the shared limiter
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPEN_AI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPEN_AI_MAX_CONNECTIONS,
+                ),
+                timeout=OPEN_AI_TIMEOUT_SEC,
+            ),
+        )
+        self.__rate_limiter = RateLimiter(OPEN_AI_REQUESTS_PER_MINUTE, OPEN_AI_TOKENS_PER_MINUTE)
+
+
+open_ai_client_pool = OpenAIClientPool()
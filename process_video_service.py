@@ -1,10 +1,37 @@
 import os
 import json
-import moviepy.editor as mp
-import whisper_timestamped as whisper
+import shutil
 from whisper_segments_processor import WhisperSegmentsProcessor
-from speech_segments_classificator import SpeechSegmentsClassificator
-from video_cutter import VideoCutter
+from transcription_store import write_transcription_store, convert_json_to_store, STORE_VERSION
+from speech_segments_classificator import (
+    SpeechSegmentsClassificator,
+    SILENCE_THRESHOLD_SEC,
+    MIN_DURATION_SEC,
+    RELEVANCE_THRESHOLD,
+    CLUSTER_ON_SEGMENT_EMBEDDINGS,
+    GPT_COMBINED_MODE,
+    TIERED_CLASSIFICATION,
+    TIER_LOW_THRESHOLD,
+    TIER_HIGH_THRESHOLD,
+    TIER_CONTEXT_SEGMENTS,
+)
+from gpt_speech_segments_classificator import (
+    OPEN_AI_MODEL,
+    PROMPT_FILE_PATHS,
+    GPT_COMPACT_RESPONSES,
+)
+from speech_segment import speech_segment_to_dict, speech_segment_from_dict
+from video_cutter import VideoCutter, RENDER_MODE, TRANSITION_EFFECT, TRANSITION_DURATION, FPS
+from model_registry import (
+    model_registry,
+    WHISPER_MODEL,
+    WHISPER_MODEL_NAME,
+    SIMILARITY_MODEL_NAME,
+)
+from audio_processing import extract_pcm_audio, SAMPLE_RATE
+from chunked_transcription import transcribe_chunked, TRANSCRIPTION_WORKERS, TARGET_CHUNK_SEC
+from voice_activity import detect_speech_regions, get_vad_params, SpeechTimeline, VAD_FILTER
+from artifact_cache import artifact_cache, get_artifact_key, hash_files
 from logging_service import logger
 
 
@@ -17,8 +44,6 @@ def get_output_dir(file_path: str) -> str:
 
 
 class ProcessVideoService:
-    __whisper_model = whisper.load_model("base")
-
     def __init__(
         self,
         input_video_path: str,
@@ -28,20 +53,37 @@ class ProcessVideoService:
         regenerate_audio: bool = True,
         regenerate_transcription: bool = True,
         write_final_video: bool = True,
+        cache_audio: bool = True,
+        transcription_workers: int = TRANSCRIPTION_WORKERS,
+        vad_filter: bool = VAD_FILTER,
+        gpt_combined_mode: bool = GPT_COMBINED_MODE,
+        tiered_classification: bool = TIERED_CLASSIFICATION,
     ) -> None:
         self.__input_video_path = input_video_path
         self.__output_dir = get_output_dir(self.__input_video_path)
         self.__class_number = class_number
         self.__subject = subject
         self.__use_gpt = use_gpt
-        self.__audio_file_path = None
+        self.__video_hash = None
+        self.__audio_key = None
+        self.__transcription_key = None
+        self.__transcription_store_key = None
+        self.__audio = None
+        self.__cache_audio = cache_audio
+        self.__transcription_workers = transcription_workers
+        self.__vad_filter = vad_filter
+        self.__gpt_combined_mode = gpt_combined_mode
+        self.__tiered_classification = tiered_classification
+        self.__vad_skipped_sec = 0.0
         self.__transciption_json_file_path = None
+        self.__transcription_store_path = None
         self.__regenerate_audio = regenerate_audio
         self.__regenerate_transcription = regenerate_transcription
         self.__write_final_video = write_final_video
         self.__transcription_json = None
         self.__speech_segments = None
         self.__classified_speech_segments = None
+        self.__escalated_fraction = None
 
     def process(self):
         logger.info(f"start processing video path: {self.__input_video_path}")
@@ -50,15 +92,27 @@ class ProcessVideoService:
         logger.info(f"REGENERATE_AUDIO: {self.__regenerate_audio}")
         logger.info(f"REGENERATE_TRANSCRIPTION: {self.__regenerate_transcription}")
         logger.info(f"WRITE_FINAL_VIDEO: {self.__write_final_video}")
+        logger.info(f"TRANSCRIPTION_WORKERS: {self.__transcription_workers}")
+        logger.info(f"VAD_FILTER: {self.__vad_filter}")
+        logger.info(f"GPT_COMBINED_MODE: {self.__gpt_combined_mode}")
+        logger.info(f"TIERED_CLASSIFICATION: {self.__tiered_classification}")
+
+        self.__init_artifact_keys()
+        cached_transcription_path = None
+        if not self.__regenerate_transcription:
+            cached_transcription_path = artifact_cache.get_path(self.__transcription_key)
 
-        # extract audio from video
-        logger.info("extract audio from video: started")
-        self.__extract_audio()
-        logger.info("extract audio from video: done")
+        # extract audio from video, a cached transcription does not need it
+        if cached_transcription_path is None:
+            logger.info("extract audio from video: started")
+            self.__extract_audio()
+            logger.info("extract audio from video: done")
+        else:
+            logger.info("extract audio from video: skipped, the transcription is cached")
 
         # extract text from audio
         logger.info("extract transcription from audio: started")
-        self.__transcription_json = self.__transcribe_audio()
+        self.__transcription_json = self.__transcribe_audio(cached_transcription_path)
         self.__speech_segments = self.__transcription_json_2_speech_segments()
         for segment in self.__speech_segments:
             print(f"{segment.is_relevant}: {segment.text}")
@@ -78,10 +132,13 @@ class ProcessVideoService:
             logger.info("write final video: skipped")
 
         # completed
+        logger.info(f"artifact cache: {artifact_cache.stats()}")
         logger.info("process video: done")
 
     def __save_classified_speech_segments(self):
         str = ""
+        if self.__escalated_fraction is not None:
+            str += "ESCALATED TO GPT: {:.1%} of segments\n".format(self.__escalated_fraction)
         prev_end_time_sec = None
         for i, segment in enumerate(self.__classified_speech_segments):
             if prev_end_time_sec is None:
@@ -108,112 +165,259 @@ class ProcessVideoService:
             f.write(str)
 
     def __render_final_video(self):
+        if not any(segment.is_relevant for segment in self.__classified_speech_segments):
+            logger.warning("no relevant speech segments, the final video is not written")
+            return
+
+        output_video_path = os.path.join(self.__output_dir, "output.mp4")
+        render_key = get_artifact_key(
+            "render",
+            self.__video_hash,
+            {
+                "intervals": [
+                    [round(segment.start_time_sec, 3), round(segment.end_time_sec, 3)]
+                    for segment in self.__classified_speech_segments
+                    if segment.is_relevant
+                ],
+                "render_mode": RENDER_MODE,
+                "transition_effect": TRANSITION_EFFECT,
+                "transition_duration": TRANSITION_DURATION,
+                "fps": FPS,
+            },
+        )
+        cached_path = artifact_cache.get_path(render_key)
+        if cached_path is not None:
+            logger.debug(f"rendered video found in the artifact cache: {render_key}")
+            shutil.copyfile(cached_path, output_video_path)
+            return
+
         vc = VideoCutter(
             input_video_path=self.__input_video_path,
-            output_video_path=os.path.join(self.__output_dir, "output.mp4"),
+            output_video_path=output_video_path,
             transition_video_path=None,
             speech_segments=self.__classified_speech_segments,
         )
 
         vc.cut()
+        artifact_cache.put_path(render_key, output_video_path)
 
     def __classify_speech_segments(self) -> list:
+        classification_params = {
+            "class_number": self.__class_number,
+            "subject": self.__subject,
+            "use_gpt": self.__use_gpt,
+            "similarity_model": SIMILARITY_MODEL_NAME,
+            "silence_threshold_sec": SILENCE_THRESHOLD_SEC,
+            "min_duration_sec": MIN_DURATION_SEC,
+            "relevance_threshold": RELEVANCE_THRESHOLD,
+            "cluster_on_segment_embeddings": CLUSTER_ON_SEGMENT_EMBEDDINGS,
+            "gpt_model": OPEN_AI_MODEL if self.__use_gpt else None,
+            "gpt_compact_responses": GPT_COMPACT_RESPONSES if self.__use_gpt else None,
+            "prompt_version": (
+                hash_files(PROMPT_FILE_PATHS)
+                if self.__use_gpt
+                else None
+            ),
+        }
+        # opt-in modes, a job without them keeps its key
+        if self.__use_gpt and self.__gpt_combined_mode:
+            classification_params["gpt_combined_mode"] = True
+        if self.__use_gpt and self.__tiered_classification:
+            classification_params["tiers"] = [
+                TIER_LOW_THRESHOLD, TIER_HIGH_THRESHOLD, TIER_CONTEXT_SEGMENTS
+            ]
+        classification_key = get_artifact_key(
+            "classification", self.__transcription_key, classification_params
+        )
+        cached_classification = artifact_cache.get_json(classification_key)
+        if cached_classification is not None:
+            logger.debug(f"classification found in the artifact cache: {classification_key}")
+            self.__escalated_fraction = cached_classification["escalated_fraction"]
+            return [
+                speech_segment_from_dict(segment)
+                for segment in cached_classification["segments"]
+            ]
+
         classificator = SpeechSegmentsClassificator(
             self.__speech_segments,
             self.__class_number,
             self.__subject,
             use_gpt=self.__use_gpt,
+            gpt_combined_mode=self.__gpt_combined_mode,
+            tiered_classification=self.__tiered_classification,
         )
-        return classificator.classify()
+        classified_speech_segments = classificator.classify()
+        self.__escalated_fraction = classificator.escalated_fraction
+        # a GPT failure falls back to embeddings and a failed window keeps the defaults,
+        # neither result must be served as the GPT one
+        if classificator.gpt_failed or classificator.gpt_degraded:
+            logger.warning("GPT classification failed or degraded, it is not cached")
+        else:
+            artifact_cache.put_json(
+                classification_key,
+                {
+                    "segments": [
+                        speech_segment_to_dict(segment) for segment in classified_speech_segments
+                    ],
+                    "escalated_fraction": self.__escalated_fraction,
+                },
+            )
+        return classified_speech_segments
 
-    def __extract_audio(self):
-        # get video file name
-        video_file_name = os.path.basename(self.__input_video_path)
-        # trim extension
-        video_file_name = get_file_name_wo_extension(video_file_name)
-        # combine path and filename
-        self.__audio_file_path = os.path.join(
-            os.path.dirname(self.__input_video_path),
-            "output",
-            video_file_name + ".mp3",
+    def __init_artifact_keys(self):
+        # the keys only need the video hash, so a cached stage is found before any work
+        self.__video_hash = artifact_cache.hash_file(self.__input_video_path)
+        # 16 kHz mono float32 PCM, the format whisper works on
+        self.__audio_key = get_artifact_key(
+            "audio", self.__video_hash, {"sample_rate": SAMPLE_RATE}
         )
-        logger.debug(f"audio file path: {self.__audio_file_path}")
-        # write audio
-        if self.__regenerate_audio or not os.path.exists(self.__audio_file_path):
-            clip = None
-            # open video
-            try:
-                clip = mp.VideoFileClip(self.__input_video_path)
-            except Exception as e:
-                logger.error(
-                    f"problem with opening video: {self.__input_video_path}\nerror: {e}"
-                )
-                raise e
-            # write audio
-            # create a folder if it doesn't exist
-            os.makedirs(os.path.dirname(self.__audio_file_path), exist_ok=True)
-            try:
-                clip.audio.write_audiofile(self.__audio_file_path, codec="libmp3lame")
-            except Exception as e:
-                logger.error(
-                    f"problem with extracting audio: {self.__audio_file_path}\nerror: {e}"
+        logger.debug(f"audio artifact key: {self.__audio_key}")
+        self.__transcription_key = get_artifact_key(
+            "transcription",
+            self.__audio_key,
+            {
+                "model": WHISPER_MODEL_NAME,
+                **self.__get_transcribe_kwargs(),
+                "vad": get_vad_params() if self.__vad_filter else None,
+                # chunk edges can change the transcription slightly
+                "chunk_sec": TARGET_CHUNK_SEC if self.__transcription_workers > 1 else None,
+            },
+        )
+        logger.debug(f"transcription artifact key: {self.__transcription_key}")
+        self.__transcription_store_key = get_artifact_key(
+            "transcription_store", self.__transcription_key, {"version": STORE_VERSION}
+        )
+
+    def __extract_audio(self):
+        if not self.__regenerate_audio:
+            self.__audio = artifact_cache.get_array(self.__audio_key)
+            if self.__audio is not None:
+                logger.debug(
+                    f"audio found in the artifact cache: {self.__audio_key}\nskipping audio extraction"
                 )
-                raise e
-        else:
-            logger.debug(
-                f"audio file already exists: {self.__audio_file_path}\nskipping audio extraction"
+                return
+
+        try:
+            self.__audio = extract_pcm_audio(self.__input_video_path)
+        except Exception as e:
+            logger.error(
+                f"problem with extracting audio: {self.__input_video_path}\nerror: {e}"
             )
+            raise e
+        logger.debug(f"audio extracted: {len(self.__audio) / SAMPLE_RATE:.1f} seconds")
 
-    def __transcribe_audio(self) -> dict:
-        if not self.__audio_file_path:
-            logger.error("audio file path not found")
-            raise Exception("audio file path not found")
+        if self.__cache_audio:
+            artifact_cache.put_array(self.__audio_key, self.__audio)
 
+    def __get_transcribe_kwargs(self) -> dict:
+        return dict(
+            language="en",
+            word_timestamps=True,
+            temperature=0.0,
+            initial_prompt="",
+            #no_speech_threshold=0.65,
+            hallucination_silence_threshold=1.0
+        )
+
+    def __transcribe_audio(self, cached_path: str) -> dict:
+        if cached_path is None and self.__audio is None:
+            logger.error("audio not found")
+            raise Exception("audio not found")
+
+        os.makedirs(self.__output_dir, exist_ok=True)
         self.__transciption_json_file_path = os.path.join(
             self.__output_dir,
             "whisper_transcription.json"
         )
+        self.__transcription_store_path = os.path.join(
+            self.__output_dir,
+            "whisper_transcription.store"
+        )
 
+        transcribe_kwargs = self.__get_transcribe_kwargs()
         transcription = None
-
-        if self.__regenerate_transcription or not os.path.exists(
-            self.__transciption_json_file_path
-        ):
+        if cached_path is None:
             try:
                 # prompt = "".format(
                 #    "It's an audio of a lecture for Indian students of {} class subject {}",
                 #    self.__class_number,
                 #    self.__subject,
                 # )
-                transcription = ProcessVideoService.__whisper_model.transcribe(
-                    self.__audio_file_path,
-                    language="en",
-                    word_timestamps=True,
-                    temperature=0.0,
-                    initial_prompt="",
-                    #no_speech_threshold=0.65,
-                    hallucination_silence_threshold=1.0
-                )
+                audio = self.__audio
+                speech_timeline = None
+                if self.__vad_filter:
+                    # only the speech regions are transcribed, timestamps are mapped back below
+                    speech_regions = detect_speech_regions(audio)
+                    speech_timeline = SpeechTimeline(speech_regions, len(audio))
+                    audio = speech_timeline.compact_audio(audio)
+                    self.__vad_skipped_sec = speech_timeline.skipped_sec
+                    logger.info(
+                        f"VAD: {len(speech_regions)} speech regions, "
+                        f"skipped {self.__vad_skipped_sec:.1f} of {len(self.__audio) / SAMPLE_RATE:.1f} seconds"
+                    )
+
+                if len(audio) == 0:
+                    transcription = {"text": "", "segments": [], "language": transcribe_kwargs["language"]}
+                elif self.__transcription_workers > 1:
+                    transcription = transcribe_chunked(
+                        audio,
+                        workers=self.__transcription_workers,
+                        **transcribe_kwargs
+                    )
+                else:
+                    transcription = model_registry.get(WHISPER_MODEL).transcribe(
+                        audio, **transcribe_kwargs
+                    )
+
+                if speech_timeline is not None:
+                    transcription = speech_timeline.restore_timestamps(transcription)
             except Exception as e:
                 logger.error(
-                    f"problem with extracting text: {self.__audio_file_path}\nerror: {e}"
+                    f"problem with extracting text: {self.__input_video_path}\nerror: {e}"
                 )
                 raise e
             # save to a file
             with open(self.__transciption_json_file_path, "w") as f:
-                segments_json = json.dumps(transcription, indent=4)
-                f.write(segments_json)
+                json.dump(transcription, f, indent=4)
+            write_transcription_store(
+                transcription["segments"],
+                self.__transcription_store_path,
+                transcription.get("language"),
+            )
+            artifact_cache.put_path(self.__transcription_key, self.__transciption_json_file_path)
+            artifact_cache.put_path(self.__transcription_store_key, self.__transcription_store_path)
         else:
             logger.debug(
-                f"transciption file already exists: {self.__transciption_json_file_path}\nskipping transciption extraction"
+                f"transciption found in the artifact cache: {self.__transcription_key}\nskipping transciption extraction"
             )
-            # load transcription
-            with open(self.__transciption_json_file_path) as f:
-                transcription = json.load(f)
-            logger.debug(f"transcription loaded from the file")
+            shutil.copyfile(cached_path, self.__transciption_json_file_path)
+            # the cached transcription is read from the columnar store, see __transcription_json_2_speech_segments
+            self.__restore_transcription_store()
 
         return transcription
 
+    def __restore_transcription_store(self):
+        cached_store_path = artifact_cache.get_path(self.__transcription_store_key)
+        if os.path.exists(self.__transcription_store_path):
+            shutil.rmtree(self.__transcription_store_path)
+        if cached_store_path is not None:
+            logger.debug(
+                f"transcription store found in the artifact cache: {self.__transcription_store_key}"
+            )
+            shutil.copytree(cached_store_path, self.__transcription_store_path)
+            return
+
+        # only a cache written before the store was cached needs the JSON parsed once
+        convert_json_to_store(
+            self.__transciption_json_file_path, self.__transcription_store_path
+        )
+        artifact_cache.put_path(self.__transcription_store_key, self.__transcription_store_path)
+
     def __transcription_json_2_speech_segments(self) -> list:
-        wsp = WhisperSegmentsProcessor(segments=self.__transcription_json)
+        if self.__transcription_json is not None:
+            wsp = WhisperSegmentsProcessor(segments=self.__transcription_json)
+        else:
+            wsp = WhisperSegmentsProcessor(
+                segments_store_path=self.__transcription_store_path
+            )
         return wsp.get_speech_segments()
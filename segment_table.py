@@ -0,0 +1,217 @@
+import numpy as np
+from speech_segment import SpeechSegment, secs_to_hhmmss
+
+NO_CLUSTER = -1
+# is_relevant is stored as int8: -1 - not classified yet
+NOT_CLASSIFIED = -1
+
+
+def _float_column(name: str):
+    # None is stored as NaN so the row API keeps returning None
+    def getter(self):
+        value = self._table.columns[name][self._index]
+        return None if np.isnan(value) else float(value)
+
+    def setter(self, value):
+        self._table.columns[name][self._index] = np.nan if value is None else value
+
+    return property(getter, setter)
+
+
+class SegmentRow:
+    """Row view of a SegmentTable with the attribute API of SpeechSegment."""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "SegmentTable", index: int) -> None:
+        self._table = table
+        self._index = index
+
+    start_time_sec = _float_column("start_time_sec")
+    end_time_sec = _float_column("end_time_sec")
+    relevance_score = _float_column("relevance_score")
+    relevance_score_gpt = _float_column("relevance_score_gpt")
+    cluster_relevance_score = _float_column("cluster_relevance_score")
+    relevance_score_rag = _float_column("relevance_score_rag")
+    off_topic_probability = _float_column("off_topic_probability")
+    relevance_probability = _float_column("relevance_probability")
+
+    @property
+    def start_time_string(self) -> str:
+        start_time_sec = self.start_time_sec
+        if start_time_sec is None:
+            return None
+        return secs_to_hhmmss(start_time_sec)
+
+    @property
+    def end_time_string(self) -> str:
+        end_time_sec = self.end_time_sec
+        if end_time_sec is None:
+            return None
+        return secs_to_hhmmss(end_time_sec)
+
+    @property
+    def duration_sec(self) -> float:
+        columns = self._table.columns
+        index = self._index
+        return float(columns["end_time_sec"][index] - columns["start_time_sec"][index])
+
+    @property
+    def cluster_id(self) -> int:
+        value = self._table.columns["cluster_id"][self._index]
+        return None if value == NO_CLUSTER else int(value)
+
+    @cluster_id.setter
+    def cluster_id(self, value: int) -> None:
+        self._table.columns["cluster_id"][self._index] = NO_CLUSTER if value is None else value
+
+    @property
+    def is_relevant(self) -> bool:
+        value = self._table.columns["is_relevant"][self._index]
+        return None if value == NOT_CLASSIFIED else bool(value)
+
+    @is_relevant.setter
+    def is_relevant(self, value: bool) -> None:
+        self._table.columns["is_relevant"][self._index] = (
+            NOT_CLASSIFIED if value is None else int(value)
+        )
+
+    @property
+    def syllabus_classification(self) -> str:
+        return self._table.syllabus_classifications[self._index]
+
+    @syllabus_classification.setter
+    def syllabus_classification(self, value: str) -> None:
+        self._table.syllabus_classifications[self._index] = value
+
+    @property
+    def text(self) -> str:
+        return self._table.get_text(self._index)
+
+    @text.setter
+    def text(self, value: str) -> None:
+        self._table.set_text(self._index, value)
+
+    @property
+    def words_count(self) -> int:
+        return len(self.text.split(" "))
+
+
+class SegmentTable:
+    """Speech segments stored column-wise in NumPy arrays.
+
+    Texts are slices of one buffer, rows are lightweight views created on
+    access, so thresholds and interval selection run vectorized. Segments go
+    in and out column-wise, code that reads every attribute should work on
+    to_speech_segments() rather than on rows.
+    """
+
+    FLOAT_COLUMNS = [
+        "start_time_sec",
+        "end_time_sec",
+        "relevance_score",
+        "relevance_score_gpt",
+        "cluster_relevance_score",
+        "relevance_score_rag",
+        "off_topic_probability",
+        "relevance_probability",
+    ]
+
+    def __init__(self, size: int) -> None:
+        self.columns = {name: np.full(size, np.nan) for name in self.FLOAT_COLUMNS}
+        self.columns["cluster_id"] = np.full(size, NO_CLUSTER, dtype=np.int64)
+        self.columns["is_relevant"] = np.full(size, NOT_CLASSIFIED, dtype=np.int8)
+        self.syllabus_classifications = [None] * size
+        self.__text_starts = np.zeros(size, dtype=np.int64)
+        self.__text_ends = np.zeros(size, dtype=np.int64)
+        self.__text_parts = []
+        self.__text_length = 0
+        self.__text = ""
+
+    @classmethod
+    def from_speech_segments(cls, speech_segments: list) -> "SegmentTable":
+        table = cls(len(speech_segments))
+        for name in cls.FLOAT_COLUMNS + ["cluster_id", "is_relevant"]:
+            table.set_column(name, [getattr(segment, name, None) for segment in speech_segments])
+        table.syllabus_classifications = [
+            segment.syllabus_classification for segment in speech_segments
+        ]
+        for i, segment in enumerate(speech_segments):
+            table.set_text(i, segment.text or "")
+        return table
+
+    def set_column(self, name: str, values: list) -> None:
+        """Sets a whole column, None is stored as the missing value of the column."""
+        if name == "cluster_id":
+            values = [NO_CLUSTER if value is None else value for value in values]
+        elif name == "is_relevant":
+            values = [NOT_CLASSIFIED if value is None else int(value) for value in values]
+        else:
+            # None becomes NaN
+            values = np.array(values, dtype=np.float64)
+        self.columns[name][:] = values
+
+    def to_speech_segments(self, start: int = 0, end: int = None) -> list:
+        """Rows from `start` to `end` as SpeechSegment objects with plain attributes."""
+        end = len(self) if end is None else end
+        # a column is converted at once instead of one numpy scalar per access
+        columns = {}
+        for name in self.FLOAT_COLUMNS:
+            column = self.columns[name][start:end]
+            columns[name] = np.where(np.isnan(column), None, column).tolist()
+        cluster_ids = self.columns["cluster_id"][start:end].tolist()
+        is_relevant = self.columns["is_relevant"][start:end].tolist()
+
+        res = []
+        for i in range(end - start):
+            segment = SpeechSegment()
+            for name in self.FLOAT_COLUMNS:
+                setattr(segment, name, columns[name][i])
+            segment.cluster_id = None if cluster_ids[i] == NO_CLUSTER else cluster_ids[i]
+            segment.is_relevant = (
+                None if is_relevant[i] == NOT_CLASSIFIED else bool(is_relevant[i])
+            )
+            segment.syllabus_classification = self.syllabus_classifications[start + i]
+            segment.text = self.get_text(start + i)
+            res.append(segment)
+        return res
+
+    def __len__(self) -> int:
+        return len(self.syllabus_classifications)
+
+    def __getitem__(self, index: int) -> SegmentRow:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"segment index out of range: {index}")
+        return SegmentRow(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield SegmentRow(self, i)
+
+    def get_text(self, index: int) -> str:
+        if len(self.__text) != self.__text_length:
+            self.__text = "".join(self.__text_parts)
+            self.__text_parts = [self.__text]
+        return self.__text[self.__text_starts[index] : self.__text_ends[index]]
+
+    def set_text(self, index: int, value: str) -> None:
+        # texts are only appended, the old slice of a replaced text stays unused
+        self.__text_starts[index] = self.__text_length
+        self.__text_parts.append(value)
+        self.__text_length += len(value)
+        self.__text_ends[index] = self.__text_length
+
+    def set_relevance(self, threshold: float) -> None:
+        """is_relevant = relevance_score > threshold or cluster_relevance_score > threshold"""
+        with np.errstate(invalid="ignore"):
+            is_relevant = (self.columns["relevance_score"] > threshold) | (
+                self.columns["cluster_relevance_score"] > threshold
+            )
+        self.columns["is_relevant"][:] = is_relevant
+
+    def get_relevant_intervals(self) -> tuple:
+        """Start and end times of the relevant segments."""
+        mask = self.columns["is_relevant"] == 1
+        return self.columns["start_time_sec"][mask], self.columns["end_time_sec"][mask]
@@ -1,19 +1,59 @@
-from semantic_split import (
-    SimilarSentenceSplitter,
-    SentenceTransformersSimilarity,
-    SpacySentenceSplitter,
-)
+import numpy as np
+from model_registry import model_registry, SEMANTIC_SPLITTER_MODEL
 
+# segments on each side compared when looking for a topic boundary
+BOUNDARY_WINDOW_SIZE = 3
+# a boundary is a local similarity minimum this many std below the mean
+BOUNDARY_STD_FACTOR = 1.0
 
-class SemanticSentencesGroupper:
-    __model = SentenceTransformersSimilarity()
-    __sentence_splitter = SpacySentenceSplitter()
-    __splitter = SimilarSentenceSplitter(__model, __sentence_splitter)
 
-    def __init__(self, text: str) -> None:
+class SemanticSentencesGroupper:
+    def __init__(self, text: str = None, embeddings: np.ndarray = None) -> None:
+        # one of the parameters should be not None
+        if text is None and embeddings is None:
+            raise Exception("one of the parameters should be not None")
         self.__text = text
+        self.__embeddings = embeddings
 
     def group(self) -> list:
-        res = self.__splitter.split(self.__text)
+        res = model_registry.get(SEMANTIC_SPLITTER_MODEL).split(self.__text)
         return res
-    
\ No newline at end of file
+
+    def group_by_embeddings(self) -> list:
+        # returns groups of consecutive embedding indexes, one group per topic
+        n = len(self.__embeddings)
+        if n == 0:
+            return []
+        if n == 1:
+            return [[0]]
+
+        similarities = self.__window_similarities()
+        threshold = similarities.mean() - BOUNDARY_STD_FACTOR * similarities.std()
+
+        padded = np.concatenate(([np.inf], similarities, [np.inf]))
+        is_local_min = (padded[1:-1] < padded[:-2]) & (padded[1:-1] <= padded[2:])
+        # boundary i splits embeddings i and i + 1
+        boundaries = np.flatnonzero(is_local_min & (similarities < threshold)) + 1
+
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [n]))
+        return [list(range(start, end)) for start, end in zip(starts, ends)]
+
+    def __window_similarities(self) -> np.ndarray:
+        # cosine similarity between the mean of the previous and the next windows
+        embeddings = normalize_rows(np.asarray(self.__embeddings, dtype=np.float32))
+        n = len(embeddings)
+        cumsum = np.concatenate(
+            (np.zeros((1, embeddings.shape[1]), dtype=np.float32), embeddings.cumsum(axis=0))
+        )
+
+        split = np.arange(1, n)
+        left = cumsum[split] - cumsum[np.maximum(split - BOUNDARY_WINDOW_SIZE, 0)]
+        right = cumsum[np.minimum(split + BOUNDARY_WINDOW_SIZE, n)] - cumsum[split]
+
+        return np.einsum("ij,ij->i", normalize_rows(left), normalize_rows(right))
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
@@ -1,20 +1,123 @@
-from FlagEmbedding import BGEM3FlagModel
+import numpy as np
+from embedding_cache import embedding_cache
+from model_registry import model_registry, SIMILARITY_MODEL, SIMILARITY_MODEL_NAME
+from logging_service import logger
 
+ENCODE_MAX_LENGTH = 8192
+# padded tokens per model batch: batch size = budget / bucket length
+ENCODE_TOKEN_BUDGET = 32768
+ENCODE_MAX_BATCH_SIZE = 128
+# texts are bucketed by the next power of two of their estimated length
+ENCODE_MIN_BUCKET_TOKENS = 32
+# an upper bound of the token count, only used to bucket texts, nothing is truncated by it.
+# The XLM-R tokenizer of BGE-M3 takes 4-5 ASCII characters per token, while Devanagari
+# or CJK text can take a token per character, so a non-ASCII character counts as a token
+ASCII_CHARS_PER_TOKEN = 3
+# rough average, only used to cut a long text into chunks
+CHARS_PER_TOKEN = 4
+# the general embedding of a long text is the pooled embedding of chunks of this size
+GENERAL_CHUNK_TOKENS = 2048
+
+
+def estimate_tokens(text: str) -> int:
+    ascii_chars = len(text.encode("ascii", errors="ignore"))
+    return ascii_chars // ASCII_CHARS_PER_TOKEN + (len(text) - ascii_chars) + 1
+
+
+def get_bucket_tokens(tokens: int) -> int:
+    bucket = ENCODE_MIN_BUCKET_TOKENS
+    while bucket < tokens and bucket < ENCODE_MAX_LENGTH:
+        bucket *= 2
+    return bucket
 
-class SimilarityEstimator:
-    __similarity_model = BGEM3FlagModel("BAAI/bge-m3", use_fp16=True)
 
+def split_into_chunks(text: str, chunk_tokens: int) -> list:
+    """Consecutive word chunks of about `chunk_tokens` tokens each."""
+    chunk_chars = chunk_tokens * CHARS_PER_TOKEN
+    res = []
+    chunk = []
+    chunk_length = 0
+    for word in text.split():
+        if chunk and chunk_length + len(word) + 1 > chunk_chars:
+            res.append(" ".join(chunk))
+            chunk = []
+            chunk_length = 0
+        chunk.append(word)
+        chunk_length += len(word) + 1
+    if chunk:
+        res.append(" ".join(chunk))
+    return res
+
+
+class SimilarityEstimator:
     def __init__(self, text: str) -> None:
         self.__text = text
-        self.__general_embedding = SimilarityEstimator.__similarity_model.encode(
-            text, batch_size=12, max_length=8192
-        )["dense_vecs"]
-        pass
+        self.__general_embedding = self.__get_general_embedding(text)
 
     def calculate_similarity(self, text: str) -> float:
-        text_embedding = self.__similarity_model.encode(
-            text, batch_size=12, max_length=8192
-        )["dense_vecs"]
+        return self.calculate_similarities([text])[0]
+
+    def calculate_similarities(self, texts: list) -> np.ndarray:
+        # encode all texts in real batches and score them with one matrix product
+        if len(texts) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        return self.score_embeddings(self.get_embeddings(texts))
+
+    def get_embeddings(self, texts: list) -> np.ndarray:
+        return self.__encode(texts)
+
+    def score_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
+        return embeddings @ self.__general_embedding
+
+    def __get_general_embedding(self, text: str) -> np.ndarray:
+        # a long text is not truncated to ENCODE_MAX_LENGTH: its chunk embeddings are
+        # averaged, weighted by the chunk length, and normalized again
+        chunks = split_into_chunks(text, GENERAL_CHUNK_TOKENS)
+        if len(chunks) <= 1:
+            return self.__encode([text])[0]
+
+        logger.debug(f"general embedding pooled from {len(chunks)} chunks")
+        weights = np.array([len(chunk) for chunk in chunks], dtype=np.float32)
+        pooled = weights @ self.__encode(chunks)
+        return pooled / np.linalg.norm(pooled)
+
+    def __encode(self, texts: list) -> np.ndarray:
+        vectors = embedding_cache.get(SIMILARITY_MODEL_NAME, texts)
+        missed_indexes = [i for i, vector in enumerate(vectors) if vector is None]
+
+        if len(missed_indexes) > 0:
+            missed_texts = [texts[i] for i in missed_indexes]
+            # the float16 round trip of the cache, so results do not depend on cache warmth
+            missed_vectors = self.__encode_bucketed(missed_texts).astype(np.float16)
+            embedding_cache.put(SIMILARITY_MODEL_NAME, missed_texts, missed_vectors)
+            for i, vector in zip(missed_indexes, missed_vectors):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+
+        logger.debug(
+            f"embedding cache: {len(texts) - len(missed_indexes)} hits, "
+            f"{len(missed_indexes)} misses, totals: {embedding_cache.stats()}"
+        )
+        return np.stack(vectors)
+
+    def __encode_bucketed(self, texts: list) -> np.ndarray:
+        """Encodes texts of similar length together, so batches carry little padding."""
+        buckets = {}
+        for i, text in enumerate(texts):
+            buckets.setdefault(get_bucket_tokens(estimate_tokens(text)), []).append(i)
 
-        similarity = text_embedding @ self.__general_embedding.T
-        return similarity
+        model = model_registry.get(SIMILARITY_MODEL)
+        res = [None] * len(texts)
+        for bucket_tokens, indexes in sorted(buckets.items()):
+            batch_size = max(1, min(ENCODE_MAX_BATCH_SIZE, ENCODE_TOKEN_BUDGET // bucket_tokens))
+            vectors = model.encode(
+                [texts[i] for i in indexes], batch_size=batch_size, max_length=ENCODE_MAX_LENGTH
+            )["dense_vecs"]
+            # back to the input order
+            for i, vector in zip(indexes, vectors):
+                res[i] = vector
+        logger.debug(
+            "embedding buckets (tokens: texts): "
+            + ", ".join(f"{tokens}: {len(indexes)}" for tokens, indexes in sorted(buckets.items()))
+        )
+        return np.stack(res)
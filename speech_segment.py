@@ -3,22 +3,34 @@ def secs_to_hhmmss(secs: int) -> str:
 
 
 class SpeechSegment:
-    __start_time_sec: int = None
-    __start_time_string: str = None
-    __end_time_sec: int = None
-    __end_time_string: str = None
-    __text: str = None
-    __words_count: int = None
-    relevance_score: float = None
-    relevance_score_gpt: float = None
-    cluster_id: int = None
-    cluster_relevance_score: float = None
-    relevance_score_rag: float = None
-    is_relevant: bool = None
-    syllabus_classification: str = None
+    __slots__ = (
+        "__start_time_sec",
+        "__end_time_sec",
+        "__text",
+        "relevance_score",
+        "relevance_score_gpt",
+        "cluster_id",
+        "cluster_relevance_score",
+        "relevance_score_rag",
+        "is_relevant",
+        "syllabus_classification",
+        "off_topic_probability",
+        "relevance_probability",
+    )
 
     def __init__(self) -> None:
-        pass
+        self.__start_time_sec = None
+        self.__end_time_sec = None
+        self.__text = None
+        self.relevance_score = None
+        self.relevance_score_gpt = None
+        self.cluster_id = None
+        self.cluster_relevance_score = None
+        self.relevance_score_rag = None
+        self.is_relevant = None
+        self.syllabus_classification = None
+        self.off_topic_probability = None
+        self.relevance_probability = None
 
     @property
     def start_time_sec(self) -> int:
@@ -27,11 +39,13 @@ class SpeechSegment:
     @start_time_sec.setter
     def start_time_sec(self, value: int) -> None:
         self.__start_time_sec = value
-        self.__start_time_string = secs_to_hhmmss(value)
 
     @property
     def start_time_string(self) -> str:
-        return self.__start_time_string
+        # formatted on access, most segments are never printed
+        if self.__start_time_sec is None:
+            return None
+        return secs_to_hhmmss(self.__start_time_sec)
 
     @property
     def end_time_sec(self) -> int:
@@ -40,11 +54,12 @@ class SpeechSegment:
     @end_time_sec.setter
     def end_time_sec(self, value: int) -> None:
         self.__end_time_sec = value
-        self.__end_time_string = secs_to_hhmmss(value)
 
     @property
     def end_time_string(self) -> str:
-        return self.__end_time_string
+        if self.__end_time_sec is None:
+            return None
+        return secs_to_hhmmss(self.__end_time_sec)
 
     @property
     def duration_sec(self) -> int:
@@ -57,8 +72,37 @@ class SpeechSegment:
     @text.setter
     def text(self, value: str) -> None:
         self.__text = value
-        self.__words_count = len(self.text.split(" "))
 
     @property
     def words_count(self) -> int:
-        return self.__words_count
+        if self.__text is None:
+            return None
+        return len(self.__text.split(" "))
+
+
+# attributes kept when a segment is saved, shared by SpeechSegment and SegmentRow
+SPEECH_SEGMENT_FIELDS = [
+    "start_time_sec",
+    "end_time_sec",
+    "text",
+    "relevance_score",
+    "relevance_score_gpt",
+    "cluster_id",
+    "cluster_relevance_score",
+    "relevance_score_rag",
+    "is_relevant",
+    "syllabus_classification",
+    "off_topic_probability",
+    "relevance_probability",
+]
+
+
+def speech_segment_to_dict(segment) -> dict:
+    return {name: getattr(segment, name, None) for name in SPEECH_SEGMENT_FIELDS}
+
+
+def speech_segment_from_dict(data: dict) -> SpeechSegment:
+    segment = SpeechSegment()
+    for name in SPEECH_SEGMENT_FIELDS:
+        setattr(segment, name, data.get(name))
+    return segment
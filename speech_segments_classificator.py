@@ -1,29 +1,81 @@
+import os
 import statistics
-from collections import namedtuple
+import numpy as np
+from bisect import bisect_left, bisect_right
+from collections import namedtuple, defaultdict
 from similarity_estimator import SimilarityEstimator
-from speech_segment import SpeechSegment
-from semantic_sentences_groupper import SemanticSentencesGroupper
+from segment_table import SegmentTable
+from semantic_sentences_groupper import SemanticSentencesGroupper, normalize_rows
+from speech_segments_merger import merge_speech_segments
+from text_offset_index import TextOffsetIndex
 from gpt_speech_segments_classificator import GPTSpeechSegmentsClassificator
 from logging_service import logger
 
 SILENCE_THRESHOLD_SEC = 10
 MIN_DURATION_SEC = 10
 RELEVANCE_THRESHOLD = 0.5
+# find topic clusters on the segment embeddings instead of re-splitting the full text,
+# CLUSTER_ON_SEGMENT_EMBEDDINGS=0 goes back to the semantic splitter
+CLUSTER_ON_SEGMENT_EMBEDDINGS = os.getenv("CLUSTER_ON_SEGMENT_EMBEDDINGS", "1") == "1"
+# one GPT call per window returns both off-topic sentences and CBSE chapter ranges
+GPT_COMBINED_MODE = os.getenv("GPT_COMBINED_MODE", "0") == "1"
+# with use_gpt only segments with an embedding relevance score inside the band go to GPT,
+# the rest is decided locally, it loads the embedding model for GPT jobs too
+TIERED_CLASSIFICATION = os.getenv("TIERED_CLASSIFICATION", "0") == "1"
+TIER_LOW_THRESHOLD = 0.4
+TIER_HIGH_THRESHOLD = 0.6
+# neighbours sent along with every escalated segment, their own decision is kept
+TIER_CONTEXT_SEGMENTS = 2
 
 SemanticCluster = namedtuple("SemanticCluster", ["id", "text", "relevance_score"])
 
 
 class SpeechSegmentsClassificator:
     def __init__(
-        self, speech_segments: list, class_number: str, subject_name: str, use_gpt: bool
+        self,
+        speech_segments: list,
+        class_number: str,
+        subject_name: str,
+        use_gpt: bool,
+        gpt_combined_mode: bool = GPT_COMBINED_MODE,
+        tiered_classification: bool = TIERED_CLASSIFICATION,
     ) -> None:
         self.__class_number = class_number
         self.__subject_name = subject_name
         self.__speech_segments = speech_segments
-        self.__full_text = self.__generate_full_text()
+        self.__text_offset_index = TextOffsetIndex(
+            [segment.text for segment in self.__speech_segments]
+        )
+        self.__full_text = self.__text_offset_index.full_text
         self.__use_gpt = use_gpt
+        self.__gpt_combined_mode = gpt_combined_mode
+        self.__tiered_classification = tiered_classification
+        self.__gpt_failed = False
+        self.__escalated_fraction = None
+        # one classificator per job, the OpenAI connections are shared by the client pool.
+        # Created in classify(), so a setup error falls back to embeddings like any GPT error
+        self.__gpt_classificator = None
         pass
 
+    @property
+    def text_offset_index(self) -> TextOffsetIndex:
+        return self.__text_offset_index
+
+    @property
+    def escalated_fraction(self) -> float:
+        # share of the segments sent to GPT by the tiered classification
+        return self.__escalated_fraction
+
+    @property
+    def gpt_failed(self) -> bool:
+        # classify() fell back to embeddings after a GPT error
+        return self.__gpt_failed
+
+    @property
+    def gpt_degraded(self) -> bool:
+        # some GPT windows failed, their segments kept the default classification
+        return self.__gpt_classificator is not None and self.__gpt_classificator.degraded
+
     def get_subject_sample_text(self, video_num: int):
         input_json_path = f"../downloads/videos/video{video_num}/subject_text.txt"
         with open(input_json_path) as f:
@@ -35,7 +87,16 @@ class SpeechSegmentsClassificator:
 
         try:
             if self.__use_gpt:
-                self.__classify_with_gpt()
+                if self.__gpt_classificator is None:
+                    self.__gpt_classificator = GPTSpeechSegmentsClassificator()
+                logger.info(f"TIERED_CLASSIFICATION: {self.__tiered_classification}")
+                logger.info(f"GPT_COMBINED_MODE: {self.__gpt_combined_mode}")
+                if self.__tiered_classification:
+                    self.__classify_tiered()
+                elif self.__gpt_combined_mode:
+                    self.__classify_with_gpt_combined()
+                else:
+                    self.__classify_with_gpt()
                 for segment in self.__speech_segments:
                     print(
                         f"{segment.is_relevant}: {segment.start_time_string}: {segment.end_time_string} {segment.text}\n"
@@ -46,43 +107,153 @@ class SpeechSegmentsClassificator:
                     print(
                         f"{segment.is_relevant}: {segment.start_time_string}: {segment.end_time_string} {segment.text}\n"
                     )
-                
-                self.__classify_per_syllabus(merged_speech_segments)
+
+                # the combined responses already carry the chapters, unless nothing was sent
+                if self.__gpt_combined_mode and any(
+                    segment.syllabus_classification is not None for segment in self.__speech_segments
+                ):
+                    self.__map_chapters_2_merged_segments(merged_speech_segments)
+                else:
+                    self.__classify_per_syllabus(merged_speech_segments)
 
                 return merged_speech_segments
         except Exception as e:
             logger.error(f"Error while classifying with GPT: {e}")
+            self.__gpt_failed = True
+            # the embedding fallback decides every segment
+            self.__escalated_fraction = None
 
 
         sim_estimator = SimilarityEstimator(self.__full_text)
+        segment_embeddings = self.__score_segments(sim_estimator)
 
-        # calculate each segment similarity to the whole text
-        for segment in self.__speech_segments:
-            segment.relevance_score = sim_estimator.calculate_similarity(segment.text)
-
-        clusters = self.__cluster_full_text(sim_estimator)
-        self.__map_speech_segments_2_clusters(clusters)
-        self.__speech_segments = self.__merge_segments_by_clusters()
+        if CLUSTER_ON_SEGMENT_EMBEDDINGS:
+            self.__cluster_segment_embeddings(sim_estimator, segment_embeddings)
+        else:
+            clusters = self.__cluster_full_text(sim_estimator)
+            self.__map_speech_segments_2_clusters(clusters)
+        segment_table = self.__merge_segments_by_clusters()
 
         # set segments relevancy based on the average similarity
-        for segment in self.__speech_segments:
-            segment.is_relevant = (
-                segment.relevance_score > RELEVANCE_THRESHOLD
-                or segment.cluster_relevance_score > RELEVANCE_THRESHOLD
-            )
+        segment_table.set_relevance(RELEVANCE_THRESHOLD)
+        self.__speech_segments = segment_table.to_speech_segments()
 
         merged_speech_segments = self.__merge_speech_segments()
 
         return merged_speech_segments
 
+    def __score_segments(self, sim_estimator: SimilarityEstimator) -> np.ndarray:
+        # calculate each segment similarity to the whole text
+        segment_embeddings = sim_estimator.get_embeddings(
+            [segment.text for segment in self.__speech_segments]
+        )
+        relevance_scores = sim_estimator.score_embeddings(segment_embeddings)
+        for segment, relevance_score in zip(self.__speech_segments, relevance_scores):
+            segment.relevance_score = float(relevance_score)
+        return segment_embeddings
+
+    def __classify_tiered(self):
+        self.__score_segments(SimilarityEstimator(self.__full_text))
+
+        uncertain_indexes = []
+        for i, segment in enumerate(self.__speech_segments):
+            if segment.relevance_score >= TIER_HIGH_THRESHOLD:
+                segment.is_relevant = True
+            elif segment.relevance_score <= TIER_LOW_THRESHOLD:
+                segment.is_relevant = False
+            else:
+                uncertain_indexes.append(i)
+
+        self.__escalated_fraction = (
+            len(uncertain_indexes) / len(self.__speech_segments) if self.__speech_segments else 0.0
+        )
+        logger.info(
+            f"tiered classification: {len(uncertain_indexes)} of {len(self.__speech_segments)} "
+            f"segments escalated to GPT ({self.__escalated_fraction:.1%})"
+        )
+        if len(uncertain_indexes) == 0:
+            return
+
+        # escalated segments go with their neighbours, so GPT reads them in context
+        sent_indexes = sorted({
+            j
+            for i in uncertain_indexes
+            for j in range(
+                max(i - TIER_CONTEXT_SEGMENTS, 0),
+                min(i + TIER_CONTEXT_SEGMENTS + 1, len(self.__speech_segments)),
+            )
+        })
+        sent_segments = [self.__speech_segments[i] for i in sent_indexes]
+        if self.__gpt_combined_mode:
+            self.__gpt_classificator.classify_combined(
+                sent_segments, self.__class_number, self.__subject_name
+            )
+            self.__spread_chapters()
+        else:
+            self.__gpt_classificator.classify(
+                sent_segments, self.__class_number, self.__subject_name
+            )
+        for i in uncertain_indexes:
+            segment = self.__speech_segments[i]
+            segment.is_relevant = segment.relevance_score_gpt > RELEVANCE_THRESHOLD
+
+    def __spread_chapters(self):
+        # segments GPT did not read take the chapter of the nearest segment it did
+        classified_indexes = [
+            i
+            for i, segment in enumerate(self.__speech_segments)
+            if segment.syllabus_classification is not None
+        ]
+        if len(classified_indexes) == 0:
+            return
+        for i, segment in enumerate(self.__speech_segments):
+            if segment.syllabus_classification is not None:
+                continue
+            position = bisect_left(classified_indexes, i)
+            neighbours = classified_indexes[max(position - 1, 0) : position + 1]
+            nearest = self.__speech_segments[min(neighbours, key=lambda j: abs(j - i))]
+            segment.syllabus_classification = nearest.syllabus_classification
+            segment.relevance_probability = nearest.relevance_probability
+
     def __classify_with_gpt(self):
-        gpt_classificator = GPTSpeechSegmentsClassificator()
-        gpt_classificator.classify(
+        self.__gpt_classificator.classify(
             self.__speech_segments, self.__class_number, self.__subject_name
         )
         for segment in self.__speech_segments:
             segment.is_relevant = segment.relevance_score_gpt > RELEVANCE_THRESHOLD
 
+    def __classify_with_gpt_combined(self):
+        self.__gpt_classificator.classify_combined(
+            self.__speech_segments, self.__class_number, self.__subject_name
+        )
+        for segment in self.__speech_segments:
+            segment.is_relevant = segment.relevance_score_gpt > RELEVANCE_THRESHOLD
+
+    def __map_chapters_2_merged_segments(self, merged_speech_segments: list):
+        # a merged segment gets the chapter covering most of its duration
+        midpoints = [
+            (segment.start_time_sec + segment.end_time_sec) / 2
+            for segment in self.__speech_segments
+        ]
+        for merged_segment in merged_speech_segments:
+            first = bisect_left(midpoints, merged_segment.start_time_sec)
+            last = bisect_right(midpoints, merged_segment.end_time_sec)
+            durations = defaultdict(float)
+            probabilities = defaultdict(float)
+            for segment in self.__speech_segments[first:last]:
+                if segment.syllabus_classification is None:
+                    continue
+                durations[segment.syllabus_classification] += segment.duration_sec
+                probabilities[segment.syllabus_classification] += (
+                    segment.duration_sec * (segment.relevance_probability or 0.0)
+                )
+            if len(durations) == 0:
+                continue
+            chapter = max(durations, key=durations.get)
+            merged_segment.syllabus_classification = chapter
+            if durations[chapter] > 0:
+                merged_segment.relevance_probability = probabilities[chapter] / durations[chapter]
+
     def __classify_per_syllabus(self, speech_segments: list):
         logger.info("Classifying per syllabus...")
         logger.info("Currently CBSE is supported only")
@@ -91,178 +262,104 @@ class SpeechSegmentsClassificator:
             logger.warning("Classification per Syllabus is only supported with GPT")
             return
 
-        gpt_classificator = GPTSpeechSegmentsClassificator()
-        gpt_classificator.classify_per_CBSE(speech_segments, self.__class_number, self.__subject_name)
-
-    def __merge_segments_by_clusters(self) -> list:
-        # array or arrays
-        arr = []
-        arr2 = []
-        cluster_id = None
-        for segment in self.__speech_segments:
-            if cluster_id is None:
-                cluster_id = segment.cluster_id
-                arr2.append(segment)
+        self.__gpt_classificator.classify_per_CBSE(speech_segments, self.__class_number, self.__subject_name)
+
+    def __merge_segments_by_clusters(self) -> SegmentTable:
+        # consecutive segments of the same cluster become one row
+        groups = []
+        for i, segment in enumerate(self.__speech_segments):
+            if (
+                len(groups) > 0
+                and self.__speech_segments[groups[-1][0]].cluster_id == segment.cluster_id
+            ):
+                groups[-1].append(i)
             else:
-                if cluster_id != segment.cluster_id:
-                    arr.append(arr2)
-                    arr2 = []
-                    cluster_id = segment.cluster_id
-                arr2.append(segment)
-        # add the last one
-        arr.append(arr2)
-
-        res = []
-        for arr2 in arr:
-            new_segment = SpeechSegment()
-            new_segment.text = ""
-            new_segment.start_time_sec = arr2[0].start_time_sec
-            new_segment.end_time_sec = arr2[-1].end_time_sec
-            new_segment.cluster_id = arr2[0].cluster_id
-            new_segment.cluster_relevance_score = arr2[0].cluster_relevance_score
-
-            max_relevance_score = 0
-
-            for segment in arr2:
-                new_segment.text += " " + segment.text.strip()
-                if segment.relevance_score > max_relevance_score:
-                    max_relevance_score = segment.relevance_score
+                groups.append([i])
 
-            new_segment.relevance_score = max_relevance_score
-
-            res.append(new_segment)
-
-        return res
+        segment_table = SegmentTable(len(groups))
+        first_segments = [self.__speech_segments[group[0]] for group in groups]
+        segment_table.set_column(
+            "start_time_sec", [segment.start_time_sec for segment in first_segments]
+        )
+        segment_table.set_column(
+            "end_time_sec", [self.__speech_segments[group[-1]].end_time_sec for group in groups]
+        )
+        segment_table.set_column("cluster_id", [segment.cluster_id for segment in first_segments])
+        segment_table.set_column(
+            "cluster_relevance_score",
+            [segment.cluster_relevance_score for segment in first_segments],
+        )
+        segment_table.set_column(
+            "relevance_score",
+            [
+                max([0] + [self.__speech_segments[i].relevance_score for i in group])
+                for group in groups
+            ],
+        )
+        for i, group in enumerate(groups):
+            segment_table.set_text(
+                i, "".join(" " + self.__speech_segments[j].text.strip() for j in group)
+            )
 
-    def __generate_full_text(self) -> str:
-        full_text = ""
-        for segment in self.__speech_segments:
-            full_text += " " + segment.text.strip()
-        return full_text
+        return segment_table
 
     def __cluster_full_text(self, sim_estimator: SimilarityEstimator) -> list:
         semantic_sentences_groupper = SemanticSentencesGroupper(self.__full_text)
         clusters = semantic_sentences_groupper.group()
 
-        res = []
+        cluster_texts = ["".join(cluster) for cluster in clusters]
+        relevance_scores = sim_estimator.calculate_similarities(cluster_texts)
 
-        for i, cluster in enumerate(clusters):
-            str = ""
-            for sentence in cluster:
-                str += sentence
-
-            relevance_score = sim_estimator.calculate_similarity(str)
+        res = []
 
+        for i, (text, relevance_score) in enumerate(zip(cluster_texts, relevance_scores)):
             res.append(
                 SemanticCluster(
                     id=i,
-                    text=str,
-                    relevance_score=relevance_score,
+                    text=text,
+                    relevance_score=float(relevance_score),
                 )
             )
 
         return res
 
+    def __cluster_segment_embeddings(
+        self, sim_estimator: SimilarityEstimator, segment_embeddings: np.ndarray
+    ):
+        semantic_sentences_groupper = SemanticSentencesGroupper(
+            embeddings=segment_embeddings
+        )
+        groups = semantic_sentences_groupper.group_by_embeddings()
+        if len(groups) == 0:
+            return
+
+        # cluster embedding is the normalized mean of its segment embeddings
+        starts = [group[0] for group in groups]
+        cluster_embeddings = normalize_rows(
+            np.add.reduceat(np.asarray(segment_embeddings, dtype=np.float32), starts)
+        )
+        relevance_scores = sim_estimator.score_embeddings(cluster_embeddings)
+
+        for i, (group, relevance_score) in enumerate(zip(groups, relevance_scores)):
+            for segment_index in group:
+                segment = self.__speech_segments[segment_index]
+                segment.cluster_id = i
+                segment.cluster_relevance_score = float(relevance_score)
+
     def __merge_speech_segments(self) -> list:
-        arr2 = self.__speech_segments
-        while True:
-            made_changes = False
-            # Step 1: Merge near similar by relevancy segments
-            arr1 = []
-            i = 0
-            while i < len(arr2):
-                s_prev = arr1.pop() if len(arr1) > 0 else None
-                s = arr2[i]
-
-                if s_prev is None:
-                    arr1.append(s)
-                elif (
-                    s_prev.is_relevant == s.is_relevant
-                    and s.start_time_sec - s_prev.end_time_sec < SILENCE_THRESHOLD_SEC
-                ):
-                    arr1.append(
-                        self.__merge_2_speech_segments(s_prev, s, s_prev.is_relevant)
-                    )
-                    made_changes = True
-                else:
-                    arr1.append(s_prev)
-                    arr1.append(s)
-
-                i += 1
-
-            # Step 2: Merge near short segments
-            i = 0
-            arr2 = []
-            while i < len(arr1):
-                s_prev = arr2.pop() if len(arr2) > 0 else None
-                s = arr1[i]
-
-                if s_prev is None:
-                    arr2.append(s)
-                elif (
-                    s.duration_sec < MIN_DURATION_SEC
-                    and s.start_time_sec - s_prev.end_time_sec < SILENCE_THRESHOLD_SEC
-                ):
-                    arr2.append(
-                        self.__merge_2_speech_segments(s_prev, s, s_prev.is_relevant)
-                    )
-                    made_changes = True
-                elif (
-                    s_prev.duration_sec < MIN_DURATION_SEC
-                    and s.start_time_sec - s_prev.end_time_sec < SILENCE_THRESHOLD_SEC
-                ):
-                    arr2.append(
-                        self.__merge_2_speech_segments(s_prev, s, s.is_relevant)
-                    )
-                    made_changes = True
-                else:
-                    arr2.append(s_prev)
-                    arr2.append(s)
-
-                i += 1
-            if not made_changes:
-                break
-
-        return arr2
-
-    def __merge_2_speech_segments(
-        self, segment1, segment2, is_relevant: bool = True
-    ) -> SpeechSegment:
-        new_segment = SpeechSegment()
-        new_segment.start_time_sec = segment1.start_time_sec
-        new_segment.end_time_sec = segment2.end_time_sec
-        new_segment.is_relevant = is_relevant
-        new_segment.relevance_score = (
-            (segment1.relevance_score or 0) + (segment2.relevance_score or 0)
-        ) / 2
-        new_segment.cluster_relevance_score = max(
-            segment1.cluster_relevance_score or 0, segment2.cluster_relevance_score or 0
+        return merge_speech_segments(
+            self.__speech_segments, SILENCE_THRESHOLD_SEC, MIN_DURATION_SEC
         )
-        new_segment.text = segment1.text + " " + segment2.text
-        return new_segment
 
     def __map_speech_segments_2_clusters(self, semantic_clusters: list):
         # Cluster - text, can contain several sentences
         # Speech segments < than cluster text
-
-        i = 0
-        j = 0
-        while i < len(self.__speech_segments) and j < len(semantic_clusters):
-            segment = self.__speech_segments[i]
-            cluster = semantic_clusters[j]
-
-            segment_text = segment.text.strip()
-            cluster_text = cluster.text.strip()
-
-            if segment_text != cluster_text:
-                if segment_text in cluster_text:
-                    segment.cluster_id = cluster.id
-                    segment.cluster_relevance_score = cluster.relevance_score
-                    i += 1
-                else:
-                    j += 1
-            else:
-                segment.cluster_id = cluster.id
-                segment.cluster_relevance_score = cluster.relevance_score
-                i += 1
-                j += 1
+        cluster_indexes = self.__text_offset_index.map_spans(
+            [cluster.text for cluster in semantic_clusters]
+        )
+        for segment, cluster_index in zip(self.__speech_segments, cluster_indexes):
+            if cluster_index is None:
+                continue
+            cluster = semantic_clusters[cluster_index]
+            segment.cluster_id = cluster.id
+            segment.cluster_relevance_score = cluster.relevance_score
@@ -0,0 +1,117 @@
+from speech_segment import SpeechSegment
+
+
+class _MergeRange:
+    """A run of consecutive speech segments, merged segments are built only at the end."""
+
+    __slots__ = (
+        "first",
+        "last",
+        "start_time_sec",
+        "end_time_sec",
+        "is_relevant",
+        "relevance_score",
+        "cluster_relevance_score",
+    )
+
+    def __init__(self, index: int, segment: SpeechSegment) -> None:
+        self.first = index
+        self.last = index
+        self.start_time_sec = segment.start_time_sec
+        self.end_time_sec = segment.end_time_sec
+        self.is_relevant = segment.is_relevant
+        self.relevance_score = segment.relevance_score
+        self.cluster_relevance_score = segment.cluster_relevance_score
+
+    @property
+    def duration_sec(self) -> float:
+        return self.end_time_sec - self.start_time_sec
+
+    def extend(self, other: "_MergeRange", is_relevant: bool) -> "_MergeRange":
+        # same arithmetic as merging two SpeechSegment objects pairwise
+        self.last = other.last
+        self.end_time_sec = other.end_time_sec
+        self.is_relevant = is_relevant
+        self.relevance_score = (
+            (self.relevance_score or 0) + (other.relevance_score or 0)
+        ) / 2
+        self.cluster_relevance_score = max(
+            self.cluster_relevance_score or 0, other.cluster_relevance_score or 0
+        )
+        return self
+
+
+def merge_speech_segments(
+    speech_segments: list, silence_threshold_sec: float, min_duration_sec: float
+) -> list:
+    """Merges neighbouring segments until nothing changes.
+
+    Step 1 merges close segments with the same relevancy, step 2 merges short
+    segments into their close neighbour. Both steps are linear folds over
+    index ranges, texts are joined once per resulting segment.
+    """
+    ranges = [_MergeRange(i, segment) for i, segment in enumerate(speech_segments)]
+
+    while True:
+        ranges, merged_same = _merge_same_relevancy(ranges, silence_threshold_sec)
+        ranges, merged_short = _merge_short(
+            ranges, silence_threshold_sec, min_duration_sec
+        )
+        if not merged_same and not merged_short:
+            break
+
+    return [_build_speech_segment(speech_segments, r) for r in ranges]
+
+
+def _merge_same_relevancy(ranges: list, silence_threshold_sec: float) -> tuple:
+    res = []
+    made_changes = False
+    for r in ranges:
+        if len(res) > 0:
+            prev = res[-1]
+            if (
+                prev.is_relevant == r.is_relevant
+                and r.start_time_sec - prev.end_time_sec < silence_threshold_sec
+            ):
+                prev.extend(r, prev.is_relevant)
+                made_changes = True
+                continue
+        res.append(r)
+    return res, made_changes
+
+
+def _merge_short(
+    ranges: list, silence_threshold_sec: float, min_duration_sec: float
+) -> tuple:
+    res = []
+    made_changes = False
+    for r in ranges:
+        if len(res) > 0:
+            prev = res[-1]
+            is_close = r.start_time_sec - prev.end_time_sec < silence_threshold_sec
+            if is_close and r.duration_sec < min_duration_sec:
+                prev.extend(r, prev.is_relevant)
+                made_changes = True
+                continue
+            if is_close and prev.duration_sec < min_duration_sec:
+                prev.extend(r, r.is_relevant)
+                made_changes = True
+                continue
+        res.append(r)
+    return res, made_changes
+
+
+def _build_speech_segment(speech_segments: list, r: _MergeRange) -> SpeechSegment:
+    if r.first == r.last:
+        return speech_segments[r.first]
+
+    new_segment = SpeechSegment()
+    new_segment.start_time_sec = r.start_time_sec
+    new_segment.end_time_sec = r.end_time_sec
+    new_segment.is_relevant = r.is_relevant
+    new_segment.relevance_score = r.relevance_score
+    new_segment.cluster_relevance_score = r.cluster_relevance_score
+    new_segment.text = " ".join(
+        speech_segments[i].text for i in range(r.first, r.last + 1)
+    )
+    return new_segment
@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+
+class FakeOpenAIServer:
+    """Local OpenAI-compatible chat completions endpoint.
+
+    `respond(body)` returns the message content, or a (status, content, headers)
+    tuple for an error answer.
+    """
+
+    def __init__(self, respond) -> None:
+        self.respond = respond
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self.__make_handler())
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.__server.server_port}/v1"
+
+    def shutdown(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server.lock:
+                    server.requests.append(body)
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                try:
+                    answer = server.respond(body)
+                finally:
+                    with server.lock:
+                        server.active -= 1
+
+                if isinstance(answer, tuple):
+                    status, content, headers = answer
+                    data = json.dumps({"error": {"message": content, "type": "fake"}})
+                else:
+                    status, headers = 200, {}
+                    data = json.dumps({
+                        "id": "fake",
+                        "object": "chat.completion",
+                        "created": 0,
+                        "model": body["model"],
+                        "choices": [{
+                            "index": 0,
+                            "finish_reason": "stop",
+                            "message": {"role": "assistant", "content": answer},
+                        }],
+                    })
+                data = data.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """A fake server and a fresh client pool pointed at it."""
+    import openai_client_pool
+
+    server = FakeOpenAIServer(lambda body: "{}")
+    monkeypatch.setattr(openai_client_pool, "OPEN_AI_BASE_URL", server.base_url)
+    monkeypatch.setattr(openai_client_pool, "OPEN_AI_API_KEY", "test")
+    server.pool = openai_client_pool.OpenAIClientPool()
+    yield server
+    server.shutdown()
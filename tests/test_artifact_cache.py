@@ -0,0 +1,94 @@
+import os
+import numpy as np
+from artifact_cache import ArtifactCache, INDEX_FILE_NAME
+
+
+def list_files(cache_dir) -> list:
+    return sorted(name for name in os.listdir(cache_dir) if name != "index.lock")
+
+
+def test_put_writes_in_place_without_leftovers(tmp_path):
+    cache = ArtifactCache(str(tmp_path), 10**8)
+    audio = np.arange(1000, dtype=np.float32)
+
+    cache.put_array("audio_1", audio)
+    cache.put_json("classification_1", {"score": np.float32(0.5)})
+
+    assert list_files(tmp_path) == ["audio_1", "classification_1", INDEX_FILE_NAME]
+    assert np.array_equal(cache.get_array("audio_1"), audio)
+    assert cache.get_json("classification_1") == {"score": 0.5}
+
+
+def test_put_path_copies_files_and_directories(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), 10**8)
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    (source_dir / "a.txt").write_text("a")
+    (tmp_path / "b.txt").write_text("b")
+
+    cache.put_path("dir_1", str(source_dir))
+    cache.put_path("file_1", str(tmp_path / "b.txt"))
+
+    assert open(os.path.join(cache.get_path("dir_1"), "a.txt")).read() == "a"
+    assert open(cache.get_path("file_1")).read() == "b"
+
+
+def test_processes_sharing_a_directory_keep_each_others_entries(tmp_path):
+    # every instance keeps its own index in memory, like separate processes
+    cache1 = ArtifactCache(str(tmp_path), 10**8)
+    cache2 = ArtifactCache(str(tmp_path), 10**8)
+    cache1.get_path("a")
+    cache2.get_path("b")
+
+    cache1.put_json("a", 1)
+    cache2.put_json("b", 2)
+
+    for cache in (cache1, cache2, ArtifactCache(str(tmp_path), 10**8)):
+        assert cache.get_json("a") == 1
+        assert cache.get_json("b") == 2
+
+
+def test_hit_does_not_rewrite_the_index(tmp_path):
+    cache = ArtifactCache(str(tmp_path), 10**8)
+    cache.put_json("a", 1)
+    index_path = os.path.join(tmp_path, INDEX_FILE_NAME)
+    index_mtime_ns = os.stat(index_path).st_mtime_ns
+
+    assert cache.get_json("a") == 1
+    assert os.stat(index_path).st_mtime_ns == index_mtime_ns
+
+
+def test_orphans_and_least_recently_used_are_evicted(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    cache = ArtifactCache(str(cache_dir), 2 * 100)
+    source_path = tmp_path / "source"
+    source_path.write_bytes(b"x" * 100)
+    # an artifact whose writer died before it saved the index
+    (cache_dir / "orphan_1").write_bytes(b"x" * 100)
+
+    cache.put_path("a", str(source_path))
+
+    assert not (cache_dir / "orphan_1").exists()
+
+    cache.put_path("b", str(source_path))
+    # "a" is older than "b" but was just read
+    os.utime(cache_dir / "a", (1, 1))
+    os.utime(cache_dir / "b", (2, 2))
+    cache.get_path("a")
+
+    cache.put_path("c", str(source_path))
+
+    assert cache.get_path("a") is not None
+    assert cache.get_path("b") is None
+    assert cache.get_path("c") is not None
+
+
+def test_arrays_are_memory_mapped(tmp_path):
+    cache = ArtifactCache(str(tmp_path), 10**8)
+    cache.put_array("audio_1", np.arange(1000, dtype=np.float32))
+
+    audio = cache.get_array("audio_1")
+
+    assert isinstance(audio, np.memmap)
+    assert not audio.flags.writeable
@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+import chunked_transcription
+from chunked_transcription import find_split_points, stitch_transcriptions, transcribe_chunked
+from audio_processing import SAMPLE_RATE
+
+TARGET_CHUNK_SEC = 60
+# whisper timestamps run a little past the audio it was given
+STUB_START_JITTER_SEC = 0.2
+STUB_END_JITTER_SEC = 0.3
+WORDS_PER_SEGMENT = 5
+
+
+def generate_speech(duration_sec: float, seed: int) -> tuple:
+    """Noise floor with tone bursts as words, returns the audio and the words."""
+    rng = np.random.default_rng(seed)
+    audio = rng.normal(0, 0.001, int(duration_sec * SAMPLE_RATE)).astype(np.float32)
+    words = []
+    time_sec = 0.5
+    while True:
+        word_sec = rng.uniform(0.2, 0.8)
+        if time_sec + word_sec > duration_sec - 0.1:
+            break
+        first = int(time_sec * SAMPLE_RATE)
+        last = int((time_sec + word_sec) * SAMPLE_RATE)
+        t = np.arange(last - first) / SAMPLE_RATE
+        audio[first:last] += 0.3 * np.sin(2 * np.pi * rng.uniform(150, 400) * t)
+        words.append({"word": f" w{len(words)}", "start": time_sec, "end": time_sec + word_sec})
+        time_sec += word_sec + rng.choice([rng.uniform(0.05, 0.4), rng.uniform(1.0, 3.0)])
+    return audio, words
+
+
+def make_stub_transcriber(audio: np.ndarray, words: list, chunks: list):
+    def transcribe_chunk(chunk: np.ndarray, transcribe_kwargs: dict) -> dict:
+        # chunks are views of the audio, their position gives the offset
+        offset = (chunk.__array_interface__["data"][0] - audio.__array_interface__["data"][0]) // audio.itemsize
+        offset_sec = offset / SAMPLE_RATE
+        duration_sec = len(chunk) / SAMPLE_RATE
+        chunks.append((offset_sec, duration_sec))
+
+        chunk_words = [
+            {
+                "word": word["word"],
+                "start": word["start"] - offset_sec - STUB_START_JITTER_SEC,
+                "end": word["end"] - offset_sec + STUB_END_JITTER_SEC,
+            }
+            for word in words
+            if offset_sec <= (word["start"] + word["end"]) / 2 < offset_sec + duration_sec
+        ]
+        segments = []
+        for i in range(0, len(chunk_words), WORDS_PER_SEGMENT):
+            segment_words = chunk_words[i : i + WORDS_PER_SEGMENT]
+            segments.append({
+                "id": len(segments),
+                "seek": 0,
+                "start": segment_words[0]["start"],
+                "end": segment_words[-1]["end"],
+                "text": "".join(word["word"] for word in segment_words),
+                "words": segment_words,
+            })
+        return {
+            "text": "".join(word["word"] for word in chunk_words),
+            "segments": segments,
+            "language": "en",
+        }
+
+    return transcribe_chunk
+
+
+def get_words(transcription: dict) -> list:
+    return [word for segment in transcription["segments"] for word in segment["words"]]
+
+
+def test_split_points_fall_between_words():
+    audio, words = generate_speech(3.5 * TARGET_CHUNK_SEC, seed=1)
+
+    split_points = find_split_points(audio, TARGET_CHUNK_SEC)
+
+    assert len(split_points) >= 2
+    assert split_points == sorted(split_points)
+    for split_point in split_points:
+        split_sec = split_point / SAMPLE_RATE
+        assert not any(word["start"] < split_sec < word["end"] for word in words)
+
+
+def test_transcribe_chunked_stitches_chunk_edges(monkeypatch):
+    # the last chunk is a partial one
+    audio, words = generate_speech(3.5 * TARGET_CHUNK_SEC, seed=2)
+    chunks = []
+    monkeypatch.setattr(
+        chunked_transcription, "transcribe_chunk", make_stub_transcriber(audio, words, chunks)
+    )
+
+    transcription = transcribe_chunked(audio, workers=1, target_chunk_sec=TARGET_CHUNK_SEC)
+
+    assert len(chunks) >= 3
+    last_offset_sec, last_duration_sec = chunks[-1]
+    assert last_offset_sec + last_duration_sec == len(audio) / SAMPLE_RATE
+    assert last_duration_sec < TARGET_CHUNK_SEC
+
+    # every word exactly once and in order, none dropped or duplicated at the edges
+    stitched_words = get_words(transcription)
+    assert [word["word"] for word in stitched_words] == [word["word"] for word in words]
+    assert transcription["text"] == "".join(word["word"] for word in words)
+    assert [segment["id"] for segment in transcription["segments"]] == list(
+        range(len(transcription["segments"]))
+    )
+
+    # starts never decrease and stay inside the chunk the word was heard in
+    starts = [word["start"] for word in stitched_words]
+    assert starts == sorted(starts)
+    prev_end = 0.0
+    for word, stitched_word in zip(words, stitched_words):
+        offset_sec, duration_sec = next(
+            (offset_sec, duration_sec)
+            for offset_sec, duration_sec in chunks
+            if offset_sec <= (word["start"] + word["end"]) / 2 < offset_sec + duration_sec
+        )
+        assert stitched_word["start"] == pytest.approx(min(
+            max(word["start"] - STUB_START_JITTER_SEC, offset_sec, prev_end),
+            offset_sec + duration_sec,
+        ))
+        assert prev_end <= stitched_word["start"] <= stitched_word["end"]
+        prev_end = stitched_word["end"]
+    assert prev_end <= len(audio) / SAMPLE_RATE
+
+    for segment in transcription["segments"]:
+        assert segment["start"] == segment["words"][0]["start"]
+        assert segment["end"] == segment["words"][-1]["end"]
+
+
+def test_stitch_clamps_overlapping_timestamps():
+    # the first chunk reports a word past its end, the second one before its start
+    transcriptions = [
+        {
+            "text": " a b",
+            "language": "en",
+            "segments": [{
+                "id": 0, "seek": 0, "start": 8.0, "end": 10.6, "text": " a b",
+                "words": [
+                    {"word": " a", "start": 8.0, "end": 9.0},
+                    {"word": " b", "start": 9.5, "end": 10.6},
+                ],
+            }],
+        },
+        {
+            "text": " c d",
+            "language": "en",
+            "segments": [
+                {
+                    "id": 0, "seek": 0, "start": -0.4, "end": 1.0, "text": " c",
+                    "words": [{"word": " c", "start": -0.4, "end": 1.0}],
+                },
+                {"id": 1, "seek": 100, "start": 1.0, "end": 2.0, "text": " d", "words": []},
+            ],
+        },
+    ]
+
+    transcription = stitch_transcriptions(transcriptions, [0.0, 10.0], [10.0, 5.0])
+
+    words = get_words(transcription)
+    assert [word["word"] for word in words] == [" a", " b", " c"]
+    assert words[1]["end"] == 10.0
+    assert words[2]["start"] == 10.0
+    assert [segment["id"] for segment in transcription["segments"]] == [0, 1, 2]
+    assert transcription["segments"][2]["start"] == 11.0
+    assert transcription["segments"][2]["seek"] == 100 + 10 * chunked_transcription.MEL_FRAMES_PER_SEC
+    assert transcription["text"] == " a b c d"
@@ -0,0 +1,144 @@
+import os
+import numpy as np
+import embedding_cache
+from embedding_cache import EmbeddingCache, INDEX_FILE_NAME, SHARD_MIN_ROWS
+
+MODEL_NAME = "test-model"
+DIMENSIONS = 8
+
+
+def make_vectors(count: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(count, DIMENSIONS)).astype(np.float32)
+
+
+def test_hits_are_the_float16_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 10**8)
+    vectors = make_vectors(3, seed=0)
+
+    cache.put(MODEL_NAME, ["a", "b", "c"], vectors)
+    res = cache.get(MODEL_NAME, ["b", "missing", "a"])
+
+    assert res[1] is None
+    assert np.array_equal(res[0], vectors[1].astype(np.float16).astype(np.float32))
+    assert np.array_equal(res[2], vectors[0].astype(np.float16).astype(np.float32))
+
+
+def test_processes_sharing_a_directory_keep_each_others_entries(tmp_path):
+    # every instance keeps its own index in memory, like separate processes
+    cache1 = EmbeddingCache(str(tmp_path), 10**8)
+    cache2 = EmbeddingCache(str(tmp_path), 10**8)
+    cache1.get(MODEL_NAME, ["a"])
+    cache2.get(MODEL_NAME, ["b"])
+
+    cache1.put(MODEL_NAME, ["a"], make_vectors(1, seed=1))
+    cache2.put(MODEL_NAME, ["b"], make_vectors(1, seed=2))
+    cache1.flush()
+    cache2.flush()
+
+    cache3 = EmbeddingCache(str(tmp_path), 10**8)
+    for cache in (cache1, cache2, cache3):
+        assert all(vector is not None for vector in cache.get(MODEL_NAME, ["a", "b"]))
+
+
+def test_read_hit_does_not_rewrite_the_index(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 10**8)
+    cache.put(MODEL_NAME, ["a"], make_vectors(1, seed=0))
+    cache.flush()
+    index_path = os.path.join(tmp_path, INDEX_FILE_NAME)
+    index_mtime_ns = os.stat(index_path).st_mtime_ns
+
+    assert cache.get(MODEL_NAME, ["a"])[0] is not None
+    assert os.stat(index_path).st_mtime_ns == index_mtime_ns
+
+
+def test_orphan_shards_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 10**8)
+    # a shard whose writer died before it saved the index
+    orphan_path = os.path.join(tmp_path, "shard_1_999999.npy")
+    np.save(orphan_path, make_vectors(10, seed=0).astype(np.float16))
+
+    cache.put(MODEL_NAME, ["a"], make_vectors(1, seed=1))
+    cache.flush()
+
+    assert not os.path.exists(orphan_path)
+    assert cache.get(MODEL_NAME, ["a"])[0] is not None
+
+
+def test_least_recently_used_shards_are_evicted(tmp_path, monkeypatch):
+    # evict on every flush
+    monkeypatch.setattr(embedding_cache, "EVICT_FRACTION", 0)
+    shard_bytes = 128 + DIMENSIONS * 2
+    cache = EmbeddingCache(str(tmp_path), 2 * shard_bytes)
+    cache.put(MODEL_NAME, ["a"], make_vectors(1, seed=0))
+    cache.flush()
+    cache.put(MODEL_NAME, ["b"], make_vectors(1, seed=1))
+    cache.flush()
+    shard_paths = sorted(
+        os.path.join(tmp_path, name) for name in os.listdir(tmp_path) if name.endswith(".npy")
+    )
+    # "a" is older than "b" but was just read
+    os.utime(shard_paths[0], (1, 1))
+    os.utime(shard_paths[1], (2, 2))
+    cache.get(MODEL_NAME, ["a"])
+
+    cache.put(MODEL_NAME, ["c"], make_vectors(1, seed=2))
+    cache.flush()
+
+    res = cache.get(MODEL_NAME, ["a", "b", "c"])
+    assert res[0] is not None
+    assert res[1] is None
+    assert res[2] is not None
+
+
+def count_shards(cache_dir) -> int:
+    return len([name for name in os.listdir(cache_dir) if name.endswith(".npy")])
+
+
+def test_small_puts_are_written_as_one_shard(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 10**8)
+    vectors = make_vectors(SHARD_MIN_ROWS, seed=0)
+
+    for i in range(SHARD_MIN_ROWS - 1):
+        cache.put(MODEL_NAME, [f"text {i}"], vectors[i : i + 1])
+    # pending vectors are read back in the same process
+    assert cache.get(MODEL_NAME, ["text 0"])[0] is not None
+    assert count_shards(tmp_path) == 0
+
+    cache.put(MODEL_NAME, [f"text {SHARD_MIN_ROWS - 1}"], vectors[-1:])
+
+    assert count_shards(tmp_path) == 1
+    res = EmbeddingCache(str(tmp_path), 10**8).get(
+        MODEL_NAME, [f"text {i}" for i in range(SHARD_MIN_ROWS)]
+    )
+    assert np.array_equal(np.stack(res), vectors.astype(np.float16).astype(np.float32))
+
+
+def test_old_pending_vectors_are_written_on_the_next_put(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "PENDING_MAX_SEC", 0)
+    cache = EmbeddingCache(str(tmp_path), 10**8)
+
+    cache.put(MODEL_NAME, ["a"], make_vectors(1, seed=0))
+
+    assert EmbeddingCache(str(tmp_path), 10**8).get(MODEL_NAME, ["a"])[0] is not None
+
+
+def test_eviction_scans_the_directory_periodically(tmp_path, monkeypatch):
+    scans = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        scans.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(embedding_cache.os, "scandir", counting_scandir)
+    monkeypatch.setattr(embedding_cache, "EVICT_FRACTION", 0.2)
+    shard_bytes = 128 + SHARD_MIN_ROWS * DIMENSIONS * 2
+    cache = EmbeddingCache(str(tmp_path), 25 * shard_bytes)
+
+    for i in range(30):
+        texts = [f"text {i} {k}" for k in range(SHARD_MIN_ROWS)]
+        cache.put(MODEL_NAME, texts, make_vectors(SHARD_MIN_ROWS, seed=i))
+
+    # the first flush and then every 5 shards after it
+    assert len(scans) == 1 + (30 - 1) // 5
+    assert count_shards(tmp_path) <= 25 + 5
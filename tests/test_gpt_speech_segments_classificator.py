@@ -0,0 +1,368 @@
+import json
+import asyncio
+import numpy as np
+import pytest
+import gpt_speech_segments_classificator
+from gpt_speech_segments_classificator import GPTSpeechSegmentsClassificator, estimate_tokens
+from llm_response_cache import LLMResponseCache
+from speech_segment import SpeechSegment
+from conftest import REPO_DIR
+
+SEGMENTS_COUNT = 30
+OFF_TOPIC = {3, 4, 5, 17, 25}
+# transcript tokens per window, about five segments
+WINDOW_TRANSCRIPT_TOKENS = 60
+
+
+def make_speech_segments() -> list:
+    res = []
+    for i in range(SEGMENTS_COUNT):
+        segment = SpeechSegment()
+        segment.start_time_sec = i * 5.0
+        segment.end_time_sec = i * 5.0 + 4.5
+        topic = "cricket match scores" if i in OFF_TOPIC else "linear equations"
+        segment.text = f"sentence {i:02d} about {topic}"
+        res.append(segment)
+    return res
+
+
+def get_transcript_lines(body: dict) -> list:
+    prompt = body["messages"][0]["content"]
+    return prompt.split("The transcript is below:")[-1].strip().splitlines()
+
+
+def answer_off_topic(body: dict) -> str:
+    # window line numbers start from 0
+    lines = get_transcript_lines(body)
+    return json.dumps({
+        "chapter": "Linear Equations",
+        "off_topic": [n for n, line in enumerate(lines) if "cricket" in line],
+    })
+
+
+def window_contains(body: dict, i: int) -> bool:
+    return any(f"sentence {i:02d} " in line for line in get_transcript_lines(body))
+
+
+@pytest.fixture
+def classificator_env(fake_openai, monkeypatch, tmp_path):
+    monkeypatch.chdir(REPO_DIR)
+    monkeypatch.setattr(gpt_speech_segments_classificator, "open_ai_client_pool", fake_openai.pool)
+    monkeypatch.setattr(gpt_speech_segments_classificator, "OPEN_AI_MODEL", "test")
+    monkeypatch.setattr(gpt_speech_segments_classificator, "GPT_COMPACT_RESPONSES", True)
+    monkeypatch.setattr(gpt_speech_segments_classificator, "OUTPUT_DIR", str(tmp_path / "results"))
+    monkeypatch.setattr(
+        gpt_speech_segments_classificator,
+        "llm_response_cache",
+        LLMResponseCache(str(tmp_path / "llm_cache"), 10**8, 3600),
+    )
+    with open(gpt_speech_segments_classificator.COMPACT_OFF_TOPIC_PROMPT_FILE_PATH) as f:
+        prompt_tokens = estimate_tokens(f.read())
+    monkeypatch.setattr(
+        gpt_speech_segments_classificator,
+        "GPT_WINDOW_TOKENS",
+        prompt_tokens + WINDOW_TRANSCRIPT_TOKENS,
+    )
+    fake_openai.respond = answer_off_topic
+    return fake_openai
+
+
+def get_off_topic(speech_segments: list) -> set:
+    return {i for i, segment in enumerate(speech_segments) if segment.relevance_score_gpt == 0}
+
+
+def test_classify_all_windows_succeed(classificator_env):
+    speech_segments = make_speech_segments()
+    classificator = GPTSpeechSegmentsClassificator()
+
+    classificator.classify(speech_segments, "10", "Math")
+
+    assert len(classificator_env.requests) > 1
+    assert get_off_topic(speech_segments) == OFF_TOPIC
+    assert not classificator.degraded
+
+
+class LoopRecordingCache(LLMResponseCache):
+    """Records whether every call runs on an event loop thread."""
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+        self.on_loop = []
+
+    def get(self, key: str):
+        self.on_loop.append(is_on_loop())
+        return super().get(key)
+
+    def put(self, key: str, response) -> None:
+        self.on_loop.append(is_on_loop())
+        super().put(key, response)
+
+
+def is_on_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def test_cache_io_does_not_block_the_shared_loop(classificator_env, monkeypatch, tmp_path):
+    cache = LoopRecordingCache(str(tmp_path / "llm_cache"), 10**8, 3600)
+    monkeypatch.setattr(gpt_speech_segments_classificator, "llm_response_cache", cache)
+
+    GPTSpeechSegmentsClassificator().classify(make_speech_segments(), "10", "Math")
+
+    windows_count = len(classificator_env.requests)
+    # a get and a put per window
+    assert len(cache.on_loop) == 2 * windows_count
+    assert not any(cache.on_loop)
+
+
+def test_classify_one_failed_window(classificator_env, monkeypatch):
+    # no context segments, so exactly one window sees segment 17
+    monkeypatch.setattr(gpt_speech_segments_classificator, "GPT_WINDOW_OVERLAP_SEGMENTS", 0)
+
+    def respond(body):
+        if window_contains(body, 17):
+            return 400, "bad request", {}
+        return answer_off_topic(body)
+
+    classificator_env.respond = respond
+    speech_segments = make_speech_segments()
+    classificator = GPTSpeechSegmentsClassificator()
+
+    classificator.classify(speech_segments, "10", "Math")
+
+    assert classificator.degraded
+    # the failed window keeps the default, the others are classified
+    assert get_off_topic(speech_segments) == OFF_TOPIC - {17}
+
+
+@pytest.mark.parametrize("malformed", ["{not json", json.dumps({"off_topic": [999]})])
+def test_classify_malformed_response(classificator_env, monkeypatch, malformed):
+    monkeypatch.setattr(gpt_speech_segments_classificator, "GPT_WINDOW_OVERLAP_SEGMENTS", 0)
+
+    def respond(body):
+        if window_contains(body, 25):
+            return malformed
+        return answer_off_topic(body)
+
+    classificator_env.respond = respond
+    speech_segments = make_speech_segments()
+    classificator = GPTSpeechSegmentsClassificator()
+
+    classificator.classify(speech_segments, "10", "Math")
+
+    assert classificator.degraded
+    assert get_off_topic(speech_segments) == OFF_TOPIC - {25}
+
+    # the malformed response is not cached, only its window is sent again
+    requests_count = len(classificator_env.requests)
+    classificator_env.respond = answer_off_topic
+    speech_segments = make_speech_segments()
+    classificator = GPTSpeechSegmentsClassificator()
+
+    classificator.classify(speech_segments, "10", "Math")
+
+    assert len(classificator_env.requests) == requests_count + 1
+    assert get_off_topic(speech_segments) == OFF_TOPIC
+    assert not classificator.degraded
+
+
+def test_classify_all_windows_fail(classificator_env):
+    classificator_env.respond = lambda body: "{not json"
+    classificator = GPTSpeechSegmentsClassificator()
+
+    with pytest.raises(Exception):
+        classificator.classify(make_speech_segments(), "10", "Math")
+    assert classificator.degraded
+
+
+def test_speech_segments_classificator_reports_degraded(classificator_env, monkeypatch):
+    from speech_segments_classificator import SpeechSegmentsClassificator
+
+    monkeypatch.setattr(gpt_speech_segments_classificator, "GPT_WINDOW_OVERLAP_SEGMENTS", 0)
+
+    def respond(body):
+        if '"groups"' in body["messages"][0]["content"]:
+            lines = get_transcript_lines(body)
+            return json.dumps({"groups": [
+                {"group_number": n, "book": "Math", "chapter": "Linear Equations", "probability": 1.0}
+                for n in range(len(lines))
+            ]})
+        if window_contains(body, 17):
+            return "{not json"
+        return answer_off_topic(body)
+
+    classificator_env.respond = respond
+    classificator = SpeechSegmentsClassificator(make_speech_segments(), "10", "Math", use_gpt=True)
+
+    classificator.classify()
+
+    assert not classificator.gpt_failed
+    assert classificator.gpt_degraded
+
+
+def test_gpt_job_does_not_load_the_embedding_model(classificator_env, monkeypatch):
+    import speech_segments_classificator
+    from speech_segments_classificator import SpeechSegmentsClassificator
+
+    def fail(text):
+        raise AssertionError("the embedding model is loaded")
+
+    monkeypatch.setattr(speech_segments_classificator, "SimilarityEstimator", fail)
+    classificator_env.respond = lambda body: (
+        json.dumps({"groups": []})
+        if '"groups"' in body["messages"][0]["content"]
+        else answer_off_topic(body)
+    )
+    speech_segments = make_speech_segments()
+    classificator = SpeechSegmentsClassificator(speech_segments, "10", "Math", use_gpt=True)
+
+    classificator.classify()
+
+    assert not classificator.gpt_failed
+    assert [segment.is_relevant for segment in speech_segments] == [
+        i not in OFF_TOPIC for i in range(SEGMENTS_COUNT)
+    ]
+
+
+class FakeSimilarityEstimator:
+    """Relevance scores from the segment text: 0.9 on topic, 0.1 off topic, 0.5 uncertain."""
+
+    def __init__(self, text: str) -> None:
+        pass
+
+    def get_embeddings(self, texts: list) -> np.ndarray:
+        scores = np.array([get_fake_score(text) for text in texts], dtype=np.float32)
+        return np.stack([scores, np.sqrt(1 - scores**2)], axis=1)
+
+    def score_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
+        return embeddings[:, 0]
+
+
+def get_fake_score(text: str) -> float:
+    if "maybe" in text:
+        return 0.5
+    return 0.1 if "cricket" in text else 0.9
+
+
+def make_tiered_speech_segments() -> list:
+    speech_segments = make_speech_segments()
+    # GPT decides these, 17 is off topic
+    for i in (10, 17, 18):
+        speech_segments[i].text += " maybe"
+    return speech_segments
+
+
+def answer_combined(body: dict) -> str:
+    lines = get_transcript_lines(body)
+    return json.dumps({
+        "chapters": [{
+            "start": 0, "end": len(lines) - 1, "book": "Math", "chapter": "Linear Equations",
+            "probability": 0.8,
+        }],
+        "off_topic": [n for n, line in enumerate(lines) if "cricket" in line],
+    })
+
+
+@pytest.fixture
+def tiered_env(classificator_env, monkeypatch):
+    import speech_segments_classificator
+
+    monkeypatch.setattr(speech_segments_classificator, "SimilarityEstimator", FakeSimilarityEstimator)
+    monkeypatch.setattr(speech_segments_classificator, "TIER_CONTEXT_SEGMENTS", 1)
+    classificator_env.respond = answer_combined
+    return classificator_env
+
+
+def test_tiered_sends_escalated_segments_in_context_once(tiered_env):
+    from speech_segments_classificator import SpeechSegmentsClassificator
+
+    speech_segments = make_tiered_speech_segments()
+    classificator = SpeechSegmentsClassificator(
+        speech_segments, "10", "Math", use_gpt=True, gpt_combined_mode=True, tiered_classification=True
+    )
+
+    merged_speech_segments = classificator.classify()
+
+    # one combined round trip, no separate syllabus prompt with the whole transcript
+    sent_lines = [line for body in tiered_env.requests for line in get_transcript_lines(body)]
+    assert all('"chapters"' in body["messages"][0]["content"] for body in tiered_env.requests)
+    sent = {int(line.split("sentence ")[1][:2]) for line in sent_lines}
+    assert sent == {9, 10, 11, 16, 17, 18, 19}
+
+    assert classificator.escalated_fraction == pytest.approx(3 / SEGMENTS_COUNT)
+    assert [speech_segments[i].is_relevant for i in (10, 17, 18)] == [True, False, True]
+    assert all(
+        segment.syllabus_classification == "Math - Linear Equations"
+        for segment in merged_speech_segments
+    )
+
+
+def test_tiered_reports_no_escalation_after_gpt_failure(tiered_env):
+    from speech_segments_classificator import SpeechSegmentsClassificator
+
+    tiered_env.respond = lambda body: "{not json"
+    classificator = SpeechSegmentsClassificator(
+        make_tiered_speech_segments(),
+        "10",
+        "Math",
+        use_gpt=True,
+        gpt_combined_mode=True,
+        tiered_classification=True,
+    )
+
+    classificator.classify()
+
+    assert classificator.gpt_failed
+    assert classificator.escalated_fraction is None
+
+
+def test_gpt_setup_error_falls_back_to_embeddings(tiered_env, monkeypatch):
+    import speech_segments_classificator
+    from speech_segments_classificator import SpeechSegmentsClassificator
+
+    def fail():
+        raise Exception("OPEN_AI_API_KEY is not set")
+
+    monkeypatch.setattr(speech_segments_classificator, "GPTSpeechSegmentsClassificator", fail)
+    classificator = SpeechSegmentsClassificator(make_speech_segments(), "10", "Math", use_gpt=True)
+
+    merged_speech_segments = classificator.classify()
+
+    assert classificator.gpt_failed
+    assert not classificator.gpt_degraded
+    assert len(merged_speech_segments) > 0
+    assert len(tiered_env.requests) == 0
+
+
+@pytest.mark.parametrize("malformed_chapter", [
+    {"start": 0, "end": 1, "chapter": "Linear Equations"},
+    {"start": 0, "end": 1, "book": "Math"},
+    {"start": True, "end": 1, "book": "Math", "chapter": "Linear Equations"},
+    {"start": 0, "end": 1, "book": "Math", "chapter": "Linear Equations", "probability": "high"},
+])
+def test_malformed_chapter_leaves_the_window_untouched(classificator_env, monkeypatch, malformed_chapter):
+    monkeypatch.setattr(gpt_speech_segments_classificator, "GPT_WINDOW_OVERLAP_SEGMENTS", 0)
+
+    def respond(body):
+        if window_contains(body, 17):
+            lines = get_transcript_lines(body)
+            return json.dumps({
+                "chapters": [malformed_chapter],
+                "off_topic": [n for n, line in enumerate(lines) if "cricket" in line],
+            })
+        return answer_combined(body)
+
+    classificator_env.respond = respond
+    speech_segments = make_speech_segments()
+    classificator = GPTSpeechSegmentsClassificator()
+
+    classificator.classify_combined(speech_segments, "10", "Math")
+
+    assert classificator.degraded
+    # neither the off-topic answer nor a chapter of the failed window is applied
+    assert get_off_topic(speech_segments) == OFF_TOPIC - {17}
+    assert speech_segments[17].syllabus_classification is None
+    assert speech_segments[0].syllabus_classification == "Math - Linear Equations"
@@ -0,0 +1,74 @@
+import io
+import json
+import random
+import pytest
+from json_stream_reader import JsonStreamReader
+
+
+class ChunkedFile:
+    """Returns the text in chunks of the given sizes, whatever size is asked."""
+
+    def __init__(self, text: str, chunk_sizes) -> None:
+        self.__text = text
+        self.__chunk_sizes = iter(chunk_sizes)
+        self.__pos = 0
+
+    def read(self, size: int) -> str:
+        chunk_size = next(self.__chunk_sizes, size)
+        chunk = self.__text[self.__pos : self.__pos + chunk_size]
+        self.__pos += len(chunk)
+        return chunk
+
+
+def read_array(text: str, key: str, chunk_sizes) -> list:
+    return list(JsonStreamReader(ChunkedFile(text, chunk_sizes)).iter_array(key))
+
+
+def make_item(rng: random.Random):
+    kind = rng.randrange(4)
+    if kind == 0:
+        return rng.randrange(-10**6, 10**6)
+    if kind == 1:
+        return rng.uniform(-1000, 1000) * 10 ** rng.randrange(-30, 30)
+    if kind == 2:
+        return {"start": rng.uniform(0, 100), "text": "a \"quoted\" \\ word", "ok": True}
+    return [rng.random(), None, False, "x"]
+
+
+@pytest.mark.parametrize("text, chunk_sizes", [
+    ('{"segments": [12.5, 3]}', [16]),      # cut after "12"
+    ('{"segments": [12.5, 3]}', [17]),      # cut after "12."
+    ('{"segments": [1e-07, 3]}', [16]),     # cut after "1e"
+    ('{"segments": [1e-07, 3]}', [17]),     # cut after "1e-"
+    ('{"segments": [-5]}', [15]),           # cut after "-"
+    ('{"segments": [2.5]}', [16, 1, 1]),    # cut after "2.", the number ends the array
+])
+def test_number_split_at_chunk_boundary(text, chunk_sizes):
+    assert read_array(text, "segments", chunk_sizes) == json.loads(text)["segments"]
+
+
+def test_random_chunk_sizes_match_json_loads():
+    rng = random.Random(0)
+    for _ in range(1000):
+        data = {
+            "text": "skipped " * rng.randrange(3),
+            "language": "en",
+            "segments": [make_item(rng) for _ in range(rng.randrange(8))],
+            "duration": rng.random(),
+        }
+        text = json.dumps(data, indent=rng.choice([None, 2]))
+        chunk_sizes = [rng.randrange(1, 12) for _ in range(len(text))]
+
+        assert read_array(text, "segments", chunk_sizes) == data["segments"]
+
+
+def test_other_keys_are_skipped_and_a_missing_key_yields_nothing():
+    text = '{"a": {"b": [1, "]}"]}, "n": -1.5e3, "t": true, "segments": []}'
+
+    assert read_array(text, "segments", [3] * len(text)) == []
+    assert read_array(text, "missing", [3] * len(text)) == []
+
+
+def test_truncated_stream_raises():
+    with pytest.raises(Exception):
+        list(JsonStreamReader(io.StringIO('{"segments": [1, {"a": ')).iter_array("segments"))
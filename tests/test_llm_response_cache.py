@@ -0,0 +1,59 @@
+import os
+import json
+import llm_response_cache
+from llm_response_cache import LLMResponseCache
+
+ENTRY_BYTES = 1000
+
+
+def get_entry_bytes(cache_dir) -> int:
+    return sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+
+
+def count_scans(monkeypatch) -> list:
+    scans = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        scans.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(llm_response_cache.os, "scandir", counting_scandir)
+    return scans
+
+
+def test_put_evicts_periodically_not_on_every_put(tmp_path, monkeypatch):
+    scans = count_scans(monkeypatch)
+    max_bytes = 100 * ENTRY_BYTES
+    cache = LLMResponseCache(str(tmp_path), max_bytes, 3600)
+
+    for i in range(300):
+        cache.put(f"key{i}", "x" * ENTRY_BYTES)
+
+    # the first put and then about every 5 entries
+    assert 1 < len(scans) < 300 / 4
+    slack_bytes = max_bytes * llm_response_cache.LLM_CACHE_EVICT_FRACTION + 2 * ENTRY_BYTES
+    assert get_entry_bytes(tmp_path) <= max_bytes + slack_bytes
+    # the most recent entries are kept
+    assert cache.get("key299") == "x" * ENTRY_BYTES
+    assert cache.get("key0") is None
+
+
+def test_first_put_evicts_entries_of_earlier_processes(tmp_path):
+    for i in range(10):
+        with open(tmp_path / f"old{i}.json", "w") as f:
+            json.dump({"created": 0, "response": "x" * ENTRY_BYTES}, f)
+        os.utime(tmp_path / f"old{i}.json", (1, 1))
+    cache = LLMResponseCache(str(tmp_path), 3 * ENTRY_BYTES, 10**10)
+
+    cache.put("new", "y")
+
+    assert cache.get("new") == "y"
+    assert get_entry_bytes(tmp_path) <= 3 * ENTRY_BYTES
+
+
+def test_refresh_ignores_cached_responses(tmp_path):
+    LLMResponseCache(str(tmp_path), 10**8, 3600).put("a", {"off_topic": []})
+
+    assert LLMResponseCache(str(tmp_path), 10**8, 3600).get("a") == {"off_topic": []}
+    assert LLMResponseCache(str(tmp_path), 10**8, 3600, refresh=True).get("a") is None
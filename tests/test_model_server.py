@@ -0,0 +1,164 @@
+import os
+import stat
+import time
+import threading
+from multiprocessing import AuthenticationError
+import numpy as np
+import pytest
+import model_registry
+from model_server import ModelServer, EmbeddingBatcher
+from model_registry import (
+    ModelRegistry,
+    register_remote_models,
+    SIMILARITY_MODEL,
+    SENTENCE_SIMILARITY_MODEL,
+)
+from model_server_client import (
+    ModelServerClient,
+    RemoteSimilarityModel,
+    RemoteWhisperModel,
+    get_authkey_path,
+)
+
+
+class FakeSimilarityModel:
+    def encode(self, texts: list, batch_size: int, max_length: int) -> dict:
+        return {"dense_vecs": np.array([[len(text), i] for i, text in enumerate(texts)])}
+
+
+class FakeWhisperModel:
+    """Records how many transcriptions run at once over all instances."""
+
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def transcribe(self, audio, **kwargs) -> dict:
+        with FakeWhisperModel.lock:
+            FakeWhisperModel.active += 1
+            FakeWhisperModel.max_active = max(FakeWhisperModel.max_active, FakeWhisperModel.active)
+        time.sleep(0.3)
+        with FakeWhisperModel.lock:
+            FakeWhisperModel.active -= 1
+        return {"text": f"{len(audio)} samples", "kwargs": kwargs}
+
+
+def start_server(socket_path: str, **kwargs) -> str:
+    threading.Thread(target=ModelServer(socket_path, **kwargs).serve_forever, daemon=True).start()
+    # the socket path appears before the server accepts, wait for a served request
+    for _ in range(100):
+        try:
+            ModelServerClient(socket_path).request("stats")
+            return socket_path
+        except OSError:
+            time.sleep(0.05)
+    raise Exception("model server did not start")
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_registry, "load_similarity_model", FakeSimilarityModel)
+    monkeypatch.setattr(model_registry, "load_whisper_model", FakeWhisperModel)
+    FakeWhisperModel.max_active = 0
+    return start_server(str(tmp_path / "model_server.sock"))
+
+
+def get_mode(path: str) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_socket_and_key_file_are_private(socket_path):
+    assert get_mode(socket_path) == 0o600
+    assert get_mode(os.path.dirname(os.path.realpath(socket_path))) == 0o700
+    assert get_mode(get_authkey_path(socket_path)) == 0o600
+
+
+def test_encode_round_trip(socket_path):
+    texts = ["linear", "equations", "x" * 100]
+
+    res = RemoteSimilarityModel(ModelServerClient(socket_path)).encode(texts, 16, 512)
+
+    expected = FakeSimilarityModel().encode(texts, 16, 512)["dense_vecs"]
+    assert res["dense_vecs"].dtype == np.float32
+    assert res["dense_vecs"].tolist() == expected.tolist()
+
+
+def test_concurrent_transcriptions_use_separate_instances(socket_path):
+    results = []
+
+    def transcribe():
+        # every worker thread has its own connection
+        model = RemoteWhisperModel(ModelServerClient(socket_path))
+        results.append(model.transcribe(np.zeros(16000), language="en"))
+
+    threads = [threading.Thread(target=transcribe) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [{"text": "16000 samples", "kwargs": {"language": "en"}}] * 3
+    # two instances by default, the third job waits for one of them
+    assert FakeWhisperModel.max_active == 2
+
+
+def test_warm_up_skips_models_the_registry_does_not_have():
+    registry = ModelRegistry()
+    # the client connects on the first request only
+    register_remote_models(registry, "/nonexistent/model_server.sock")
+
+    registry.warm_up([SENTENCE_SIMILARITY_MODEL])
+
+    assert not registry.is_loaded(SENTENCE_SIMILARITY_MODEL)
+
+
+def test_client_with_the_key_file_is_served(socket_path):
+    client = ModelServerClient(socket_path)
+
+    assert isinstance(client.request("stats"), dict)
+
+
+def test_client_with_a_wrong_key_is_refused(socket_path):
+    client = ModelServerClient(socket_path, authkey=b"wrong")
+
+    with pytest.raises(AuthenticationError):
+        client.request("stats")
+    # the server keeps serving
+    assert isinstance(ModelServerClient(socket_path).request("stats"), dict)
+
+
+class RecordingSimilarityModel:
+    def __init__(self) -> None:
+        self.calls = []
+
+    def encode(self, texts: list, batch_size: int, max_length: int) -> dict:
+        self.calls.append((list(texts), batch_size, max_length))
+        return {"dense_vecs": np.array([[len(text), batch_size] for text in texts], dtype=np.float32)}
+
+
+def test_batcher_keeps_the_batch_size_of_every_length_bucket():
+    model = RecordingSimilarityModel()
+    registry = ModelRegistry()
+    registry.register(SIMILARITY_MODEL, lambda: model)
+    batcher = EmbeddingBatcher(registry)
+    requests = [(["a", "bb"], 128), (["ccc"], 128), (["d" * 5000], 4)]
+    results = [None] * len(requests)
+
+    def encode(i):
+        texts, batch_size = requests[i]
+        results[i] = batcher.encode(texts, batch_size, 8192)
+
+    threads = [threading.Thread(target=encode, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # a long text bucket never runs with the batch size of a short one
+    batch_sizes = {text: batch_size for texts, batch_size in requests for text in texts}
+    for texts, batch_size, max_length in model.calls:
+        assert all(batch_sizes[text] == batch_size for text in texts)
+        assert max_length == 8192
+    assert sorted(text for texts, _, _ in model.calls for text in texts) == sorted(batch_sizes)
+    for (texts, batch_size), result in zip(requests, results):
+        assert result.tolist() == [[len(text), batch_size] for text in texts]
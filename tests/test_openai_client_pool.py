@@ -0,0 +1,172 @@
+import time
+import json
+import asyncio
+import threading
+import openai
+import pytest
+import openai_client_pool
+from openai_client_pool import RateLimiter
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+def run_concurrently(pool, count: int) -> list:
+    async def run_all():
+        return await asyncio.gather(
+            *[pool.chat_completion(10, model="test", messages=MESSAGES) for _ in range(count)]
+        )
+
+    return pool.run(run_all())
+
+
+def get_content(response) -> dict:
+    return json.loads(response.choices[0].message.content)
+
+
+def test_concurrent_calls_share_the_connection_limit(fake_openai, monkeypatch):
+    monkeypatch.setattr(openai_client_pool, "OPEN_AI_MAX_CONNECTIONS", 2)
+
+    def respond(body):
+        time.sleep(0.1)
+        return json.dumps({"ok": True})
+
+    fake_openai.respond = respond
+    results = []
+    # callers on several threads, like concurrent jobs
+    threads = [
+        threading.Thread(target=lambda: results.extend(run_concurrently(fake_openai.pool, 4)))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8
+    assert all(get_content(response) == {"ok": True} for response in results)
+    assert len(fake_openai.requests) == 8
+    assert fake_openai.max_active == 2
+
+
+def test_rate_limit_response_is_retried_after_the_requested_delay(fake_openai):
+    attempts = []
+
+    def respond(body):
+        attempts.append(time.monotonic())
+        if len(attempts) <= 2:
+            return 429, "rate limited", {"retry-after-ms": "200"}
+        return json.dumps({"ok": True})
+
+    fake_openai.respond = respond
+
+    [response] = run_concurrently(fake_openai.pool, 1)
+
+    assert get_content(response) == {"ok": True}
+    assert fake_openai.pool.retries == 2
+    assert len(attempts) == 3
+    assert attempts[1] - attempts[0] >= 0.2
+    assert attempts[2] - attempts[1] >= 0.2
+
+
+def test_rate_limit_pauses_every_caller(fake_openai):
+    attempts = []
+    lock = threading.Lock()
+
+    def respond(body):
+        with lock:
+            attempts.append(time.monotonic())
+            first = len(attempts) == 1
+        if first:
+            return 429, "rate limited", {"retry-after": "1"}
+        return json.dumps({"ok": True})
+
+    fake_openai.respond = respond
+    start = time.monotonic()
+    pool = fake_openai.pool
+
+    async def run():
+        first = asyncio.ensure_future(pool.chat_completion(10, model="test", messages=MESSAGES))
+        # sent while the first request is paused
+        await asyncio.sleep(0.3)
+        await pool.chat_completion(10, model="test", messages=MESSAGES)
+        await first
+
+    pool.run(run())
+
+    assert len(attempts) == 3
+    assert all(attempt - start >= 1.0 for attempt in attempts[1:])
+
+
+def test_transient_errors_back_off_and_client_errors_do_not(fake_openai, monkeypatch):
+    monkeypatch.setattr(openai_client_pool, "BACKOFF_BASE_SEC", 0.01)
+    statuses = [503, 503]
+    fake_openai.respond = lambda body: (
+        (statuses.pop(), "unavailable", {}) if statuses else json.dumps({"ok": True})
+    )
+
+    [response] = run_concurrently(fake_openai.pool, 1)
+
+    assert get_content(response) == {"ok": True}
+    assert fake_openai.pool.retries == 2
+
+    fake_openai.respond = lambda body: (400, "bad request", {})
+    with pytest.raises(openai.BadRequestError):
+        run_concurrently(fake_openai.pool, 1)
+    assert fake_openai.pool.retries == 2
+
+
+def test_rate_limiter_holds_requests_per_minute():
+    async def run():
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=10**9)
+        start = time.monotonic()
+        # the bucket starts full
+        for _ in range(600):
+            await limiter.acquire(1)
+        burst_sec = time.monotonic() - start
+        # then 10 requests per second
+        for _ in range(5):
+            await limiter.acquire(1)
+        return burst_sec, time.monotonic() - start
+
+    burst_sec, total_sec = asyncio.run(run())
+
+    assert burst_sec < 0.2
+    assert total_sec >= 0.45
+
+
+def test_rate_limiter_holds_tokens_per_minute():
+    async def run():
+        limiter = RateLimiter(requests_per_minute=10**6, tokens_per_minute=6000)
+        start = time.monotonic()
+        await limiter.acquire(6000)
+        # 100 tokens per second
+        await limiter.acquire(50)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.45
+
+
+def test_failed_client_setup_is_retried_on_the_next_call(fake_openai, monkeypatch):
+    async_openai = openai_client_pool.AsyncOpenAI
+    setups = []
+
+    def failing_async_openai(**kwargs):
+        setups.append(kwargs)
+        if len(setups) == 1:
+            raise openai.OpenAIError("no api key")
+        return async_openai(**kwargs)
+
+    monkeypatch.setattr(openai_client_pool, "AsyncOpenAI", failing_async_openai)
+    fake_openai.respond = lambda body: json.dumps({"ok": True})
+    loop_threads = threading.active_count()
+
+    with pytest.raises(openai.OpenAIError):
+        run_concurrently(fake_openai.pool, 1)
+    time.sleep(0.1)
+    # the loop thread of the failed setup is stopped
+    assert threading.active_count() == loop_threads
+
+    [response] = run_concurrently(fake_openai.pool, 1)
+
+    assert get_content(response) == {"ok": True}
+    assert len(setups) == 2
@@ -0,0 +1,106 @@
+import numpy as np
+import process_video_service
+from process_video_service import ProcessVideoService
+from artifact_cache import ArtifactCache
+from audio_processing import SAMPLE_RATE
+
+TRANSCRIPTION = {
+    "text": " Linear equations. They have one unknown.",
+    "language": "en",
+    "segments": [
+        {
+            "start": 0.0, "end": 2.0, "no_speech_prob": 0.1,
+            "words": [
+                {"word": " Linear", "start": 0.0, "end": 0.5, "probability": 0.9},
+                {"word": " equations.", "start": 0.5, "end": 1.0, "probability": 0.9},
+            ],
+        },
+        {
+            "start": 2.0, "end": 4.0, "no_speech_prob": 0.1,
+            "words": [
+                {"word": " They", "start": 2.0, "end": 2.5, "probability": 0.9},
+                {"word": " have", "start": 2.5, "end": 3.0, "probability": 0.9},
+                {"word": " one", "start": 3.0, "end": 3.5, "probability": 0.9},
+                {"word": " unknown.", "start": 3.5, "end": 4.0, "probability": 0.9},
+            ],
+        },
+    ],
+}
+
+
+class FakeWhisper:
+    def transcribe(self, audio, **kwargs) -> dict:
+        return TRANSCRIPTION
+
+
+class FakeModelRegistry:
+    def get(self, name: str):
+        return FakeWhisper()
+
+
+class FakeSpeechSegmentsClassificator:
+    texts = []
+
+    def __init__(self, speech_segments, class_number, subject_name, use_gpt, **modes) -> None:
+        self.__speech_segments = speech_segments
+        self.gpt_failed = False
+        self.gpt_degraded = False
+        self.escalated_fraction = None
+
+    def classify(self) -> list:
+        FakeSpeechSegmentsClassificator.texts.append(
+            [segment.text for segment in self.__speech_segments]
+        )
+        for segment in self.__speech_segments:
+            segment.is_relevant = True
+        return self.__speech_segments
+
+
+def fail(*args, **kwargs):
+    raise AssertionError("must not be called on a cached run")
+
+
+def run_service(tmp_path, subject: str) -> None:
+    ProcessVideoService(
+        str(tmp_path / "video" / "lecture.mp4"),
+        "10",
+        subject,
+        use_gpt=False,
+        regenerate_audio=False,
+        regenerate_transcription=False,
+        write_final_video=False,
+        transcription_workers=1,
+        vad_filter=False,
+    ).process()
+
+
+def test_cached_transcription_reuses_the_cached_store(tmp_path, monkeypatch):
+    (tmp_path / "video").mkdir()
+    (tmp_path / "video" / "lecture.mp4").write_bytes(b"video")
+    monkeypatch.setattr(
+        process_video_service, "artifact_cache", ArtifactCache(str(tmp_path / "cache"), 10**8)
+    )
+    monkeypatch.setattr(process_video_service, "model_registry", FakeModelRegistry())
+    monkeypatch.setattr(
+        process_video_service, "SpeechSegmentsClassificator", FakeSpeechSegmentsClassificator
+    )
+    monkeypatch.setattr(
+        process_video_service,
+        "extract_pcm_audio",
+        lambda path: np.zeros(4 * SAMPLE_RATE, dtype=np.float32),
+    )
+    FakeSpeechSegmentsClassificator.texts = []
+
+    run_service(tmp_path, "Math")
+
+    # the second run finds both the JSON and the store, neither audio nor the JSON is read
+    monkeypatch.setattr(process_video_service, "extract_pcm_audio", fail)
+    monkeypatch.setattr(process_video_service, "model_registry", None)
+    monkeypatch.setattr(process_video_service, "convert_json_to_store", fail)
+
+    # another subject, so the classification itself is not cached
+    run_service(tmp_path, "Science")
+
+    first_texts, second_texts = FakeSpeechSegmentsClassificator.texts
+    assert first_texts == [" Linear equations.", " They have one unknown."]
+    assert second_texts == first_texts
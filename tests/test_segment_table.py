@@ -0,0 +1,64 @@
+import random
+from segment_table import SegmentTable
+from speech_segment import SpeechSegment, SPEECH_SEGMENT_FIELDS, speech_segment_to_dict
+from speech_segments_merger import merge_speech_segments
+
+
+def make_speech_segments(seed: int) -> list:
+    rng = random.Random(seed)
+    speech_segments = []
+    time_sec = 0.0
+    for i in range(50):
+        segment = SpeechSegment()
+        time_sec += rng.uniform(0, 15)
+        segment.start_time_sec = time_sec
+        time_sec += rng.uniform(0.5, 20)
+        segment.end_time_sec = time_sec
+        segment.text = f" segment {i}"
+        segment.relevance_score = rng.choice([None, rng.random()])
+        segment.cluster_relevance_score = rng.choice([None, rng.random()])
+        segment.cluster_id = rng.choice([None, i // 5])
+        segment.is_relevant = rng.choice([None, True, False])
+        segment.syllabus_classification = rng.choice([None, "Chapter 1"])
+        speech_segments.append(segment)
+    return speech_segments
+
+
+def test_speech_segments_round_trip():
+    speech_segments = make_speech_segments(0)
+
+    res = SegmentTable.from_speech_segments(speech_segments).to_speech_segments()
+
+    assert all(type(segment) is SpeechSegment for segment in res)
+    assert [speech_segment_to_dict(s) for s in res] == [
+        speech_segment_to_dict(s) for s in speech_segments
+    ]
+    # plain Python values, not numpy scalars
+    assert all(
+        type(getattr(segment, name)) in (float, int, bool, str, type(None))
+        for segment in res
+        for name in SPEECH_SEGMENT_FIELDS
+    )
+
+
+def test_rows_handle_missing_times_like_speech_segments():
+    segment = SpeechSegment()
+    segment.text = "no times yet"
+    row = SegmentTable.from_speech_segments([segment])[0]
+
+    assert row.start_time_sec is None and row.start_time_string is None
+    assert row.end_time_sec is None and row.end_time_string is None
+
+    row.start_time_sec = 75.5
+    segment.start_time_sec = 75.5
+    assert row.start_time_string == segment.start_time_string
+
+
+def test_merged_segments_are_all_speech_segments():
+    segment_table = SegmentTable.from_speech_segments(make_speech_segments(1))
+    segment_table.set_relevance(0.5)
+
+    merged = merge_speech_segments(segment_table.to_speech_segments(), 10, 10)
+
+    assert len(merged) > 1
+    assert all(type(segment) is SpeechSegment for segment in merged)
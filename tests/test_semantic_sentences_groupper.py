@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+import semantic_sentences_groupper
+import speech_segments_classificator
+from semantic_sentences_groupper import (
+    SemanticSentencesGroupper,
+    BOUNDARY_WINDOW_SIZE,
+    BOUNDARY_STD_FACTOR,
+)
+from speech_segments_classificator import SpeechSegmentsClassificator
+from speech_segment import SpeechSegment
+
+DIMENSIONS = 16
+
+
+def group_by_embeddings_loop(embeddings: np.ndarray) -> list:
+    """Per-boundary loop over the windows, kept as the reference."""
+    n = len(embeddings)
+    if n == 0:
+        return []
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    embeddings = [vector / np.linalg.norm(vector) for vector in embeddings]
+    similarities = []
+    for i in range(1, n):
+        left = np.sum(embeddings[max(i - BOUNDARY_WINDOW_SIZE, 0) : i], axis=0)
+        right = np.sum(embeddings[i : min(i + BOUNDARY_WINDOW_SIZE, n)], axis=0)
+        similarities.append(left @ right / (np.linalg.norm(left) * np.linalg.norm(right)))
+    if len(similarities) == 0:
+        return [[0]]
+    threshold = np.mean(similarities) - BOUNDARY_STD_FACTOR * np.std(similarities)
+
+    groups = [[0]]
+    for i in range(1, n):
+        similarity = similarities[i - 1]
+        previous = similarities[i - 2] if i > 1 else np.inf
+        following = similarities[i] if i < n - 1 else np.inf
+        if similarity < threshold and similarity < previous and similarity <= following:
+            groups.append([])
+        groups[-1].append(i)
+    return groups
+
+
+def make_topic_embeddings(seed: int) -> np.ndarray:
+    # consecutive runs of segments around a few topic directions
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(4, DIMENSIONS))
+    embeddings = []
+    while len(embeddings) < 40:
+        topic = topics[rng.integers(len(topics))]
+        for _ in range(rng.integers(1, 9)):
+            embeddings.append(topic + rng.normal(scale=rng.uniform(0.2, 1.5), size=DIMENSIONS))
+    return np.array(embeddings, dtype=np.float32)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_vectorized_grouping_matches_the_loop(seed):
+    embeddings = make_topic_embeddings(seed)
+
+    groups = SemanticSentencesGroupper(embeddings=embeddings).group_by_embeddings()
+
+    assert groups == group_by_embeddings_loop(embeddings)
+    assert [i for group in groups for i in group] == list(range(len(embeddings)))
+
+
+def test_short_inputs():
+    assert SemanticSentencesGroupper(embeddings=np.zeros((0, 4))).group_by_embeddings() == []
+    assert SemanticSentencesGroupper(embeddings=np.ones((1, 4))).group_by_embeddings() == [[0]]
+    # a single similarity is never below mean - std
+    assert SemanticSentencesGroupper(embeddings=np.eye(2)).group_by_embeddings() == [[0, 1]]
+
+
+# segments of three topics, the subject is the first one
+TOPIC_VECTORS = {
+    "alpha": np.eye(DIMENSIONS)[0],
+    "beta": np.eye(DIMENSIONS)[1],
+    "gamma": np.eye(DIMENSIONS)[0] * 0.8 + np.eye(DIMENSIONS)[2] * 0.6,
+}
+SEGMENT_TOPICS = ["alpha"] * 5 + ["beta"] * 6 + ["gamma"] * 5 + ["beta"] * 4
+
+
+def get_vector(text: str) -> np.ndarray:
+    topic, number = text.strip(" .").split()
+    noise = np.random.default_rng(int(number)).normal(scale=0.05, size=DIMENSIONS)
+    vector = TOPIC_VECTORS[topic] + noise
+    return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+
+class FakeSimilarityEstimator:
+    """Scores texts against the first topic on fixed vectors."""
+
+    def __init__(self, text: str) -> None:
+        pass
+
+    def get_embeddings(self, texts: list) -> np.ndarray:
+        return np.stack([get_vector(text) for text in texts])
+
+    def score_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
+        return embeddings @ TOPIC_VECTORS["alpha"]
+
+    def calculate_similarities(self, texts: list) -> np.ndarray:
+        # a cluster text is embedded as the mean of its sentences
+        embeddings = []
+        for text in texts:
+            vector = np.sum([get_vector(s) for s in text.split(".") if s.strip()], axis=0)
+            embeddings.append(vector / np.linalg.norm(vector))
+        return self.score_embeddings(np.stack(embeddings))
+
+
+class FakeSemanticSplitter:
+    """Splits the text into sentences grouped by their topic word."""
+
+    def split(self, text: str) -> list:
+        clusters = []
+        for sentence in text.split("."):
+            if not sentence.strip():
+                continue
+            sentence = sentence.strip() + ". "
+            if clusters and clusters[-1][-1].split()[0] == sentence.split()[0]:
+                clusters[-1].append(sentence)
+            else:
+                clusters.append([sentence])
+        return clusters
+
+
+class FakeModelRegistry:
+    def get(self, name: str):
+        return FakeSemanticSplitter()
+
+
+def make_speech_segments() -> list:
+    speech_segments = []
+    for i, topic in enumerate(SEGMENT_TOPICS):
+        segment = SpeechSegment()
+        segment.start_time_sec = 5.0 * i
+        segment.end_time_sec = 5.0 * i + 4.5
+        segment.text = f" {topic} {i}."
+        speech_segments.append(segment)
+    return speech_segments
+
+
+def classify(cluster_on_segment_embeddings: bool, monkeypatch) -> list:
+    monkeypatch.setattr(
+        speech_segments_classificator,
+        "CLUSTER_ON_SEGMENT_EMBEDDINGS",
+        cluster_on_segment_embeddings,
+    )
+    return SpeechSegmentsClassificator(make_speech_segments(), "10", "Math", False).classify()
+
+
+def test_embedding_and_text_clustering_agree(monkeypatch):
+    monkeypatch.setattr(speech_segments_classificator, "SimilarityEstimator", FakeSimilarityEstimator)
+    monkeypatch.setattr(semantic_sentences_groupper, "model_registry", FakeModelRegistry())
+
+    by_embeddings = classify(True, monkeypatch)
+    by_text = classify(False, monkeypatch)
+
+    def summarize(speech_segments):
+        return [
+            (segment.start_time_sec, segment.end_time_sec, segment.is_relevant, segment.text)
+            for segment in speech_segments
+        ]
+
+    assert summarize(by_embeddings) == summarize(by_text)
+    assert all(type(segment) is SpeechSegment for segment in by_embeddings + by_text)
+    # the off-topic beta runs are cut, alpha and the related gamma run are kept
+    assert [segment.is_relevant for segment in by_embeddings] == [True, False, True, False]
+    for embeddings_segment, text_segment in zip(by_embeddings, by_text):
+        assert embeddings_segment.cluster_relevance_score == pytest.approx(
+            text_segment.cluster_relevance_score, abs=1e-5
+        )
@@ -0,0 +1,135 @@
+import zlib
+import numpy as np
+import pytest
+import similarity_estimator
+from similarity_estimator import (
+    SimilarityEstimator,
+    estimate_tokens,
+    get_bucket_tokens,
+    split_into_chunks,
+    ENCODE_MAX_BATCH_SIZE,
+    ENCODE_MAX_LENGTH,
+    ENCODE_TOKEN_BUDGET,
+    GENERAL_CHUNK_TOKENS,
+)
+from embedding_cache import EmbeddingCache
+
+DIMENSIONS = 8
+
+
+def get_vector(text: str) -> np.ndarray:
+    rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+    vector = rng.normal(size=DIMENSIONS).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeSimilarityModel:
+    """Deterministic unit vectors per text, records every encode call."""
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def encode(self, texts: list, batch_size: int, max_length: int) -> dict:
+        self.calls.append((list(texts), batch_size, max_length))
+        return {"dense_vecs": np.stack([get_vector(text) for text in texts])}
+
+
+class FakeModelRegistry:
+    def __init__(self, model) -> None:
+        self.__model = model
+
+    def get(self, name: str):
+        return self.__model
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    model = FakeSimilarityModel()
+    monkeypatch.setattr(similarity_estimator, "model_registry", FakeModelRegistry(model))
+    monkeypatch.setattr(
+        similarity_estimator, "embedding_cache", EmbeddingCache(str(tmp_path), 10**8)
+    )
+    return model
+
+
+def make_texts(seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    return [
+        " ".join(f"word{i}_{k}" for k in range(int(rng.integers(1, 400))))
+        for i in range(60)
+    ]
+
+
+def test_non_ascii_text_is_not_undercounted():
+    # a Devanagari word takes about a token per character
+    hindi_text = "रैखिक समीकरण " * 100
+
+    assert estimate_tokens(hindi_text) >= len(hindi_text.replace(" ", ""))
+    assert estimate_tokens("linear equations " * 100) >= len("linear equations " * 100) // 4
+
+
+def test_texts_are_encoded_in_length_buckets_in_input_order(model):
+    texts = make_texts(seed=1)
+    estimator = SimilarityEstimator("general text")
+    model.calls.clear()
+
+    embeddings = estimator.get_embeddings(texts)
+
+    # the input order is restored, up to the float16 round trip of the cache
+    expected = np.stack([get_vector(text) for text in texts])
+    assert np.allclose(embeddings, expected, atol=1e-3)
+
+    encoded = [text for call_texts, _, _ in model.calls for text in call_texts]
+    assert sorted(encoded) == sorted(texts)
+    for call_texts, batch_size, max_length in model.calls:
+        bucket_tokens = {get_bucket_tokens(estimate_tokens(text)) for text in call_texts}
+        assert len(bucket_tokens) == 1
+        [bucket_tokens] = bucket_tokens
+        assert batch_size == min(ENCODE_MAX_BATCH_SIZE, ENCODE_TOKEN_BUDGET // bucket_tokens)
+        # texts are never truncated to the bucket length
+        assert max_length == ENCODE_MAX_LENGTH
+    # shorter buckets first, each one in a single call
+    call_buckets = [get_bucket_tokens(estimate_tokens(call[0][0])) for call in model.calls]
+    assert call_buckets == sorted(set(call_buckets))
+
+
+def test_cached_embeddings_are_not_encoded_again(model):
+    texts = make_texts(seed=2)
+    estimator = SimilarityEstimator("general text")
+    first = estimator.get_embeddings(texts[:30])
+    model.calls.clear()
+
+    embeddings = estimator.get_embeddings(texts)
+
+    encoded = [text for call_texts, _, _ in model.calls for text in call_texts]
+    assert sorted(encoded) == sorted(texts[30:])
+    assert np.array_equal(embeddings[:30], first)
+
+
+def test_long_general_text_is_pooled_from_chunks(model):
+    words = [f"word{i}" for i in range(3 * GENERAL_CHUNK_TOKENS)]
+    text = " ".join(words)
+
+    estimator = SimilarityEstimator(text)
+
+    chunks = split_into_chunks(text, GENERAL_CHUNK_TOKENS)
+    assert len(chunks) > 1
+    assert " ".join(chunks) == text
+    encoded = [chunk for call_texts, _, _ in model.calls for chunk in call_texts]
+    assert sorted(encoded) == sorted(chunks)
+    weights = np.array([len(chunk) for chunk in chunks], dtype=np.float32)
+    pooled = weights @ np.stack(
+        [get_vector(chunk).astype(np.float16).astype(np.float32) for chunk in chunks]
+    )
+    pooled /= np.linalg.norm(pooled)
+    query_embedding = estimator.get_embeddings(["query"])
+    assert estimator.score_embeddings(query_embedding)[0] == pytest.approx(
+        float(query_embedding[0] @ pooled), abs=1e-5
+    )
+
+
+def test_short_general_text_is_encoded_whole(model):
+    SimilarityEstimator("linear equations")
+
+    [(texts, _, _)] = model.calls
+    assert texts == ["linear equations"]
@@ -0,0 +1,142 @@
+import random
+import pytest
+from speech_segment import SpeechSegment
+from speech_segments_merger import merge_speech_segments
+
+SILENCE_THRESHOLD_SEC = 10
+MIN_DURATION_SEC = 10
+SEEDS = range(500)
+
+
+def merge_2_speech_segments_oracle(segment1, segment2, is_relevant: bool = True) -> SpeechSegment:
+    new_segment = SpeechSegment()
+    new_segment.start_time_sec = segment1.start_time_sec
+    new_segment.end_time_sec = segment2.end_time_sec
+    new_segment.is_relevant = is_relevant
+    new_segment.relevance_score = (
+        (segment1.relevance_score or 0) + (segment2.relevance_score or 0)
+    ) / 2
+    new_segment.cluster_relevance_score = max(
+        segment1.cluster_relevance_score or 0, segment2.cluster_relevance_score or 0
+    )
+    new_segment.text = segment1.text + " " + segment2.text
+    return new_segment
+
+
+def merge_speech_segments_oracle(
+    speech_segments: list, silence_threshold_sec: float, min_duration_sec: float
+) -> list:
+    """Frozen copy of the pairwise merge loop the index-range merge replaced."""
+    arr2 = speech_segments
+    while True:
+        made_changes = False
+        # Step 1: Merge near similar by relevancy segments
+        arr1 = []
+        i = 0
+        while i < len(arr2):
+            s_prev = arr1.pop() if len(arr1) > 0 else None
+            s = arr2[i]
+
+            if s_prev is None:
+                arr1.append(s)
+            elif (
+                s_prev.is_relevant == s.is_relevant
+                and s.start_time_sec - s_prev.end_time_sec < silence_threshold_sec
+            ):
+                arr1.append(merge_2_speech_segments_oracle(s_prev, s, s_prev.is_relevant))
+                made_changes = True
+            else:
+                arr1.append(s_prev)
+                arr1.append(s)
+
+            i += 1
+
+        # Step 2: Merge near short segments
+        i = 0
+        arr2 = []
+        while i < len(arr1):
+            s_prev = arr2.pop() if len(arr2) > 0 else None
+            s = arr1[i]
+
+            if s_prev is None:
+                arr2.append(s)
+            elif (
+                s.duration_sec < min_duration_sec
+                and s.start_time_sec - s_prev.end_time_sec < silence_threshold_sec
+            ):
+                arr2.append(merge_2_speech_segments_oracle(s_prev, s, s_prev.is_relevant))
+                made_changes = True
+            elif (
+                s_prev.duration_sec < min_duration_sec
+                and s.start_time_sec - s_prev.end_time_sec < silence_threshold_sec
+            ):
+                arr2.append(merge_2_speech_segments_oracle(s_prev, s, s.is_relevant))
+                made_changes = True
+            else:
+                arr2.append(s_prev)
+                arr2.append(s)
+
+            i += 1
+        if not made_changes:
+            break
+
+    return arr2
+
+
+def generate_speech_segments(seed: int) -> list:
+    rng = random.Random(seed)
+    res = []
+    time_sec = 0.0
+    for i in range(rng.randint(0, 60)):
+        # gaps and durations around the thresholds, so every merge branch is taken
+        time_sec += rng.choice([0.0, rng.uniform(0, 2 * SILENCE_THRESHOLD_SEC)])
+        segment = SpeechSegment()
+        segment.start_time_sec = time_sec
+        time_sec += rng.uniform(0.5, 2 * MIN_DURATION_SEC)
+        segment.end_time_sec = time_sec
+        segment.text = f"text {i}"
+        segment.is_relevant = rng.random() < 0.6
+        segment.relevance_score = rng.choice([None, rng.random()])
+        segment.cluster_relevance_score = rng.choice([None, rng.random()])
+        res.append(segment)
+    return res
+
+
+def describe(segments: list) -> list:
+    return [
+        (
+            segment.start_time_sec,
+            segment.end_time_sec,
+            segment.text,
+            segment.is_relevant,
+            segment.relevance_score,
+            segment.cluster_relevance_score,
+        )
+        for segment in segments
+    ]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_merge_matches_pairwise_merge(seed):
+    expected = merge_speech_segments_oracle(
+        generate_speech_segments(seed), SILENCE_THRESHOLD_SEC, MIN_DURATION_SEC
+    )
+    res = merge_speech_segments(
+        generate_speech_segments(seed), SILENCE_THRESHOLD_SEC, MIN_DURATION_SEC
+    )
+
+    assert describe(res) == describe(expected)
+
+
+def test_unmerged_segments_are_returned_as_is():
+    speech_segments = generate_speech_segments(0)
+    # far apart and long, nothing merges
+    for i, segment in enumerate(speech_segments):
+        segment.start_time_sec = i * 100.0
+        segment.end_time_sec = i * 100.0 + 50.0
+        segment.is_relevant = i % 2 == 0
+
+    res = merge_speech_segments(speech_segments, SILENCE_THRESHOLD_SEC, MIN_DURATION_SEC)
+
+    assert len(res) == len(speech_segments)
+    assert all(a is b for a, b in zip(res, speech_segments))
@@ -0,0 +1,76 @@
+import random
+from text_offset_index import TextOffsetIndex
+
+
+def map_by_substring_search(segment_texts: list, span_texts: list) -> list:
+    """The mapping used before the offset index, kept as the reference."""
+    res = [None] * len(segment_texts)
+    i = 0
+    j = 0
+    while i < len(segment_texts) and j < len(span_texts):
+        segment_text = segment_texts[i].strip()
+        span_text = span_texts[j].strip()
+        if segment_text != span_text:
+            if segment_text in span_text:
+                res[i] = j
+                i += 1
+            else:
+                j += 1
+        else:
+            res[i] = j
+            i += 1
+            j += 1
+    return res
+
+
+def make_segments(rng: random.Random, count: int) -> list:
+    return [
+        " " + " ".join(f"w{i}_{k}" for k in range(rng.randrange(1, 6))) + rng.choice(["", ".", " "])
+        for i in range(count)
+    ]
+
+
+def test_matches_the_substring_search_on_whole_segments():
+    rng = random.Random(0)
+    for _ in range(300):
+        segment_texts = make_segments(rng, rng.randrange(1, 20))
+        # spans made of whole segments, re-joined the way the sentence splitter does
+        count = len(segment_texts)
+        cuts = sorted(rng.sample(range(1, count + 1), rng.randrange(1, count + 1)))
+        if cuts[-1] != count:
+            cuts.append(count)
+        span_texts = [
+            " ".join(text.strip() for text in segment_texts[start:end])
+            for start, end in zip([0] + cuts[:-1], cuts)
+        ]
+
+        expected = map_by_substring_search(segment_texts, span_texts)
+        assert None not in expected
+        assert TextOffsetIndex(segment_texts).map_spans(span_texts) == expected
+
+
+def test_whitespace_differences_do_not_break_the_mapping():
+    segment_texts = [" Linear equations.", "  They have\tone unknown. ", " Next topic."]
+    span_texts = ["Linear equations.They have one", "unknown.\nNext topic."]
+
+    assert TextOffsetIndex(segment_texts).map_spans(span_texts) == [0, 0, 1]
+    # the substring search loses every segment after the first mismatch
+    assert map_by_substring_search(segment_texts, span_texts) == [0, None, None]
+
+
+def test_segment_crossing_a_boundary_goes_to_the_span_holding_its_middle():
+    index = TextOffsetIndex(["aaaa", "bbbbbb", "cc"])
+
+    # "bbbbbb" has its middle at 7 non-whitespace characters
+    assert index.map_spans(["aaaabb", "bbbbcc"]) == [0, 1, 1]
+    assert index.map_spans(["aaaabbbbb", "bcc"]) == [0, 0, 1]
+    # a middle exactly on the boundary goes to the later span
+    assert index.map_spans(["aaaabbb", "bbbcc"]) == [0, 1, 1]
+
+
+def test_full_text_and_empty_spans():
+    index = TextOffsetIndex([" a b ", "c"])
+
+    assert index.full_text == " a b c"
+    assert len(index) == 2
+    assert index.map_spans([]) == [None, None]
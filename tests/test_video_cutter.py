@@ -0,0 +1,285 @@
+import pytest
+import video_cutter
+from speech_segment import SpeechSegment
+from video_cutter import (
+    VideoCutter,
+    plan_stream_copy_parts,
+    plan_parallel_chunks,
+    get_stream_mismatches,
+    RENDER_MODE_SEEK,
+    RENDER_MODE_TRIM,
+    RENDER_MODE_COPY,
+    PART_COPY,
+    PART_ENCODE,
+)
+
+# a 2 sec GOP
+KEYFRAMES = [float(t) for t in range(0, 21, 2)]
+DURATION = 21.0
+
+
+def make_video_cutter(intervals: list, render_mode: str = RENDER_MODE_SEEK) -> VideoCutter:
+    speech_segments = []
+    for start, end, is_relevant in intervals:
+        segment = SpeechSegment()
+        segment.start_time_sec = start
+        segment.end_time_sec = end
+        segment.text = "text"
+        segment.is_relevant = is_relevant
+        speech_segments.append(segment)
+    return VideoCutter(
+        input_video_path="input.mp4",
+        output_video_path="output.mp4",
+        transition_video_path=None,
+        speech_segments=speech_segments,
+        render_mode=render_mode,
+    )
+
+
+def test_no_relevant_segments_is_a_clear_error():
+    video_cutter = make_video_cutter([(0.0, 10.0, False)])
+
+    with pytest.raises(Exception, match="nothing to render"):
+        video_cutter.build_filter_graph()
+
+
+def test_single_segment_has_no_transitions():
+    video_cutter = make_video_cutter([(0.0, 10.0, False), (20.0, 30.0, True)])
+
+    input_args, filter_graph, video_slug, audio_slug = video_cutter.build_filter_graph()
+
+    assert input_args.count("-i") == 1
+    assert "xfade" not in filter_graph
+    assert (video_slug, audio_slug) == ("v0", "a0")
+
+
+@pytest.mark.parametrize("segments_count", [2, 3, 8, 13])
+def test_segments_are_joined_by_one_transition_each(segments_count):
+    video_cutter = make_video_cutter(
+        [(k * 20.0, k * 20.0 + 10.0, True) for k in range(segments_count)]
+    )
+
+    _, filter_graph, video_slug, audio_slug = video_cutter.build_filter_graph()
+
+    assert filter_graph.count("xfade=") == segments_count - 1
+    assert filter_graph.count("acrossfade=") == segments_count - 1
+    assert filter_graph.endswith(f"[{audio_slug}]")
+    assert f"[{video_slug}]" in filter_graph
+
+
+def test_trim_mode_keeps_the_original_segment_graph():
+    video_cutter = make_video_cutter(
+        [(1.04, 8.0, True), (10.0, 18.0, True)], render_mode=RENDER_MODE_TRIM
+    )
+
+    input_args, filter_graph, _, _ = video_cutter.build_filter_graph()
+
+    assert input_args == ["-i", "input.mp4"]
+    assert filter_graph.startswith(
+        "[0:v]fps=25,trim=1.0:8.0,setpts=PTS-STARTPTS[vtemp0];"
+        "[vtemp0]format=yuv420p[v0];"
+        "[0:a]atrim=1.0:8.0,asetpts=PTS-STARTPTS[a0];"
+        "[0:v]fps=25,trim=10.0:18.0,setpts=PTS-STARTPTS[vtemp1];"
+        "[vtemp1]format=yuv420p[v1];"
+        "[0:a]atrim=10.0:18.0,asetpts=PTS-STARTPTS[a1];"
+    )
+
+
+def plan(intervals: list, tolerance: float = 0.5) -> list:
+    starts = [start for start, _ in intervals]
+    ends = [end for _, end in intervals]
+    return plan_stream_copy_parts(starts, ends, KEYFRAMES, DURATION, tolerance)
+
+
+def test_boundaries_near_keyframes_are_snapped():
+    assert plan([(4.2, 9.9)]) == [(PART_COPY, 4.0, 10.0)]
+    # the video end counts as a keyframe
+    assert plan([(14.3, 20.8)]) == [(PART_COPY, 14.0, 21.0)]
+
+
+def test_boundaries_between_keyframes_are_re_encoded_up_to_the_keyframe():
+    assert plan([(3.0, 9.0)]) == [
+        (PART_ENCODE, 3.0, 4.0),
+        (PART_COPY, 4.0, 8.0),
+        (PART_ENCODE, 8.0, 9.0),
+    ]
+
+
+def test_segment_shorter_than_a_gop_is_re_encoded_whole():
+    assert plan([(4.6, 5.4)], tolerance=0.3) == [(PART_ENCODE, 4.6, 5.4)]
+    # the start snaps, but the end is in the same GOP
+    assert plan([(4.1, 4.9)], tolerance=0.3) == [(PART_ENCODE, 4.0, 4.9)]
+
+
+def test_parts_meeting_on_a_keyframe_are_merged():
+    assert plan([(2.1, 6.0), (5.9, 10.2)]) == [(PART_COPY, 2.0, 10.0)]
+    assert plan([(3.0, 6.0), (6.1, 9.0)]) == [
+        (PART_ENCODE, 3.0, 4.0),
+        (PART_COPY, 4.0, 8.0),
+        (PART_ENCODE, 8.0, 9.0),
+    ]
+
+
+def test_planned_parts_cover_the_intervals_in_order():
+    intervals = [(0.7, 3.1), (5.5, 5.9), (7.2, 12.6), (13.0, 20.5)]
+
+    parts = plan(intervals, tolerance=0.2)
+
+    for (_, _, end), (_, start, _) in zip(parts, parts[1:]):
+        assert end <= start
+    # every boundary moves by the snap tolerance at most
+    for start, end in intervals:
+        assert any(abs(part[1] - start) <= 0.2 for part in parts)
+        assert any(abs(part[2] - end) <= 0.2 for part in parts)
+    assert sum(part[2] - part[1] for part in parts) == pytest.approx(
+        sum(end - start for start, end in intervals), abs=4 * 0.2
+    )
+
+
+SOURCE_STREAMS = {
+    "duration": DURATION,
+    "video": {
+        "codec_name": "h264", "profile": "High", "pix_fmt": "yuv420p", "width": 640, "height": 360,
+        "r_frame_rate": "25/1", "time_base": "1/12800",
+    },
+    "audio": {"codec_name": "aac", "profile": "LC", "sample_rate": "44100", "channels": 1},
+}
+
+
+def with_params(video: dict = None, audio: dict = None) -> dict:
+    return {
+        "duration": DURATION,
+        "video": dict(SOURCE_STREAMS["video"], **(video or {})),
+        "audio": dict(SOURCE_STREAMS["audio"], **(audio or {})),
+    }
+
+
+def test_matching_streams_can_be_concatenated():
+    assert get_stream_mismatches(SOURCE_STREAMS, with_params()) == []
+
+
+@pytest.mark.parametrize("part_streams", [
+    with_params(video={"profile": "Constrained Baseline"}),
+    with_params(video={"pix_fmt": "yuvj420p"}),
+    with_params(video={"width": 1280, "height": 720}),
+    with_params(video={"time_base": "1/25"}),
+    with_params(audio={"sample_rate": "48000"}),
+])
+def test_mismatching_streams_are_reported(part_streams):
+    assert len(get_stream_mismatches(SOURCE_STREAMS, part_streams)) > 0
+
+
+@pytest.fixture
+def ffmpeg_calls(monkeypatch, tmp_path):
+    calls = []
+
+    def run(cmd, check):
+        calls.append(cmd)
+        with open(cmd[-1], "wb"):
+            pass
+
+    monkeypatch.setattr(video_cutter.subprocess, "run", run)
+    monkeypatch.setattr(video_cutter, "probe_keyframes", lambda path: KEYFRAMES)
+    return calls
+
+
+def make_copy_video_cutter(tmp_path) -> VideoCutter:
+    segment = SpeechSegment()
+    segment.start_time_sec = 3.0
+    segment.end_time_sec = 9.0
+    segment.text = "text"
+    segment.is_relevant = True
+    return VideoCutter(
+        input_video_path=str(tmp_path / "input.mp4"),
+        output_video_path=str(tmp_path / "output.mp4"),
+        transition_video_path=None,
+        speech_segments=[segment],
+        render_mode=RENDER_MODE_COPY,
+        keyframe_snap_tolerance_sec=0.5,
+    )
+
+
+def test_copy_mode_concatenates_matching_parts(ffmpeg_calls, monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        video_cutter,
+        "probe_streams",
+        lambda path: SOURCE_STREAMS if path.endswith("input.mp4") else with_params(),
+    )
+
+    make_copy_video_cutter(tmp_path).cut()
+
+    encode_calls = ffmpeg_calls[:-1]
+    assert len(encode_calls) == 2
+    for cmd in encode_calls:
+        assert cmd[cmd.index("-profile:v") + 1] == "high"
+        assert cmd[cmd.index("-video_track_timescale") + 1] == "12800"
+    assert ffmpeg_calls[-1][1:3] == ["-f", "concat"]
+
+
+def test_copy_mode_falls_back_to_seek_on_mismatching_parts(ffmpeg_calls, monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        video_cutter,
+        "probe_streams",
+        lambda path: (
+            SOURCE_STREAMS
+            if path.endswith("input.mp4")
+            else with_params(video={"profile": "Constrained Baseline"})
+        ),
+    )
+
+    make_copy_video_cutter(tmp_path).cut()
+
+    assert not any("concat" in cmd for cmd in ffmpeg_calls)
+    assert "-filter_complex_script" in ffmpeg_calls[-1]
+
+
+def get_duration(interval: tuple) -> float:
+    return round(interval[1] - interval[0], 1)
+
+
+def test_single_segment_is_one_chunk_without_a_tail():
+    assert plan_parallel_chunks([3.04], [17.46], 2) == [(None, (3.0, 17.5))]
+
+
+def test_chunks_split_every_segment_at_its_outgoing_transition():
+    starts = [0.0, 20.0, 45.3, 70.0]
+    ends = [10.0, 31.5, 60.0, 75.0]
+
+    chunks = plan_parallel_chunks(starts, ends, 2)
+
+    assert chunks == [
+        (None, (0.0, 8.0)),
+        ((8.0, 10.0), (20.0, 29.5)),
+        ((29.5, 31.5), (45.3, 58.0)),
+        ((58.0, 60.0), (70.0, 75.0)),
+    ]
+    # the tail of a chunk is exactly the part the previous body left out
+    for (_, prev_body), (tail, _) in zip(chunks, chunks[1:]):
+        assert tail[0] == prev_body[1]
+
+
+@pytest.mark.parametrize("segments_count", [2, 3, 7])
+def test_chunk_joins_fall_on_the_xfade_offsets_of_the_linear_ladder(segments_count):
+    transition_duration = 2
+    starts = [k * 30.0 + (k % 3) * 0.7 for k in range(segments_count)]
+    ends = [start + 8.0 + k * 1.3 for k, start in enumerate(starts)]
+
+    chunks = plan_parallel_chunks(starts, ends, transition_duration)
+
+    # a chunk plays the transition from the previous segment, then its body,
+    # so its duration is the body duration
+    chunk_starts = [0.0]
+    for _, body in chunks:
+        chunk_starts.append(round(chunk_starts[-1] + get_duration(body), 1))
+
+    # linear xfade ladder: transition k starts at the joined duration minus the transition
+    offset = 0.0
+    for k in range(1, segments_count):
+        offset = round(offset + get_duration((starts[k - 1], ends[k - 1])) - transition_duration, 1)
+        assert chunk_starts[k] == pytest.approx(offset)
+    total_duration = round(
+        sum(get_duration((start, end)) for start, end in zip(starts, ends))
+        - (segments_count - 1) * transition_duration,
+        1,
+    )
+    assert chunk_starts[-1] == pytest.approx(total_duration)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from voice_activity import detect_speech_regions, SpeechTimeline
+from audio_processing import SAMPLE_RATE
+
+
+def tone(duration_sec: float, amplitude: float, frequency: float = 220.0) -> np.ndarray:
+    t = np.arange(int(duration_sec * SAMPLE_RATE)) / SAMPLE_RATE
+    # syllable-rate modulation, like speech
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    return (amplitude * envelope * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def silence(duration_sec: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 1e-4, int(duration_sec * SAMPLE_RATE)).astype(np.float32)
+
+
+def test_tone_and_silence():
+    audio = np.concatenate([tone(5, 0.3), silence(10), tone(5, 0.3)])
+
+    regions = detect_speech_regions(audio)
+
+    assert len(regions) == 2
+    (first_start, first_end), (second_start, second_end) = regions
+    assert first_start == 0
+    assert 5.0 <= first_end / SAMPLE_RATE <= 5.5
+    assert 14.5 <= second_start / SAMPLE_RATE <= 15.0
+    assert second_end == len(audio)
+
+    speech_timeline = SpeechTimeline(regions, len(audio))
+    assert speech_timeline.skipped_sec == pytest.approx(9.4, abs=0.1)
+    # the second tone starts right after the first one and the joining gap in the compact audio
+    compact_second_start = (first_end - first_start) / SAMPLE_RATE + 0.5
+    assert speech_timeline.to_original_time(compact_second_start + 1.0) == pytest.approx(
+        second_start / SAMPLE_RATE + 1.0
+    )
+
+
+def test_continuous_signal_is_kept_whole():
+    # a lecture without pauses, with a quiet passage well above any noise floor
+    audio = np.concatenate([tone(10, 0.3), tone(10, 0.03, 180.0), tone(10, 0.3)])
+
+    assert detect_speech_regions(audio) == [(0, len(audio))]
+
+
+def test_short_pauses_are_not_cut():
+    # pauses too short to be worth cutting
+    audio = np.concatenate([tone(28, 0.3), silence(1.5), tone(28, 0.3)])
+
+    assert detect_speech_regions(audio) == [(0, len(audio))]
@@ -0,0 +1,45 @@
+from bisect import bisect_right
+from itertools import accumulate
+
+
+def count_non_whitespace(text: str) -> int:
+    return sum(len(word) for word in text.split())
+
+
+class TextOffsetIndex:
+    """Full text of speech segments with the offsets of every segment in it.
+
+    Offsets are counted in non-whitespace characters, so they don't depend on
+    how a later stage (e.g. a sentence splitter) re-joins or strips the text.
+    """
+
+    def __init__(self, segment_texts: list) -> None:
+        parts = [text.strip() for text in segment_texts]
+        # every segment is prefixed with a space, same as the original full text
+        self.full_text = "".join(" " + text for text in parts)
+
+        self.__compact_ends = list(accumulate(count_non_whitespace(t) for t in parts))
+        self.__compact_starts = [
+            end - count_non_whitespace(t) for end, t in zip(self.__compact_ends, parts)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.__compact_ends)
+
+    def map_spans(self, span_texts: list) -> list:
+        """Maps every segment to the consecutive span of text it belongs to.
+
+        `span_texts` must cover the full text in order (whitespace may differ).
+        A segment crossing a span boundary goes to the span holding its middle,
+        a middle exactly on the boundary goes to the later span.
+        """
+        if len(span_texts) == 0:
+            return [None] * len(self)
+
+        span_ends = list(accumulate(count_non_whitespace(t) for t in span_texts))
+        last_span = len(span_texts) - 1
+        res = []
+        for start, end in zip(self.__compact_starts, self.__compact_ends):
+            middle = (start + end) / 2
+            res.append(min(bisect_right(span_ends, middle), last_span))
+        return res
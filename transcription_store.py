@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import mmap
+import shutil
+from array import array
+import numpy as np
+from json_stream_reader import JsonStreamReader
+from logging_service import logger
+
+STORE_VERSION = 1
+META_FILE_NAME = "meta.json"
+TEXT_FILE_NAME = "text.bin"
+WORD_ARRAYS = [
+    "word_start",
+    "word_end",
+    "word_probability",
+    "word_segment_id",
+    "word_text_offsets",
+]
+SEGMENT_ARRAYS = [
+    "segment_start",
+    "segment_end",
+    "segment_no_speech_prob",
+    "segment_word_offsets",
+]
+
+
+def write_transcription_store(segments, store_path: str, language: str = None) -> None:
+    """Writes whisper segments (any iterable, e.g. a stream) as a columnar store.
+
+    Word columns: start, end, probability, segment id and the offsets of the
+    word in one UTF-8 text blob. Segment columns: start, end, no_speech_prob
+    and the offset of the first word of every segment.
+    """
+    columns = {
+        "word_start": array("d"),
+        "word_end": array("d"),
+        "word_probability": array("f"),
+        "word_segment_id": array("i"),
+        "word_text_offsets": array("q", [0]),
+        "segment_start": array("d"),
+        "segment_end": array("d"),
+        "segment_no_speech_prob": array("f"),
+        "segment_word_offsets": array("q", [0]),
+    }
+
+    tmp_path = store_path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    text_offset = 0
+    with open(os.path.join(tmp_path, TEXT_FILE_NAME), "wb") as text_file:
+        for segment_id, segment in enumerate(segments):
+            columns["segment_start"].append(segment["start"])
+            columns["segment_end"].append(segment["end"])
+            columns["segment_no_speech_prob"].append(segment["no_speech_prob"])
+            for word in segment.get("words", []):
+                word_bytes = word["word"].encode("utf-8")
+                text_file.write(word_bytes)
+                text_offset += len(word_bytes)
+                columns["word_start"].append(word["start"])
+                columns["word_end"].append(word["end"])
+                # whisper calls it probability, whisper_timestamped - confidence
+                columns["word_probability"].append(
+                    word.get("probability", word.get("confidence", float("nan")))
+                )
+                columns["word_segment_id"].append(segment_id)
+                columns["word_text_offsets"].append(text_offset)
+            columns["segment_word_offsets"].append(len(columns["word_start"]))
+
+    for name, values in columns.items():
+        path = os.path.join(tmp_path, name + ".npy")
+        np.save(path, np.frombuffer(values, dtype=values.typecode))
+
+    with open(os.path.join(tmp_path, META_FILE_NAME), "w") as f:
+        json.dump({"version": STORE_VERSION, "language": language}, f)
+
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path)
+    os.replace(tmp_path, store_path)
+
+
+def convert_json_to_store(json_path: str, store_path: str) -> None:
+    logger.info(f"converting transcription {json_path} to {store_path}")
+    with open(json_path) as f:
+        write_transcription_store(JsonStreamReader(f).iter_array("segments"), store_path)
+
+
+class TranscriptionStore:
+    """Memory-mapped columnar transcription, nothing is parsed on load."""
+
+    def __init__(self, store_path: str) -> None:
+        with open(os.path.join(store_path, META_FILE_NAME)) as f:
+            meta = json.load(f)
+        if meta["version"] != STORE_VERSION:
+            raise Exception(f"unsupported transcription store version: {meta['version']}")
+        self.language = meta["language"]
+
+        for name in WORD_ARRAYS + SEGMENT_ARRAYS:
+            path = os.path.join(store_path, name + ".npy")
+            setattr(self, name, np.load(path, mmap_mode="r"))
+
+        self.__text = b""
+        with open(os.path.join(store_path, TEXT_FILE_NAME), "rb") as f:
+            # mmap can't map an empty file
+            if os.fstat(f.fileno()).st_size > 0:
+                self.__text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.segment_start)
+
+    def get_word_text(self, word_index: int) -> str:
+        start = int(self.word_text_offsets[word_index])
+        end = int(self.word_text_offsets[word_index + 1])
+        return self.__text[start:end].decode("utf-8")
+
+    def iter_segments(self):
+        """Yields segments in the same shape as the whisper JSON."""
+        for i in range(len(self)):
+            first = int(self.segment_word_offsets[i])
+            last = int(self.segment_word_offsets[i + 1])
+            text_offsets = self.word_text_offsets[first : last + 1].tolist()
+            words = [
+                {
+                    "word": self.__text[text_offsets[k] : text_offsets[k + 1]].decode("utf-8"),
+                    "start": start,
+                    "end": end,
+                }
+                for k, (start, end) in enumerate(
+                    zip(self.word_start[first:last].tolist(), self.word_end[first:last].tolist())
+                )
+            ]
+            yield {
+                "start": float(self.segment_start[i]),
+                "end": float(self.segment_end[i]),
+                "no_speech_prob": float(self.segment_no_speech_prob[i]),
+                "words": words,
+            }
+
+
+if __name__ == "__main__":
+    # python transcription_store.py whisper_transcription.json whisper_transcription.store
+    convert_json_to_store(sys.argv[1], sys.argv[2])
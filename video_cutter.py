@@ -1,10 +1,139 @@
+import os
 import time
+import tempfile
 import subprocess
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left, bisect_right
+from segment_table import SegmentTable
+from media_probe import probe_keyframes, probe_streams
 from logging_service import logger
 
 
 TRANSITION_TIME = 5
+TRANSITION_EFFECT = 'fade'
+TRANSITION_DURATION = 2
+FPS = 25
+
+# trim - one filter branch over the whole decoded input per segment
+# seek - one input per segment opened with fast -ss/-to input seeking
+# copy - no transitions, stream copy between keyframes, only edge GOPs are re-encoded
+# parallel - every segment with its incoming transition is encoded by its own ffmpeg, then stitched
+RENDER_MODE_TRIM = 'trim'
+RENDER_MODE_SEEK = 'seek'
+RENDER_MODE_COPY = 'copy'
+RENDER_MODE_PARALLEL = 'parallel'
+RENDER_MODE = RENDER_MODE_SEEK
+
+# parallel mode: ffmpeg processes running at once and threads of each of them
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', os.cpu_count() or 1))
+FFMPEG_THREADS = int(os.getenv('FFMPEG_THREADS', max(1, (os.cpu_count() or 1) // RENDER_WORKERS)))
+
+# how far a segment boundary may move to land on a keyframe in copy mode
+KEYFRAME_SNAP_TOLERANCE_SEC = 1.0
+PART_COPY = 'copy'
+PART_ENCODE = 'encode'
+# re-encoded parts are concatenated with copied source packets, these must match
+COPY_VIDEO_PARAMS = ['codec_name', 'profile', 'pix_fmt', 'width', 'height', 'time_base']
+COPY_AUDIO_PARAMS = ['codec_name', 'profile', 'sample_rate', 'channels']
+# ffprobe profile name -> libx264 -profile:v
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high',
+    'High 10': 'high10',
+    'High 4:2:2': 'high422',
+    'High 4:4:4 Predictive': 'high444',
+}
+
+
+def find_nearest(values: list, target: float, tolerance: float):
+    # values must be sorted
+    i = bisect_left(values, target)
+    candidates = [values[j] for j in (i - 1, i) if 0 <= j < len(values)]
+    candidates = [v for v in candidates if abs(v - target) <= tolerance]
+    return min(candidates, key=lambda v: abs(v - target)) if candidates else None
+
+
+def plan_stream_copy_parts(
+    starts: list, ends: list, keyframes: list, duration: float, tolerance: float
+) -> list:
+    """Splits the relevant intervals into stream-copied and re-encoded parts.
+
+    A boundary within `tolerance` of a keyframe is moved to it. Otherwise the
+    part between the boundary and the closest keyframe inside the interval is
+    re-encoded. Returns a list of (PART_COPY | PART_ENCODE, start, end).
+    """
+    end_points = keyframes + [duration]
+    parts = []
+    for start, end in zip(starts, ends):
+        copy_start = find_nearest(keyframes, start, tolerance)
+        if copy_start is None:
+            i = bisect_right(keyframes, start)
+            if i == len(keyframes) or keyframes[i] >= end:
+                parts.append((PART_ENCODE, start, end))
+                continue
+            copy_start = keyframes[i]
+            parts.append((PART_ENCODE, start, copy_start))
+
+        copy_end = find_nearest(end_points, end, tolerance)
+        if copy_end is not None and copy_end > copy_start:
+            parts.append((PART_COPY, copy_start, copy_end))
+            continue
+
+        i = bisect_right(keyframes, end) - 1
+        if i < 0 or keyframes[i] <= copy_start:
+            parts.append((PART_ENCODE, copy_start, end))
+        else:
+            parts.append((PART_COPY, copy_start, keyframes[i]))
+            parts.append((PART_ENCODE, keyframes[i], end))
+
+    # neighbour parts of the same type that meet (e.g. on one keyframe) become one part
+    res = []
+    for part in parts:
+        if res and part[0] == res[-1][0] and res[-1][2] >= part[1]:
+            res[-1] = (part[0], res[-1][1], max(res[-1][2], part[2]))
+        else:
+            res.append(part)
+    return res
+
+
+def get_stream_mismatches(source_streams: dict, part_streams: dict) -> list:
+    """Stream parameters of a re-encoded part which differ from the source, empty if they can be concatenated."""
+    res = []
+    for codec_type, params in (('video', COPY_VIDEO_PARAMS), ('audio', COPY_AUDIO_PARAMS)):
+        source_stream = source_streams[codec_type] or {}
+        part_stream = part_streams[codec_type] or {}
+        for param in params:
+            if source_stream.get(param) != part_stream.get(param):
+                res.append(f'{codec_type} {param}: {source_stream.get(param)} != {part_stream.get(param)}')
+    return res
+
+
+def plan_parallel_chunks(starts: list, ends: list, transition_duration: float) -> list:
+    """Splits the edit into chunks which can be encoded independently.
+
+    Chunk k starts with the transition from segment k - 1 (its last
+    `transition_duration` seconds are the `tail`) and holds segment k up to
+    the start of the next transition (`body`). Stitched together the chunks
+    give the same timeline as the linear xfade ladder.
+    Returns a list of (tail, body), tail is None for the first chunk.
+    """
+    res = []
+    for k, (start, end) in enumerate(zip(starts, ends)):
+        start = round(start, 1)
+        end = round(end, 1)
+        tail = None
+        if k > 0:
+            prev_end = round(ends[k - 1], 1)
+            tail = (round(prev_end - transition_duration, 1), prev_end)
+        body_end = end if k == len(starts) - 1 else round(end - transition_duration, 1)
+        res.append((tail, (start, body_end)))
+    return res
+
+
+def escape_concat_path(path: str) -> str:
+    return os.path.abspath(path).replace("'", "'\\''")
 
 
 class VideoCutter:
@@ -13,90 +142,308 @@ class VideoCutter:
         input_video_path: str,
         output_video_path: str,
         transition_video_path: str,
-        speech_segments: list,
+        speech_segments,
+        render_mode: str = RENDER_MODE,
+        keyframe_snap_tolerance_sec: float = KEYFRAME_SNAP_TOLERANCE_SEC,
+        render_workers: int = RENDER_WORKERS,
+        ffmpeg_threads: int = FFMPEG_THREADS,
     ) -> None:
         self.__input_video_path = input_video_path
         self.__output_video_path = output_video_path
         self.__transition_video_path = transition_video_path
+        # a list of speech segments or a SegmentTable
         self.__speech_segments = speech_segments
+        self.__render_mode = render_mode
+        self.__keyframe_snap_tolerance_sec = keyframe_snap_tolerance_sec
+        self.__render_workers = render_workers
+        self.__ffmpeg_threads = ffmpeg_threads
 
     def cut(self) -> None:
-        self.__cut_ffmpeg()
+        if self.__render_mode == RENDER_MODE_COPY:
+            self.__cut_copy()
+        elif self.__render_mode == RENDER_MODE_PARALLEL:
+            self.__cut_parallel()
+        else:
+            self.__cut_ffmpeg()
 
     def __cut_ffmpeg(self):
-        TRANSITION_EFFECT = 'fade'
-        TRANSITION_DURATION = 2
-
         try:
             vw_start_time = time.time()
             logger.debug(f'START VIDEO WRITING: {vw_start_time} (timestamp)')
+            logger.debug(f'RENDER MODE: {self.__render_mode}')
+
+            input_args, filter_graph, video_slug, audio_slug = self.build_filter_graph()
+
+            output_dir = os.path.dirname(os.path.abspath(self.__output_video_path))
+            with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+                # the graph goes to a file, hundreds of segments don't fit a command line
+                filter_script_path = os.path.join(tmp_dir, 'filter_complex.txt')
+                with open(filter_script_path, 'w') as f:
+                    f.write(filter_graph)
+
+                cmd = ['ffmpeg'] + input_args
+                cmd += ['-filter_complex_script', filter_script_path]
+
+                # Add output options
+                cmd += ['-map', f'[{video_slug}]', '-map', f'[{audio_slug}]']
+                cmd += ['-vcodec', 'libx264', '-acodec', 'aac', '-preset', 'ultrafast']
+                cmd += ['-pix_fmt', 'yuv420p']
+                cmd += ['-r', str(FPS)]  # Ensure output frame rate
+                cmd += ['-f', 'mp4', '-y', self.__output_video_path]
 
-            # Initialize filter complex
-            cmd = f'ffmpeg -i {self.__input_video_path} -filter_complex "'
-
-            # First pass: normalize all segments to same fps
-            k = 0
-            for segment in self.__speech_segments:
-                if not segment.is_relevant:
-                    continue
-                logger.debug(f'SEGMENT {k}: {segment.start_time_sec} - {segment.end_time_sec}')
-                start = round(segment.start_time_sec, 1)
-                end = round(segment.end_time_sec, 1)
-                # Add fps filter before trim and ensure constant frame rate
-                cmd += f'[0:v]fps=25,trim={start}:{end},setpts=PTS-STARTPTS[vtemp{k}];'
-                cmd += f'[vtemp{k}]format=yuv420p[v{k}];'
-                cmd += f'[0:a]atrim={start}:{end},asetpts=PTS-STARTPTS[a{k}];'
-                k += 1
-
-            # Second pass: apply transitions
-            k = 0
-            total_duration = 0
-            last_video_slug = 'v0'
-            last_audio_slug = 'a0'
-            
-            for segment in self.__speech_segments[:-1]:
-                if not segment.is_relevant:
-                    continue
-                k += 1
-                start = round(segment.start_time_sec, 1)
-                end = round(segment.end_time_sec, 1)
-                segment_duration = round(end - start - TRANSITION_DURATION, 1)
-                total_duration = round(total_duration + segment_duration, 1)
-                new_video_slug = f'vc{k}'
-                new_audio_slug = f'ac{k}'
-                
-                # Ensure constant frame rate for xfade inputs
-                cmd += f'[{last_video_slug}][v{k}]'
-                cmd += f'xfade=transition={TRANSITION_EFFECT}:duration={TRANSITION_DURATION}:offset={total_duration}'
-                cmd += f'[{new_video_slug}];'
-                
-                cmd += f'[{last_audio_slug}][a{k}]'
-                cmd += f'acrossfade=d={TRANSITION_DURATION}:c1=tri:c2=tri'
-                cmd += f'[{new_audio_slug}];'
-                
-                last_video_slug = new_video_slug
-                last_audio_slug = new_audio_slug
-
-            cmd = cmd[:-1] + '"'
-
-            # Add output options
-            cmd += f' -map "[{last_video_slug}]" -map "[{last_audio_slug}]"'
-            cmd += f' -vcodec libx264 -acodec aac -preset ultrafast'
-            cmd += f' -pix_fmt yuv420p'
-            cmd += f' -r 25'  # Ensure output frame rate
-            cmd += f' -f mp4 -y {self.__output_video_path}'
-
-            logger.debug(f'RUNNING COMMAND: {cmd}')
-            subprocess.run(cmd, shell=True, check=True)  # Added check=True to raise on error
+                self.__run_ffmpeg(cmd)
             logger.debug(f'TIME TAKEN ON VIDEO WRITING: {time.time() - vw_start_time} (seconds)')
 
-        except subprocess.CalledProcessError as e:
-            logger.error(f'FFMPEG ERROR:\nCommand: {e.cmd}\nOutput: {e.output}\nError: {e.stderr}')
+        except subprocess.CalledProcessError:
             raise
         except Exception as e:
             logger.error(f'PROBLEM WITH VIDEO WRITING:\n{traceback.format_exc()}')
             raise
-        
+
+    def build_filter_graph(self) -> tuple:
+        """Returns ffmpeg input args, the filter graph and its output video and audio labels."""
+        starts, ends = self.__get_relevant_intervals()
+        for k, (start, end) in enumerate(zip(starts, ends)):
+            logger.debug(f'SEGMENT {k}: {start} - {end}')
+
+        # First pass: normalize all segments to same fps
+        if self.__render_mode == RENDER_MODE_SEEK:
+            input_args, filters = self.__build_seek_segments(starts, ends)
+        else:
+            input_args, filters = self.__build_trim_segments(starts, ends)
+
+        # Second pass: apply transitions
+        video_slug, audio_slug = self.__build_transitions(starts, ends, filters)
+
+        return input_args, ';'.join(filters), video_slug, audio_slug
+
+    def __cut_copy(self):
+        vw_start_time = time.time()
+        logger.debug(f'START VIDEO WRITING: {vw_start_time} (timestamp)')
+        logger.debug(f'RENDER MODE: {self.__render_mode}')
+
+        streams = probe_streams(self.__input_video_path)
+        keyframes = probe_keyframes(self.__input_video_path)
+        starts, ends = self.__get_relevant_intervals()
+        parts = plan_stream_copy_parts(
+            starts, ends, keyframes, streams['duration'], self.__keyframe_snap_tolerance_sec
+        )
+        encoded_parts = [part for part in parts if part[0] == PART_ENCODE]
+        logger.debug(
+            f'STREAM COPY: {len(parts) - len(encoded_parts)} copied parts, {len(encoded_parts)} re-encoded parts'
+        )
+
+        # re-encoded GOPs are stream-copied next to the source, so the codecs must match
+        video = streams['video'] or {}
+        audio = streams['audio'] or {}
+        if encoded_parts and (
+            video.get('codec_name') != 'h264'
+            or video.get('profile') not in X264_PROFILES
+            or audio.get('codec_name') not in (None, 'aac')
+        ):
+            logger.warning(
+                f"copy render mode can't match codecs {video.get('codec_name')} ({video.get('profile')})/"
+                f"{audio.get('codec_name')}, falling back to {RENDER_MODE_SEEK}"
+            )
+            self.__cut_seek()
+            return
+
+        output_dir = os.path.dirname(os.path.abspath(self.__output_video_path))
+        with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+            concat_list = ''
+            mismatches = []
+            for i, (part_type, start, end) in enumerate(parts):
+                if part_type == PART_COPY:
+                    concat_list += f"file '{escape_concat_path(self.__input_video_path)}'\n"
+                    concat_list += f'inpoint {start}\noutpoint {end}\n'
+                else:
+                    part_path = os.path.join(tmp_dir, f'part_{i}.mp4')
+                    self.__encode_part(start, end, part_path, video, audio)
+                    mismatches += get_stream_mismatches(streams, probe_streams(part_path))
+                    concat_list += f"file '{escape_concat_path(part_path)}'\n"
+
+            # a concat of streams with other parameters plays broken, it is not written
+            if len(mismatches) == 0:
+                concat_list_path = os.path.join(tmp_dir, 'concat.txt')
+                with open(concat_list_path, 'w') as f:
+                    f.write(concat_list)
+
+                self.__run_ffmpeg([
+                    'ffmpeg', '-f', 'concat', '-safe', '0', '-i', concat_list_path,
+                    '-c', 'copy', '-movflags', '+faststart',
+                    '-f', 'mp4', '-y', self.__output_video_path,
+                ])
+
+        if len(mismatches) > 0:
+            logger.warning(
+                f"re-encoded parts don't match the source ({'; '.join(sorted(set(mismatches)))}), "
+                f"falling back to {RENDER_MODE_SEEK}"
+            )
+            self.__cut_seek()
+            return
+        logger.debug(f'TIME TAKEN ON VIDEO WRITING: {time.time() - vw_start_time} (seconds)')
+
+    def __cut_seek(self):
+        self.__render_mode = RENDER_MODE_SEEK
+        self.__cut_ffmpeg()
+
+    def __cut_parallel(self):
+        vw_start_time = time.time()
+        logger.debug(f'START VIDEO WRITING: {vw_start_time} (timestamp)')
+        logger.debug(
+            f'RENDER MODE: {self.__render_mode}, workers: {self.__render_workers}, ffmpeg threads: {self.__ffmpeg_threads}'
+        )
+
+        starts, ends = self.__get_relevant_intervals()
+        chunks = plan_parallel_chunks(starts, ends, TRANSITION_DURATION)
+
+        output_dir = os.path.dirname(os.path.abspath(self.__output_video_path))
+        with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+            chunk_paths = [os.path.join(tmp_dir, f'chunk_{k}.mp4') for k in range(len(chunks))]
+            with ThreadPoolExecutor(max_workers=self.__render_workers) as executor:
+                # every task waits on its own ffmpeg process, list() re-raises the first error
+                list(executor.map(self.__encode_chunk, chunks, chunk_paths))
+
+            concat_list_path = os.path.join(tmp_dir, 'concat.txt')
+            with open(concat_list_path, 'w') as f:
+                for chunk_path in chunk_paths:
+                    f.write(f"file '{escape_concat_path(chunk_path)}'\n")
+
+            self.__run_ffmpeg([
+                'ffmpeg', '-f', 'concat', '-safe', '0', '-i', concat_list_path,
+                '-c', 'copy', '-movflags', '+faststart',
+                '-f', 'mp4', '-y', self.__output_video_path,
+            ])
+        logger.debug(f'TIME TAKEN ON VIDEO WRITING: {time.time() - vw_start_time} (seconds)')
+
+    def __encode_chunk(self, chunk: tuple, chunk_path: str):
+        tail, body = chunk
+        intervals = [body] if tail is None else [tail, body]
+
+        cmd = ['ffmpeg']
+        filters = ''
+        for k, (start, end) in enumerate(intervals):
+            cmd += ['-ss', str(start), '-to', str(end), '-i', self.__input_video_path]
+            filters += f'[{k}:v]setpts=PTS-STARTPTS,fps={FPS},format=yuv420p[v{k}];'
+            filters += f'[{k}:a]asetpts=PTS-STARTPTS[a{k}];'
+
+        last_video_slug = 'v0'
+        last_audio_slug = 'a0'
+        if tail is not None:
+            filters += f'[v0][v1]xfade=transition={TRANSITION_EFFECT}:duration={TRANSITION_DURATION}:offset=0[vc];'
+            filters += f'[a0][a1]acrossfade=d={TRANSITION_DURATION}:c1=tri:c2=tri[ac];'
+            last_video_slug = 'vc'
+            last_audio_slug = 'ac'
+
+        cmd += ['-filter_complex', filters[:-1]]
+        cmd += ['-map', f'[{last_video_slug}]', '-map', f'[{last_audio_slug}]']
+        cmd += ['-vcodec', 'libx264', '-acodec', 'aac', '-preset', 'ultrafast']
+        cmd += ['-pix_fmt', 'yuv420p', '-r', str(FPS)]
+        cmd += ['-threads', str(self.__ffmpeg_threads)]
+        cmd += ['-f', 'mp4', '-y', chunk_path]
+        self.__run_ffmpeg(cmd)
+
+    def __encode_part(self, start: float, end: float, part_path: str, video: dict, audio: dict):
+        cmd = ['ffmpeg', '-ss', str(start), '-to', str(end), '-i', self.__input_video_path]
+        profile = X264_PROFILES[video['profile']]
+        # ultrafast turns CABAC and 8x8 transforms off, x264 then signals Constrained Baseline
+        # whatever -profile:v asks for
+        preset = 'ultrafast' if profile == 'baseline' else 'superfast'
+        cmd += ['-c:v', 'libx264', '-preset', preset, '-profile:v', profile]
+        cmd += ['-pix_fmt', video.get('pix_fmt', 'yuv420p')]
+        if video.get('r_frame_rate'):
+            cmd += ['-r', video['r_frame_rate']]
+        if video.get('time_base'):
+            # e.g. 1/12800, the mp4 track timescale
+            cmd += ['-video_track_timescale', video['time_base'].split('/')[-1]]
+        if audio:
+            cmd += ['-c:a', 'aac', '-ar', str(audio['sample_rate']), '-ac', str(audio['channels'])]
+        cmd += ['-f', 'mp4', '-y', part_path]
+        self.__run_ffmpeg(cmd)
+
+    def __run_ffmpeg(self, cmd: list):
+        logger.debug(f'RUNNING COMMAND: {" ".join(cmd)}')
+        try:
+            subprocess.run(cmd, check=True)
+        except subprocess.CalledProcessError as e:
+            logger.error(f'FFMPEG ERROR:\nCommand: {e.cmd}\nOutput: {e.output}\nError: {e.stderr}')
+            raise
+
+    def __build_trim_segments(self, starts: list, ends: list) -> tuple:
+        # every segment is a branch over the whole decoded input
+        input_args = ['-i', self.__input_video_path]
+        filters = []
+        for k, (start, end) in enumerate(zip(starts, ends)):
+            start = round(start, 1)
+            end = round(end, 1)
+            # Add fps filter before trim and ensure constant frame rate
+            filters.append(f'[0:v]fps={FPS},trim={start}:{end},setpts=PTS-STARTPTS[vtemp{k}]')
+            filters.append(f'[vtemp{k}]format=yuv420p[v{k}]')
+            filters.append(f'[0:a]atrim={start}:{end},asetpts=PTS-STARTPTS[a{k}]')
+        return input_args, filters
+
+    def __build_seek_segments(self, starts: list, ends: list) -> tuple:
+        # every segment is its own input, ffmpeg seeks to it and decodes only its frames
+        input_args = []
+        filters = []
+        for k, (start, end) in enumerate(zip(starts, ends)):
+            start = round(start, 1)
+            end = round(end, 1)
+            input_args += ['-ss', str(start), '-to', str(end), '-i', self.__input_video_path]
+            filters.append(f'[{k}:v]setpts=PTS-STARTPTS,fps={FPS},format=yuv420p[v{k}]')
+            filters.append(f'[{k}:a]asetpts=PTS-STARTPTS[a{k}]')
+        return input_args, filters
+
+    def __build_transitions(self, starts: list, ends: list, filters: list) -> tuple:
+        # transitions form a balanced tree, so the graph depth is log2 of the segments count
+        if len(starts) == 1:
+            # a single segment has nothing to transition to
+            return 'v0', 'a0'
+        durations = [round(round(end, 1) - round(start, 1), 1) for start, end in zip(starts, ends)]
+        transitions_count = 0
+
+        def join(first: int, last: int) -> tuple:
+            # returns video slug, audio slug and duration of segments first..last joined
+            if first == last:
+                return f'v{first}', f'a{first}', durations[first]
+
+            middle = (first + last) // 2
+            left_video, left_audio, left_duration = join(first, middle)
+            right_video, right_audio, right_duration = join(middle + 1, last)
+
+            nonlocal transitions_count
+            transitions_count += 1
+            new_video_slug = f'vc{transitions_count}'
+            new_audio_slug = f'ac{transitions_count}'
+            # the transition starts TRANSITION_DURATION before the end of the left part
+            offset = round(left_duration - TRANSITION_DURATION, 1)
+
+            # Ensure constant frame rate for xfade inputs
+            filters.append(
+                f'[{left_video}][{right_video}]'
+                f'xfade=transition={TRANSITION_EFFECT}:duration={TRANSITION_DURATION}:offset={offset}'
+                f'[{new_video_slug}]'
+            )
+            filters.append(
+                f'[{left_audio}][{right_audio}]'
+                f'acrossfade=d={TRANSITION_DURATION}:c1=tri:c2=tri'
+                f'[{new_audio_slug}]'
+            )
+            duration = round(left_duration + right_duration - TRANSITION_DURATION, 1)
+            return new_video_slug, new_audio_slug, duration
+
+        video_slug, audio_slug, _ = join(0, len(starts) - 1)
+        return video_slug, audio_slug
+
+    def __get_relevant_intervals(self) -> tuple:
+        segment_table = self.__speech_segments
+        if not isinstance(segment_table, SegmentTable):
+            segment_table = SegmentTable.from_speech_segments(segment_table)
+        starts, ends = segment_table.get_relevant_intervals()
+        if len(starts) == 0:
+            raise Exception('no relevant speech segments, nothing to render')
+        return starts.tolist(), ends.tolist()
+
     def __cut_moviepy(self):
         pass
         # OLD APPROACH
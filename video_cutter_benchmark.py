@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import tempfile
+import subprocess
+from speech_segment import SpeechSegment
+from video_cutter import (
+    VideoCutter,
+    RENDER_MODE_TRIM,
+    RENDER_MODE_SEEK,
+    RENDER_MODE_PARALLEL,
+)
+
+# python video_cutter_benchmark.py [video_duration_sec] [segments_count]
+# python video_cutter_benchmark.py graph [segments_count ...]
+VIDEO_DURATION_SEC = 600
+SEGMENTS_COUNT = 10
+SEGMENT_DURATION_SEC = 15
+GRAPH_SEGMENTS_COUNTS = [4, 16, 64, 256]
+GRAPH_SEGMENT_STEP_SEC = 6
+GRAPH_SEGMENT_DURATION_SEC = 5
+
+
+def generate_test_video(video_path: str, duration_sec: int) -> None:
+    # synthetic lecture: test pattern with a sine tone, 2 sec GOP
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size=640x360:rate=25:duration={duration_sec}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={duration_sec}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '50',
+        '-c:a', 'aac', '-shortest', video_path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def generate_speech_segments(
+    duration_sec: int, segments_count: int, segment_duration_sec: float = SEGMENT_DURATION_SEC
+) -> list:
+    # relevant segments spread evenly over the video with off-topic gaps between them
+    res = []
+    step = duration_sec / segments_count
+    for i in range(segments_count):
+        segment = SpeechSegment()
+        segment.start_time_sec = i * step
+        segment.end_time_sec = min(i * step + segment_duration_sec, duration_sec)
+        segment.text = f"segment {i}"
+        segment.is_relevant = True
+        res.append(segment)
+    return res
+
+
+def benchmark(render_modes: list, duration_sec: int, segments_count: int) -> dict:
+    res = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_video_path = os.path.join(tmp_dir, 'input.mp4')
+        generate_test_video(input_video_path, duration_sec)
+        speech_segments = generate_speech_segments(duration_sec, segments_count)
+
+        for render_mode in render_modes:
+            vc = VideoCutter(
+                input_video_path=input_video_path,
+                output_video_path=os.path.join(tmp_dir, f'output_{render_mode}.mp4'),
+                transition_video_path=None,
+                speech_segments=speech_segments,
+                render_mode=render_mode,
+            )
+            start_time = time.time()
+            try:
+                vc.cut()
+            except subprocess.CalledProcessError:
+                # the original trim graph fails on ffmpeg 7, setpts there drops the frame rate xfade needs
+                res[render_mode] = None
+                continue
+            res[render_mode] = time.time() - start_time
+    return res
+
+
+def benchmark_graph(render_modes: list, segments_counts: list) -> list:
+    # filter graph build time and ffmpeg startup (graph setup + first frame) per segments count
+    res = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_video_path = os.path.join(tmp_dir, 'input.mp4')
+        duration_sec = max(segments_counts) * GRAPH_SEGMENT_STEP_SEC
+        generate_test_video(input_video_path, duration_sec)
+
+        for segments_count in segments_counts:
+            speech_segments = generate_speech_segments(
+                segments_count * GRAPH_SEGMENT_STEP_SEC, segments_count, GRAPH_SEGMENT_DURATION_SEC
+            )
+            for render_mode in render_modes:
+                vc = VideoCutter(
+                    input_video_path=input_video_path,
+                    output_video_path=os.path.join(tmp_dir, 'output.mp4'),
+                    transition_video_path=None,
+                    speech_segments=speech_segments,
+                    render_mode=render_mode,
+                )
+                start_time = time.time()
+                input_args, filter_graph, video_slug, audio_slug = vc.build_filter_graph()
+                build_sec = time.time() - start_time
+
+                filter_script_path = os.path.join(tmp_dir, 'filter_complex.txt')
+                with open(filter_script_path, 'w') as f:
+                    f.write(filter_graph)
+                cmd = ['ffmpeg', '-loglevel', 'error'] + input_args
+                cmd += ['-filter_complex_script', filter_script_path]
+                cmd += ['-map', f'[{video_slug}]', '-map', f'[{audio_slug}]']
+                cmd += ['-frames:v', '1', '-f', 'null', '-']
+                start_time = time.time()
+                startup_sec = None
+                if subprocess.run(cmd).returncode == 0:
+                    startup_sec = time.time() - start_time
+
+                res.append((segments_count, render_mode, build_sec, startup_sec))
+    return res
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'graph':
+        segments_counts = [int(arg) for arg in sys.argv[2:]] or GRAPH_SEGMENTS_COUNTS
+        for segments_count, render_mode, build_sec, startup_sec in benchmark_graph(
+            [RENDER_MODE_TRIM, RENDER_MODE_SEEK], segments_counts
+        ):
+            startup = 'failed' if startup_sec is None else f'{startup_sec:.2f} sec'
+            print(
+                f'{segments_count} segments, {render_mode}: graph build {build_sec * 1000:.1f} ms, '
+                f'ffmpeg startup {startup}'
+            )
+        sys.exit(0)
+
+    duration_sec = int(sys.argv[1]) if len(sys.argv) > 1 else VIDEO_DURATION_SEC
+    segments_count = int(sys.argv[2]) if len(sys.argv) > 2 else SEGMENTS_COUNT
+
+    timings = benchmark(
+        [RENDER_MODE_TRIM, RENDER_MODE_SEEK, RENDER_MODE_PARALLEL], duration_sec, segments_count
+    )
+    for render_mode, seconds in timings.items():
+        if seconds is None:
+            print(f'{render_mode}: failed')
+        elif timings[RENDER_MODE_TRIM] is None:
+            print(f'{render_mode}: {seconds:.2f} sec')
+        else:
+            speedup = timings[RENDER_MODE_TRIM] / seconds
+            print(f'{render_mode}: {seconds:.2f} sec, speedup vs {RENDER_MODE_TRIM}: {speedup:.1f}x')
@@ -6,6 +6,7 @@ import logging
 from uuid import uuid4
 from datetime import datetime
 from process_video_service import ProcessVideoService
+from model_registry import model_registry
 # from logging_service import logger
 # Set up logging
 logging.basicConfig(
@@ -16,6 +17,9 @@ logger = logging.getLogger(__name__)
 
 MEDIA_FOLDER = "media"
 
+# loads only the models listed in MODEL_WARMUP, nothing by default
+model_registry.warm_up()
+
 def process_video_background(session_id: str, data):
     # Creating session folder locally
     session_folder_path = f"{MEDIA_FOLDER}/{session_id}"
@@ -59,6 +63,7 @@ def process_video_background(session_id: str, data):
         )
         pvs.process()
         logger.info("processing completed")
+        logger.info(f"models: {model_registry.stats()}")
 
         output_filenames = os.listdir(output_path)
         for output_filename in output_filenames:
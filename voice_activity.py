@@ -0,0 +1,147 @@
+import os
+import numpy as np
+from bisect import bisect_right
+from audio_processing import SAMPLE_RATE
+
+# off by default, VAD_FILTER=1 cuts long pauses out before transcription
+VAD_FILTER = os.getenv("VAD_FILTER", "0") == "1"
+VAD_FRAME_SEC = 0.03
+# energy threshold = noise floor (low percentile of frame energies) * factor
+VAD_NOISE_PERCENTILE = 10
+VAD_ENERGY_FACTOR = 3.0
+VAD_MIN_ENERGY = 1e-3
+# frames louder than this (about -50 dBFS) are speech whatever the noise floor, so
+# quiet speech is kept when the low percentile is speech too, e.g. a continuous lecture
+VAD_MAX_ENERGY_THRESHOLD = 3e-3
+# cutting less than this share of the audio is not worth the risk of losing quiet speech
+VAD_MIN_SILENCE_FRACTION = 0.05
+# quiet frames with many zero crossings are hiss, not voiced speech
+VAD_MAX_ZERO_CROSSING_RATE = 0.25
+# only pauses longer than this are cut out, speech is padded on both sides
+VAD_MIN_SILENCE_SEC = 2.0
+VAD_SPEECH_PAD_SEC = 0.3
+VAD_MIN_SPEECH_SEC = 0.25
+# silence kept between joined regions so whisper still hears a pause there
+VAD_JOIN_GAP_SEC = 0.5
+
+
+def get_vad_params() -> dict:
+    """Parameters that change the detected regions, e.g. for cache keys."""
+    return {
+        "frame_sec": VAD_FRAME_SEC,
+        "noise_percentile": VAD_NOISE_PERCENTILE,
+        "energy_factor": VAD_ENERGY_FACTOR,
+        "min_energy": VAD_MIN_ENERGY,
+        "max_energy_threshold": VAD_MAX_ENERGY_THRESHOLD,
+        "min_silence_fraction": VAD_MIN_SILENCE_FRACTION,
+        "max_zero_crossing_rate": VAD_MAX_ZERO_CROSSING_RATE,
+        "min_silence_sec": VAD_MIN_SILENCE_SEC,
+        "speech_pad_sec": VAD_SPEECH_PAD_SEC,
+        "min_speech_sec": VAD_MIN_SPEECH_SEC,
+        "join_gap_sec": VAD_JOIN_GAP_SEC,
+    }
+
+
+def detect_speech_regions(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> list:
+    """(start, end) sample ranges that contain speech, by frame energy and zero-crossing rate."""
+    frame_size = int(VAD_FRAME_SEC * sample_rate)
+    frames_count = len(audio) // frame_size
+    if frames_count == 0:
+        return [(0, len(audio))] if len(audio) else []
+
+    frames = np.asarray(audio[: frames_count * frame_size], dtype=np.float32)
+    frames = frames.reshape(frames_count, frame_size)
+    energy = np.sqrt(np.mean(frames ** 2, axis=1))
+    signs = np.signbit(frames)
+    zero_crossing_rate = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_size
+
+    threshold = min(
+        max(np.percentile(energy, VAD_NOISE_PERCENTILE) * VAD_ENERGY_FACTOR, VAD_MIN_ENERGY),
+        VAD_MAX_ENERGY_THRESHOLD,
+    )
+    is_speech = (energy > threshold) & (
+        (zero_crossing_rate < VAD_MAX_ZERO_CROSSING_RATE) | (energy > threshold * 2)
+    )
+
+    # run boundaries of speech frames
+    edges = np.diff(np.concatenate(([0], is_speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    pad_frames = int(VAD_SPEECH_PAD_SEC / VAD_FRAME_SEC)
+    min_silence_frames = int(VAD_MIN_SILENCE_SEC / VAD_FRAME_SEC)
+    min_speech_frames = int(VAD_MIN_SPEECH_SEC / VAD_FRAME_SEC)
+    res = []
+    for start, end in zip(starts, ends):
+        if end - start < min_speech_frames:
+            continue
+        start = max(start - pad_frames, 0)
+        end = min(end + pad_frames, frames_count)
+        if res and start - res[-1][1] < min_silence_frames:
+            res[-1][1] = end
+        else:
+            res.append([start, end])
+
+    res = [(int(start) * frame_size, int(end) * frame_size) for start, end in res]
+    # the tail shorter than a frame belongs to the last region if it reaches it
+    if res and res[-1][1] == frames_count * frame_size:
+        res[-1] = (res[-1][0], len(audio))
+
+    speech_samples = sum(end - start for start, end in res)
+    if res and len(audio) - speech_samples < VAD_MIN_SILENCE_FRACTION * len(audio):
+        return [(0, len(audio))]
+    return res
+
+
+class SpeechTimeline:
+    """Joins speech regions into one compact audio and maps its timestamps back."""
+
+    def __init__(self, regions: list, total_samples: int, sample_rate: int = SAMPLE_RATE) -> None:
+        self.__regions = regions
+        self.__sample_rate = sample_rate
+        self.__total_samples = total_samples
+        gap = int(VAD_JOIN_GAP_SEC * sample_rate)
+        self.__compact_starts = []
+        compact_offset = 0
+        for start, end in regions:
+            self.__compact_starts.append(compact_offset / sample_rate)
+            compact_offset += end - start + gap
+        self.__gap = gap
+
+    @property
+    def skipped_sec(self) -> float:
+        speech_samples = sum(end - start for start, end in self.__regions)
+        return (self.__total_samples - speech_samples) / self.__sample_rate
+
+    def compact_audio(self, audio: np.ndarray) -> np.ndarray:
+        parts = []
+        silence = np.zeros(self.__gap, dtype=audio.dtype)
+        for start, end in self.__regions:
+            parts.append(audio[start:end])
+            parts.append(silence)
+        return np.concatenate(parts[:-1]) if parts else audio[:0]
+
+    def to_original_time(self, compact_time: float) -> float:
+        i = max(bisect_right(self.__compact_starts, compact_time) - 1, 0)
+        start, end = self.__regions[i]
+        # times in the joining gap stick to the end of the region before it
+        offset = min(max(compact_time - self.__compact_starts[i], 0), (end - start) / self.__sample_rate)
+        return start / self.__sample_rate + offset
+
+    def restore_timestamps(self, transcription: dict) -> dict:
+        """Copy of a whisper transcription of the compact audio on the original timeline."""
+        res = dict(transcription)
+        res["segments"] = []
+        for segment in transcription.get("segments", []):
+            segment = dict(segment)
+            segment["start"] = self.to_original_time(segment["start"])
+            segment["end"] = self.to_original_time(segment["end"])
+            words = []
+            for word in segment.get("words", []):
+                word = dict(word)
+                word["start"] = self.to_original_time(word["start"])
+                word["end"] = self.to_original_time(word["end"])
+                words.append(word)
+            segment["words"] = words
+            res["segments"].append(segment)
+        return res
@@ -1,6 +1,8 @@
 import json
 import string
 from speech_segment import SpeechSegment
+from json_stream_reader import JsonStreamReader
+from transcription_store import TranscriptionStore
 from logging_service import logger
 
 
@@ -19,12 +21,25 @@ def create_speech_segment(
 
 
 class WhisperSegmentsProcessor:
-    def __init__(self, segments=None, segments_json_path: str = None):
+    def __init__(
+        self,
+        segments=None,
+        segments_json_path: str = None,
+        streaming: bool = False,
+        segments_store_path: str = None,
+    ):
         # one of the parameters should be not None
+        self.__segments = None
+        self.__segments_json_path = segments_json_path
+        self.__streaming = streaming
+        self.__segments_store_path = segments_store_path
         if segments is not None:
             self.__segments = segments
+        elif segments_store_path is not None:
+            pass
         elif segments_json_path is not None:
-            self.__segments = self.__load_segments_from_json(segments_json_path)
+            if not streaming:
+                self.__segments = self.__load_segments_from_json(segments_json_path)
         else:
             raise Exception("one of the parameters should be not None")
 
@@ -38,16 +53,44 @@ class WhisperSegmentsProcessor:
             )
             raise e
 
+    def __iter_whisper_segments(self):
+        if self.__segments is not None:
+            yield from self.__segments["segments"]
+            return
+
+        if self.__segments_store_path is not None:
+            try:
+                store = TranscriptionStore(self.__segments_store_path)
+            except Exception as e:
+                logger.error(
+                    f"problem with loading transcription store: {self.__segments_store_path}\nerror: {e}"
+                )
+                raise e
+            yield from store.iter_segments()
+            return
+
+        # streaming mode: only one whisper segment is decoded at a time
+        try:
+            with open(self.__segments_json_path) as f:
+                yield from JsonStreamReader(f).iter_array("segments")
+        except Exception as e:
+            logger.error(
+                f"problem with streaming segments from json file: {self.__segments_json_path}\nerror: {e}"
+            )
+            raise e
+
     def get_speech_segments(self) -> list:
+        return list(self.iter_speech_segments())
+
+    def iter_speech_segments(self):
         start_time = None
         end_time = None
         text = None
-        res = []
 
-        for segment in self.__segments["segments"]:
+        for segment in self.__iter_whisper_segments():
             if segment["no_speech_prob"] > NO_SPEECH_PROB_THRESHOLD:
                 if start_time is not None:
-                    res.append(create_speech_segment(start_time, end_time, text))
+                    yield create_speech_segment(start_time, end_time, text)
                 start_time = None
                 end_time = None
                 text = None
@@ -61,7 +104,7 @@ class WhisperSegmentsProcessor:
                     text.strip()[-1] in string.punctuation
                     and text.strip()[-1] not in [",", ";"]
                 ):
-                    res.append(create_speech_segment(start_time, end_time, text))
+                    yield create_speech_segment(start_time, end_time, text)
                     start_time = word["start"]
                     end_time = word["end"]
                     text = word["word"]
@@ -69,6 +112,4 @@ class WhisperSegmentsProcessor:
                     end_time = word["end"]
                     text += word["word"]
         if start_time is not None:
-            res.append(create_speech_segment(start_time, end_time, text))
-        return res
-    
+            yield create_speech_segment(start_time, end_time, text)